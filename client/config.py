@@ -7,6 +7,22 @@
 # ==================== 服务器配置 ====================
 SERVER_URL = "http://your-server-ip:5000"
 UPDATE_INTERVAL = 1
+COMMAND_LONG_POLL = True        # 通过长轮询 /api/commands 即时接收控制命令
+COMMAND_POLL_TIMEOUT = 25       # 长轮询服务端最长等待时间(秒)
+HTTP_TIMEOUT = 5                # 请求读取超时(秒)，所有请求共用一个 keep-alive 连接池
+HTTP_CONNECT_TIMEOUT = 3        # 建立连接超时(秒)
+STATUS_UPLOAD_INTERVAL = 1      # 在线时状态上报间隔(秒)；大于 UPDATE_INTERVAL 时多次采样合并为一次批量上报
+SYNC_CHUNK_RECORDS = 20         # 离线运动记录分块同步：每块最多记录数
+SYNC_CHUNK_POINTS = 20000       # 每块最多逐点数据点数（series + gnss_track）
+SYNC_TIME_BUDGET = 10           # 单次同步最长耗时(秒)，剩余记录下次继续
+PENDING_FSYNC = "always"        # 待同步记录日志落盘策略: always 每条落盘 / rotate 切换段时落盘 / never 交给系统
+PENDING_SEGMENT_BYTES = 1024 * 1024  # 待同步记录日志单段大小上限(字节)
+CACHE_SAVE_INTERVAL = 30        # 离线每日统计缓存（cache.json）最短落盘间隔(秒)，退出时刷新
+SPORT_RECORD_BINARY = True      # 运动记录（series / gnss_track）使用列式二进制编码上传
+STATUS_DELTA = True             # 服务端支持时只上报变化的字段
+STATUS_FULL_EVERY = 60          # 增量上报时每多少次强制发送一次完整快照
+STATUS_BATCH_MAX = 600          # 单次 /api/status/batch 最多上传的状态快照数
+STATUS_BACKLOG_MAX = 3600       # 离线时最多缓存的状态快照数，超出丢弃最旧的
 
 # ==================== 日志配置 ====================
 LOG_CONFIG = {
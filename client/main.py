@@ -22,7 +22,6 @@ import threading
 import math
 import signal
 import sys
-import requests
 import traceback
 from collections import deque
 from datetime import datetime, timedelta
@@ -30,7 +29,7 @@ from statistics import median
 
 # 导入日志模块
 from utils.logger import get_logger
-from services import GNSSManager, GNSS_AVAILABLE, OfflineManager
+from services import GNSSManager, GNSS_AVAILABLE, HttpClient, OfflineManager, StatusDeltaEncoder
 from ui import RotatedMessageScroller, create_ui_elements, hide_all_ui as hide_ui_elements, update_ui_mode as apply_ui_mode
 logger = get_logger('main')
 
@@ -74,6 +73,7 @@ try:
         StepDetector,
         PostureDetector,
         FallDetector,
+        SensorDispatcher,
         start_sampling,
         stop_sampling,
         get_sampling_stats,
@@ -87,6 +87,8 @@ except ImportError as e:
 
 # 高频采样器实例
 sampler = None
+# 采样数据分发器：每个采样点只读取一次，分发给步数/跌倒/姿态/姿态角检测
+sensor_dispatcher = None
 
 # 初始化加速度传感器
 if USE_SENSORS_MODULE and sensors_module_available:
@@ -96,7 +98,8 @@ if USE_SENSORS_MODULE and sensors_module_available:
             logger.info("ICM20689初始化成功 (50Hz)")
 
             # 创建检测器实例（使用config中的参数）
-            step_detector = StepDetector(config.STEP_CONFIG)
+            # 调试模式下为每个样本生成完整检测记录
+            step_detector = StepDetector(config.STEP_CONFIG, detailed_records=config.DEBUG_ENABLED)
             posture_detector = PostureDetector(config.POSTURE_CONFIG)
             fall_detector = FallDetector()
             attitude_calculator = AttitudeCalculator()
@@ -108,6 +111,13 @@ if USE_SENSORS_MODULE and sensors_module_available:
                 # 获取采样器实例
                 from sensors import get_sampler
                 sampler = get_sampler()
+                sensor_dispatcher = SensorDispatcher(
+                    sampler,
+                    step_detector=step_detector,
+                    fall_detector=fall_detector,
+                    posture_detector=posture_detector,
+                    attitude_calculator=attitude_calculator,
+                )
             else:
                 logger.warning("高频采样启动失败，将使用低频模式")
         else:
@@ -248,6 +258,10 @@ except ImportError:
 # ==================== 配置 ====================
 SERVER_URL = config.SERVER_URL
 UPDATE_INTERVAL = config.UPDATE_INTERVAL
+COMMAND_LONG_POLL = getattr(config, 'COMMAND_LONG_POLL', False)
+COMMAND_POLL_TIMEOUT = getattr(config, 'COMMAND_POLL_TIMEOUT', 25)
+STATUS_UPLOAD_INTERVAL = getattr(config, 'STATUS_UPLOAD_INTERVAL', UPDATE_INTERVAL)
+STATUS_BATCH_MAX = getattr(config, 'STATUS_BATCH_MAX', 600)
 DEBUG_ENABLED = config.DEBUG_ENABLED
 DEBUG_DIR = config.DEBUG_DIR
 
@@ -416,7 +430,11 @@ def restore_today_stats_from_server():
     global step_count, carbon_reduce_count, sport_time_today, activity_hours
 
     try:
-        response = requests.get(f"{SERVER_URL}/api/status", timeout=5)
+        response = http_client.get(
+            "/api/status",
+            params={"device_id": offline_manager.device_id},
+            timeout=5
+        )
         if response.status_code != 200:
             logger.info(f"服务端今日统计恢复跳过: HTTP {response.status_code}")
             return False
@@ -480,6 +498,10 @@ def exit_handler(signum=None, frame=None):
                 led_strip[i] = (0, 0, 0)
         if gui:
             gui.clear()
+        # 未上报的状态快照留待下次启动补传
+        offline_manager.save_status_backlog()
+        # 刷新延迟写的每日统计缓存，关闭待同步日志
+        offline_manager.close()
         debug_logger.stop()
         logger.info("清理完成，程序退出")
     except:
@@ -1018,6 +1040,12 @@ def update_led_by_temp_humi(temp, humi):
 
 
 # ==================== 运动检测功能 ====================
+def set_step_counting(enabled):
+    """打开/关闭分发器计步，只有运动模式把采样点送入步数检测器"""
+    if sensor_dispatcher is not None:
+        sensor_dispatcher.set_step_counting(enabled)
+
+
 def detect_step():
     """检测步数 - 处理采样器缓冲区中的所有数据"""
     global step_count, carbon_reduce_count
@@ -1030,32 +1058,11 @@ def detect_step():
     step_record = {}
 
     try:
-        # 如果使用高频采样器，处理所有缓冲的采样点
-        if sampler is not None:
+        # 如果使用高频采样器，由分发器处理所有新的采样点（线性加速度，50Hz采样 + 重力去除）
+        if sensor_dispatcher is not None:
             try:
-                from sensors import get_sample_buffer
-                buffer = get_sample_buffer()
-                if buffer:
-                    # 处理缓冲区中的所有采样点
-                    for sample in buffer:
-                        # 使用已经过重力去除的线性加速度（50Hz采样 + 重力去除）
-                        linear_x = sample.get('linear_x', 0)
-                        linear_y = sample.get('linear_y', 0)
-                        linear_z = sample.get('linear_z', 0)
-                        detected, step_record = step_detector.add_sample(
-                            linear_x,
-                            linear_y,
-                            linear_z,
-                            None,
-                            None,
-                            None,
-                            timestamp=sample.get('timestamp'),
-                            already_linear=True,
-                            raw_acc=(sample.get('ax', linear_x), sample.get('ay', linear_y), sample.get('az', linear_z))
-                        )
-
-                    # 清空缓冲区
-                    sampler.clear_buffer()
+                sensor_dispatcher.poll()
+                detected, step_record = sensor_dispatcher.take_step()
             except Exception as e:
                 # 回退到单点读取
                 ax, ay, az = read_acceleration()
@@ -1121,6 +1128,28 @@ def detect_step():
     return detected, step_record
 
 
+def read_detector_sample():
+    """
+    取得本轮检测使用的加速度 (ax, ay, az, acc_mag)
+
+    使用高频采样器时先由分发器处理所有新的采样点，返回最近一个点（检测器已逐点更新）；
+    否则直接读取一次，返回的 direct=True 表示调用方需要自行更新检测器。
+    返回: (ax, ay, az, acc_mag, direct)，无数据时返回 None
+    """
+    if sensor_dispatcher is not None:
+        sensor_dispatcher.poll()
+        latest = sensor_dispatcher.get_latest()
+        if latest is None:
+            return None
+        return latest + (False,)
+
+    ax, ay, az = read_acceleration()
+    if ax is None:
+        return None
+    import math
+    return ax, ay, az, math.sqrt(ax**2 + ay**2 + az**2), True
+
+
 def detect_posture():
     """检测姿态"""
     global current_posture
@@ -1129,14 +1158,16 @@ def detect_posture():
         return False, "unknown"
 
     try:
-        ax, ay, az = read_acceleration()
-        if ax is not None:
-            import math
-            acc_mag = math.sqrt(ax**2 + ay**2 + az**2)
+        sample = read_detector_sample()
+        if sample is not None:
+            ax, ay, az, acc_mag, direct = sample
             pitch, roll = posture_detector.get_attitude()
             motion_level = posture_detector.get_motion_level()
 
-            changed, new_posture = posture_detector.update(ax, ay, az)
+            if direct:
+                changed, new_posture = posture_detector.update(ax, ay, az)
+            else:
+                changed, new_posture = sensor_dispatcher.take_posture()
             if changed and new_posture != current_posture:
                 current_posture = new_posture
                 logger.info(f"姿态切换 → {current_posture}")
@@ -1165,16 +1196,20 @@ def detect_fall():
         return False
 
     try:
-        ax, ay, az = read_acceleration()
-        if ax is not None:
-            import math
-            acc_mag = math.sqrt(ax**2 + ay**2 + az**2)
-            pitch, roll = 0, 0
-            if attitude_calculator:
-                pitch, roll = attitude_calculator.update(ax, ay, az)
-
-            # 传递加速度数据给跌倒检测器（论文4方法）
-            is_fall, state = fall_detector.check(ax, ay, az)
+        sample = read_detector_sample()
+        if sample is not None:
+            ax, ay, az, acc_mag, direct = sample
+            if direct:
+                pitch, roll = 0, 0
+                if attitude_calculator:
+                    pitch, roll = attitude_calculator.update(ax, ay, az)
+
+                # 传递加速度数据给跌倒检测器（论文4方法）
+                is_fall, state = fall_detector.check(ax, ay, az)
+            else:
+                # 分发器已按采样率逐点更新姿态角和跌倒检测
+                pitch, roll = sensor_dispatcher.pitch, sensor_dispatcher.roll
+                is_fall, state = sensor_dispatcher.take_fall()
 
             # 记录跌倒调试数据
             debug_logger.log_fall(
@@ -1537,6 +1572,8 @@ def record_sport_session():
                 avg_stride_m = 0.0
 
             record = {
+                "record_id": offline_manager.new_record_id(),
+                "device_id": offline_manager.device_id,
                 "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "mode": "运动",
                 "duration": sport_duration,
@@ -1557,13 +1594,13 @@ def record_sport_session():
                 "gnss_satellite_max": sport_gnss_satellite_max,
             }
             try:
-                response = requests.post(f"{SERVER_URL}/api/sport_records",
-                            json=record, timeout=5)
-                if response.status_code == 200:
-                    logger.info(f"运动记录已上传: {record}")
+                response = offline_manager.post_records("/api/sport_records", record, timeout=5)
+                if response.status_code != 200:
+                    raise RuntimeError(f"HTTP {response.status_code}")
+                logger.info(f"运动记录已上传: {record}")
             except Exception as upload_err:
                 logger.warning(f"运动记录上传失败: {upload_err}")
-                # 上传失败，保存到本地pending_data
+                # 上传失败，追加到本地待同步日志
                 offline_manager.append_pending_record(record)
                 logger.info(f"运动记录已保存到本地: {record}")
         except Exception as e:
@@ -1764,7 +1801,8 @@ def handle_life_mode():
     except:
         pass
 
-    # 姿态检测
+    # 姿态检测（生活模式不计步）
+    set_step_counting(False)
     detect_posture()
     update_sitting_duration()
 
@@ -1868,6 +1906,7 @@ def handle_sport_mode():
     # 启动呼吸灯
     start_led_breathing()
 
+    set_step_counting(True)
     detect_movement()
 
     sat_count = 0
@@ -1901,36 +1940,15 @@ def handle_sport_mode():
         gps_text = gnss_manager.get_status_text(sat_count) if GNSS_AVAILABLE else "GPS:--"
         ui_elements['gps_status_text'].config(text=gps_text)
 
-    # 读取加速度数据用于调试记录
+    # 步数与跌倒检测（使用高频采样器时由分发器逐点处理，跌倒调试数据在 detect_fall 中记录）
     fall_detected_now = False
     try:
-        ax, ay, az = read_acceleration()
-        if ax is not None:
-            import math
-            acc_mag = math.sqrt(ax**2 + ay**2 + az**2)
-
-            # 步数检测
-            detected, step_record = detect_step()
-            if detected:
-                step_count = step_detector.get_step_count()
-                carbon_reduce_count = step_count * config.CARBON_PER_STEP
+        detected, step_record = detect_step()
+        if detected:
+            step_count = step_detector.get_step_count()
+            carbon_reduce_count = step_count * config.CARBON_PER_STEP
 
-            # 记录跌倒调试数据
-            is_fall, fall_state = False, {}
-            if fall_detector:
-                is_fall, fall_state = fall_detector.check(ax, ay, az)
-                fall_detected_now = is_fall
-            pitch, roll = 0, 0
-            if attitude_calculator:
-                pitch, roll = attitude_calculator.update(ax, ay, az)
-            debug_logger.log_fall(
-                ax, ay, az, acc_mag, pitch, roll,
-                fall_state.get('state', 'unknown') if fall_state else 'unknown',
-                fall_state.get('variance', 0) if fall_state else 0,
-                fall_state.get('peak_acc', 0) if fall_state else 0,
-                fall_state.get('min_acc', 0) if fall_state else 0,
-                fall_state.get('angle_change', 0) if fall_state else 0
-            )
+        fall_detected_now = detect_fall()
     except Exception as e:
         logger.error(f"运动模式数据记录错误: {e}")
 
@@ -2072,7 +2090,7 @@ def handle_sport_mode():
 
 def handle_meeting_mode():
     """会议模式"""
-    pass
+    set_step_counting(False)
 
 
 def emergency_countdown():
@@ -2080,6 +2098,7 @@ def emergency_countdown():
     global emergency_mode, fall_detected, touch_press_start
 
     logger.info("紧急倒计时开始...")
+    set_step_counting(False)
 
     for i in range(20, 0, -1):
         if not running:
@@ -2274,66 +2293,100 @@ def knob_thread():
         time.sleep(0.1)
 
 
+# ==================== 服务端连接 ====================
+# 通信线程、命令长轮询、运动记录上传和离线管理器共用一个长连接池
+http_client = HttpClient(
+    SERVER_URL,
+    timeout=getattr(config, 'HTTP_TIMEOUT', 5),
+    connect_timeout=getattr(config, 'HTTP_CONNECT_TIMEOUT', 3),
+)
+
+
 # ==================== 离线数据管理器 ====================
-offline_manager = OfflineManager(SERVER_URL)
+offline_manager = OfflineManager(
+    SERVER_URL,
+    max_status_backlog=getattr(config, 'STATUS_BACKLOG_MAX', 3600),
+    http_client=http_client,
+    binary_records=getattr(config, 'SPORT_RECORD_BINARY', True),
+    sync_chunk_records=getattr(config, 'SYNC_CHUNK_RECORDS', 20),
+    sync_chunk_points=getattr(config, 'SYNC_CHUNK_POINTS', 20000),
+    sync_time_budget=getattr(config, 'SYNC_TIME_BUDGET', 10),
+    pending_fsync=getattr(config, 'PENDING_FSYNC', 'always'),
+    pending_segment_bytes=getattr(config, 'PENDING_SEGMENT_BYTES', 1024 * 1024),
+    cache_save_interval=getattr(config, 'CACHE_SAVE_INTERVAL', 30),
+)
 
 
 # ==================== HTTP通信 ====================
+status_encoder = StatusDeltaEncoder(
+    full_every=getattr(config, 'STATUS_FULL_EVERY', 60),
+    enabled=getattr(config, 'STATUS_DELTA', True),
+)
+
+
+def build_status_snapshot():
+    """当前状态快照（带采样时间，可缓存后批量上报）"""
+    return {
+        "device_id": offline_manager.device_id,
+        "mode": current_mode,
+        "temperature": last_temp,
+        "humidity": last_humi,
+        "brightness": led_brightness,
+        "posture": current_posture,
+        "pace": 0,
+        "pace_str": current_pace_str if current_mode == MODE_SPORT else "--'--\"",
+        "step": step_count,
+        "carbon_reduce": carbon_reduce_count,
+        "emergency": emergency_mode,
+        "sport_time_today": sport_time_today,
+        "activity_hours": list(activity_hours),
+        "sitting_duration": sitting_duration,
+        "sport_duration": sport_duration,
+        "message_showing": message_showing,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
 def send_status():
-    """发送状态到服务器（带禁用重试机制）"""
-    global sitting_remind_duration
+    """
+    上报缓存的状态快照（共享长连接，适配器不自动重试，这里最多重试1次）
 
-    # 创建禁用重试的session（与try_connect一致）
-    try:
-        from requests.adapters import HTTPAdapter
-        from urllib3.util.retry import Retry
-        session = requests.Session()
-        retry = Retry(total=0, connect=0, read=0, redirect=0)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-    except:
-        session = requests
+    只有一条时走 /api/status；多条（上报间隔大于采样间隔、离线恢复）时
+    合并为一次 /api/status/batch，旧版服务端没有批量接口时只上报最新一条。
+    服务端支持时按增量编码，只发送变化的字段。
+    """
+    global sitting_remind_duration
 
     # 最多重试1次
     max_retries = 1
 
+    snapshots = offline_manager.peek_status_backlog(STATUS_BATCH_MAX)
+    if not snapshots:
+        snapshots = [build_status_snapshot()]
+        offline_manager.append_status(snapshots[0])
+
     for attempt in range(max_retries + 1):
         try:
-            data = {
-                "mode": current_mode,
-                "temperature": last_temp,
-                "humidity": last_humi,
-                "brightness": led_brightness,
-                "posture": current_posture,
-                "pace": 0,
-                "pace_str": current_pace_str if current_mode == MODE_SPORT else "--'--\"",
-                "step": step_count,
-                "carbon_reduce": carbon_reduce_count,
-                "emergency": emergency_mode,
-                "sport_time_today": sport_time_today,
-                "activity_hours": list(activity_hours),
-                "sitting_duration": sitting_duration,
-                "sport_duration": sport_duration,
-                "message_showing": message_showing,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-
-            if session == requests:
-                response = requests.post(
-                    f"{SERVER_URL}/api/status",
-                    json=data,
-                    timeout=5
-                )
+            if len(snapshots) == 1:
+                response = http_client.post("/api/status", json=status_encoder.encode(snapshots[0]))
             else:
-                response = session.post(
-                    f"{SERVER_URL}/api/status",
-                    json=data,
-                    timeout=5
+                response = http_client.post(
+                    "/api/status/batch",
+                    json={"device_id": offline_manager.device_id,
+                          "statuses": status_encoder.encode_batch(snapshots)},
+                    timeout=10
                 )
+                if response.status_code == 404:
+                    response = http_client.post("/api/status", json=snapshots[-1])
+
+            if response.status_code == 409:
+                # 服务端增量基线不一致（服务端重启、上次上报未收到），重试时发送完整快照
+                status_encoder.reset()
 
             if response.status_code == 200:
+                offline_manager.ack_status_backlog(len(snapshots))
                 result = response.json()
+                status_encoder.ack(result)
                 commands = result.get("commands", [])
                 sitting_remind_duration = result.get("sitting_remind_duration", 3600)
                 for cmd in commands:
@@ -2462,36 +2515,50 @@ def handle_command(cmd):
 
 
 def communication_thread():
-    """通信线程"""
+    """通信线程：每个采样周期缓存一条状态快照，按上报间隔批量发送"""
     offline_check_interval = 5  # 离线模式下每5秒检查一次
     last_offline_check = 0
+    last_upload = 0
 
     while running:
         try:
             # 如果当前离线，每5秒尝试连接
             if not offline_manager.is_online:
                 current_time = time.time()
+                connected = False
                 if current_time - last_offline_check >= offline_check_interval:
                     last_offline_check = current_time
                     # 尝试连接
-                    if offline_manager.try_connect():
+                    connected = offline_manager.try_connect()
+                    if connected:
                         # 连接成功，切换到在线模式
                         offline_manager.set_online_status(True)
                         # 一次性同步所有pending数据
                         offline_manager.sync_all_pending()
                         logger.info("离线模式：连接成功，已同步数据")
-                    else:
-                        # 连接失败，保持离线
-                        # 保存数据到本地
-                        offline_manager.update_cache({
-                            "step": step_count,
-                            "carbon_reduce": carbon_reduce_count,
-                            "sport_time_today": sport_time_today
-                        })
-                        time.sleep(UPDATE_INTERVAL)
-                        continue
-
-            # 在线模式：发送状态
+
+                if not connected:
+                    # 保持离线（未到检查时间或连接失败），不再尝试发送
+                    # 状态快照按 STATUS_SAVE_EVERY 条落盘，留待恢复后批量补传
+                    offline_manager.append_status(build_status_snapshot(), persist=True)
+                    offline_manager.update_cache({
+                        "step": step_count,
+                        "carbon_reduce": carbon_reduce_count,
+                        "sport_time_today": sport_time_today
+                    })
+                    time.sleep(UPDATE_INTERVAL)
+                    continue
+
+            # 在线模式：未到上报间隔时只缓存快照（紧急状态、积压过多时立即上报）
+            offline_manager.append_status(build_status_snapshot())
+            current_time = time.time()
+            if (current_time - last_upload < STATUS_UPLOAD_INTERVAL
+                    and not emergency_mode
+                    and len(offline_manager.status_backlog) < STATUS_BATCH_MAX):
+                time.sleep(UPDATE_INTERVAL)
+                continue
+            last_upload = current_time
+
             success = send_status()
             offline_manager.set_online_status(success)
 
@@ -2499,7 +2566,7 @@ def communication_thread():
                 # 成功后也尝试同步pending数据（可能有之前离线时的数据）
                 offline_manager.sync_all_pending()
             else:
-                # 发送失败，保存数据到本地
+                # 发送失败，快照留在内存积压中，离线期间按 STATUS_SAVE_EVERY 条落盘，退出时保存
                 offline_manager.update_cache({
                     "step": step_count,
                     "carbon_reduce": carbon_reduce_count,
@@ -2513,6 +2580,36 @@ def communication_thread():
         time.sleep(UPDATE_INTERVAL)
 
 
+def command_poll_thread():
+    """命令长轮询线程：服务端收到控制命令后立即返回，不必等下一次状态上报"""
+    global sitting_remind_duration
+
+    while running:
+        if not offline_manager.is_online:
+            time.sleep(UPDATE_INTERVAL)
+            continue
+
+        try:
+            response = http_client.get(
+                "/api/commands",
+                params={"timeout": COMMAND_POLL_TIMEOUT, "device_id": offline_manager.device_id},
+                timeout=COMMAND_POLL_TIMEOUT + 5
+            )
+            if response.status_code != 200:
+                # 旧版服务端没有该接口时降低频率，命令仍随状态上报下发
+                log_throttled('warning', 'command_poll_http', f"命令长轮询失败: HTTP {response.status_code}", interval=300)
+                time.sleep(30)
+                continue
+
+            result = response.json()
+            sitting_remind_duration = result.get("sitting_remind_duration", sitting_remind_duration)
+            for cmd in result.get("commands", []):
+                handle_command(cmd)
+        except Exception:
+            # 静默处理连接错误，离线状态由通信线程维护
+            time.sleep(UPDATE_INTERVAL)
+
+
 # ==================== GNSS速度管理器 ====================
 gnss_manager = GNSSManager(getattr(config, 'GNSS_CONFIG', None))
 
@@ -2646,6 +2743,8 @@ if __name__ == "__main__":
             threading.Thread(target=reset_daily_stats, daemon=True, name="reset"),
             threading.Thread(target=sport_idle_monitor, daemon=True, name="idle")
         ]
+        if COMMAND_LONG_POLL:
+            threads.append(threading.Thread(target=command_poll_thread, daemon=True, name="cmd-poll"))
 
         for t in threads:
             t.start()
@@ -10,6 +10,7 @@ from .attitude import AttitudeCalculator
 from .step_detector import StepDetector
 from .posture_detector import PostureDetector
 from .fall_detector import FallDetector
+from .sensor_dispatcher import SensorDispatcher
 from .high_freq_sampler import (
     HighFrequencySampler,
     get_sampler,
@@ -29,6 +30,7 @@ __all__ = [
     'StepDetector',
     'PostureDetector',
     'FallDetector',
+    'SensorDispatcher',
     'HighFrequencySampler',
     'get_sampler',
     'start_sampling',
@@ -17,6 +17,16 @@
 import math
 from collections import deque
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# check_batch 返回的状态编码
+BATCH_STATES = ("collecting", "normal", "suspected", "confirmed")
+
 
 class FallDetector:
     """基于三轴加速度跌倒检测方法的跌倒检测器"""
@@ -43,6 +53,17 @@ class FallDetector:
         # 数据缓冲 - 存储(ax, ay, az)元组
         self.acc_buffer = deque(maxlen=self.window_size)
 
+        # 相邻两帧的积分项（与 acc_buffer 中的相邻帧一一对应），及其滑动累加和
+        # 每个新样本加上最新一项、减去移出窗口的一项，SA/E/Dip 的计算与窗口大小无关
+        self._sa_terms = deque()
+        self._energy_terms = deque()
+        self._dip_terms = deque()
+        self._sa_sum = 0.0
+        self._energy_sum = 0.0
+        self._dip_sum = 0.0
+        # 每处理 window_size 个样本用 fsum 重新求和一次，消除浮点累积误差
+        self._since_resync = 0
+
         # 跌倒检测状态
         self.fall_count = 0          # 连续跌倒检测次数
         self.normal_count = 0        # 连续正常次数
@@ -59,6 +80,7 @@ class FallDetector:
             (is_fall, details) - 是否跌倒及详情
         """
         # 添加新样本到缓冲区
+        self._update_sums(acc_x, acc_y, acc_z)
         self.acc_buffer.append((acc_x, acc_y, acc_z))
 
         # 需要足够数据才能进行检测
@@ -126,6 +148,39 @@ class FallDetector:
 
         return is_fall, details
 
+    def _update_sums(self, acc_x, acc_y, acc_z):
+        """新样本加入窗口前更新积分项的滑动累加和"""
+        if self.acc_buffer:
+            ax_prev, ay_prev, az_prev = self.acc_buffer[-1]
+            dt = 1.0 / self.sampling_rate
+
+            sa_term = ((abs(acc_x) + abs(ax_prev)) / 2 * dt
+                       + (abs(acc_y) + abs(ay_prev)) / 2 * dt
+                       + (abs(acc_z) + abs(az_prev)) / 2 * dt)
+            energy_term = ((ax_prev**2 + ay_prev**2 + az_prev**2)
+                           + (acc_x**2 + acc_y**2 + acc_z**2)) / 2 * dt
+            dip_term = (acc_x - ax_prev)**2 + (acc_y - ay_prev)**2 + (acc_z - az_prev)**2
+
+            self._sa_terms.append(sa_term)
+            self._energy_terms.append(energy_term)
+            self._dip_terms.append(dip_term)
+            self._sa_sum += sa_term
+            self._energy_sum += energy_term
+            self._dip_sum += dip_term
+
+            # 窗口已满时最早的一帧将被移出，对应的积分项一并减去
+            if len(self.acc_buffer) == self.window_size:
+                self._sa_sum -= self._sa_terms.popleft()
+                self._energy_sum -= self._energy_terms.popleft()
+                self._dip_sum -= self._dip_terms.popleft()
+
+        self._since_resync += 1
+        if self._since_resync >= self.window_size:
+            self._since_resync = 0
+            self._sa_sum = math.fsum(self._sa_terms)
+            self._energy_sum = math.fsum(self._energy_terms)
+            self._dip_sum = math.fsum(self._dip_terms)
+
     def _calculate_ra(self):
         """
         论文公式(1): 计算合加速度
@@ -156,19 +211,9 @@ class FallDetector:
         if t <= 0:
             return 0.0
 
-        # 对三轴分别积分后求和
+        # 对三轴分别积分后求和（梯形积分，见 _update_sums）
         # ∫Ax(t)dt ≈ Σ[(Ax[i] + Ax[i-1])/2 × Δt]
-        integral_sum = 0.0
-        dt = 1.0 / self.sampling_rate  # 采样间隔
-
-        for i in range(1, n):
-            ax_prev, ay_prev, az_prev = self.acc_buffer[i-1]
-            ax_curr, ay_curr, az_curr = self.acc_buffer[i]
-
-            # 梯形积分: (f(xi) + f(xi-1))/2 * dx
-            integral_sum += (abs(ax_curr) + abs(ax_prev)) / 2 * dt
-            integral_sum += (abs(ay_curr) + abs(ay_prev)) / 2 * dt
-            integral_sum += (abs(az_curr) + abs(az_prev)) / 2 * dt
+        integral_sum = self._sa_sum
 
         # SA = (1/t) × integral
         sa = (1.0 / t) * integral_sum
@@ -186,20 +231,8 @@ class FallDetector:
         if n < 2:
             return 0.0
 
-        dt = 1.0 / self.sampling_rate
-
-        # 使用梯形积分法计算 ∫s(t)²dt
-        energy = 0.0
-        for i in range(1, n):
-            ax_prev, ay_prev, az_prev = self.acc_buffer[i-1]
-            ax_curr, ay_curr, az_curr = self.acc_buffer[i]
-
-            # s(t)² = Ax² + Ay² + Az²
-            s_prev_sq = ax_prev**2 + ay_prev**2 + az_prev**2
-            s_curr_sq = ax_curr**2 + ay_curr**2 + az_curr**2
-
-            # 梯形积分
-            energy += (s_prev_sq + s_curr_sq) / 2 * dt
+        # 使用梯形积分法计算 ∫s(t)²dt（滑动累加，见 _update_sums）
+        energy = self._energy_sum
 
         return energy
 
@@ -219,20 +252,9 @@ class FallDetector:
         if n < 2:
             return 0.0
 
-        # 计算所有相邻帧的方向变化并求和
-        dip_sum = 0.0
-        for i in range(1, n):
-            ax_prev, ay_prev, az_prev = self.acc_buffer[i-1]
-            ax_curr, ay_curr, az_curr = self.acc_buffer[i]
-
-            # 论文公式(4): D = √[(x1-y1)² + (x2-y2)² + (x3-y3)²]
-            # 其中x是当前帧, y是上一帧
-            diff_x = ax_curr - ax_prev
-            diff_y = ay_curr - ay_prev
-            diff_z = az_curr - az_prev
-
-            # Σ(xi - yi)²
-            dip_sum += diff_x**2 + diff_y**2 + diff_z**2
+        # 所有相邻帧的方向变化之和 Σ(xi - yi)²（滑动累加，见 _update_sums）
+        # 论文公式(4): D = √[(x1-y1)² + (x2-y2)² + (x3-y3)²]，x是当前帧, y是上一帧
+        dip_sum = max(self._dip_sum, 0.0)
 
         # 开平方
         dip = math.sqrt(dip_sum)
@@ -244,9 +266,99 @@ class FallDetector:
 
         return dip_normalized
 
+    def check_batch(self, acc_x, acc_y, acc_z):
+        """
+        批量检查整段记录（离线分析用，需要 numpy）
+
+        相当于在一个新建的检测器上依次对每个样本调用 check()，但用累加和一次算出所有窗口位置的
+        RA/SA/E/Dip，状态机按连续疑似次数向量化求出，不修改本检测器的流式状态。
+        各积分项与 check() 逐项相同，窗口和与流式结果只差浮点舍入，判定结果一致。
+
+        参数:
+            acc_x, acc_y, acc_z: 三轴加速度数组 (g)，长度相同
+
+        返回:
+            dict，每个值都是与输入等长的数组：
+            is_fall（bool）、state（BATCH_STATES 下标，0 表示数据不足）、
+            ra / sa / energy / dip（数据不足处为 nan）、fall_count、normal_count
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("check_batch 需要 numpy")
+
+        ax = np.asarray(acc_x, dtype=np.float64)
+        ay = np.asarray(acc_y, dtype=np.float64)
+        az = np.asarray(acc_z, dtype=np.float64)
+        n = len(ax)
+        window = self.window_size
+        dt = 1.0 / self.sampling_rate
+
+        result = {
+            "is_fall": np.zeros(n, dtype=bool),
+            "state": np.zeros(n, dtype=np.int8),
+            "ra": np.full(n, np.nan),
+            "sa": np.full(n, np.nan),
+            "energy": np.full(n, np.nan),
+            "dip": np.full(n, np.nan),
+            "fall_count": np.zeros(n, dtype=np.int64),
+            "normal_count": np.zeros(n, dtype=np.int64),
+        }
+        if n < window:
+            return result
+
+        # 相邻两帧的积分项，运算顺序与 _update_sums 相同
+        abs_x, abs_y, abs_z = np.abs(ax), np.abs(ay), np.abs(az)
+        sq = ax**2 + ay**2 + az**2
+        sa_terms = ((abs_x[1:] + abs_x[:-1]) / 2 * dt
+                    + (abs_y[1:] + abs_y[:-1]) / 2 * dt
+                    + (abs_z[1:] + abs_z[:-1]) / 2 * dt)
+        energy_terms = (sq[:-1] + sq[1:]) / 2 * dt
+        dip_terms = (ax[1:] - ax[:-1])**2 + (ay[1:] - ay[:-1])**2 + (az[1:] - az[:-1])**2
+
+        def window_sums(terms):
+            # 样本 i 的窗口包含第 i-window+1 .. i-1 个积分项（共 window-1 个）
+            cumsum = np.concatenate(([0.0], np.cumsum(terms)))
+            return cumsum[window - 1:] - cumsum[:n - window + 1]
+
+        ready = slice(window - 1, n)
+        t = window / self.sampling_rate
+        ra = np.sqrt(sq[ready])
+        sa = (1.0 / t) * window_sums(sa_terms)
+        energy = window_sums(energy_terms)
+        dip = np.sqrt(np.maximum(window_sums(dip_terms), 0.0))
+
+        suspected = ((ra > self.ra_threshold) & (sa > self.sa_threshold)
+                     & (energy > self.energy_threshold) & (dip > self.dip_threshold))
+
+        # 连续疑似 / 连续正常次数：到上一次相反结果为止的距离
+        index = np.arange(len(suspected))
+        last_normal = np.maximum.accumulate(np.where(suspected, -1, index))
+        last_suspected = np.maximum.accumulate(np.where(suspected, index, -1))
+        fall_count = np.where(suspected, index - last_normal, 0)
+        normal_count = np.where(suspected, 0, index - last_suspected)
+
+        # 与 check() 的状态机一致：疑似时连续 3 次确认，否则为正常
+        state = np.where(suspected, np.where(fall_count >= 3, 3, 2), 1).astype(np.int8)
+
+        result["ra"][ready] = ra
+        result["sa"][ready] = sa
+        result["energy"][ready] = energy
+        result["dip"][ready] = dip
+        result["fall_count"][ready] = fall_count
+        result["normal_count"][ready] = normal_count
+        result["state"][ready] = state
+        result["is_fall"][ready] = state == 3
+        return result
+
     def reset(self):
         """重置检测器"""
         self.acc_buffer.clear()
+        self._sa_terms.clear()
+        self._energy_terms.clear()
+        self._dip_terms.clear()
+        self._sa_sum = 0.0
+        self._energy_sum = 0.0
+        self._dip_sum = 0.0
+        self._since_resync = 0
         self.fall_count = 0
         self.normal_count = 0
         self.current_state = "normal"
@@ -15,7 +15,7 @@ import threading
 import math
 import os
 import sys
-from collections import deque
+from array import array
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # 导入config获取debug设置
@@ -32,6 +32,45 @@ DEBUG_SAMPLER = config.DEBUG_ENABLED
 # 默认配置
 SAMPLE_RATE_HZ = 50  # 采样率50Hz
 SAMPLE_INTERVAL = 1.0 / SAMPLE_RATE_HZ
+BUFFER_SECONDS = 10  # 环形缓冲保留时长(秒)
+
+# 每个采样点的通道（环形缓冲中每个通道一列）
+CHANNELS = (
+    'timestamp',
+    'ax', 'ay', 'az',
+    'gx', 'gy', 'gz',
+    'gravity_x', 'gravity_y', 'gravity_z',
+    'linear_x', 'linear_y', 'linear_z',
+    'linear_mag', 'acc_mag',
+)
+
+
+class SampleRing:
+    """预分配的列式环形缓冲
+
+    每个通道一个 array('d')，写入只覆盖对应槽位，不再为每个采样点创建字典。
+    采样点序号 seq 从 0 递增，位于槽位 seq % capacity；只保留最近 capacity 个点。
+    读取方按序号消费：记住上次读到的序号，调用 span() 取得新数据的序号范围后直接读列。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = {name: array('d', bytes(8 * capacity)) for name in CHANNELS}
+        self._column_list = [self.columns[name] for name in CHANNELS]
+        self.next_seq = 0   # 下一个写入的序号（即已写入的总点数）
+
+    def write(self, values):
+        """按 CHANNELS 顺序写入一个采样点"""
+        slot = self.next_seq % self.capacity
+        for column, value in zip(self._column_list, values):
+            column[slot] = value
+        self.next_seq += 1
+
+    def span(self, since_seq):
+        """since_seq 之后仍在缓冲中的序号范围 (start, end)，落后超过 capacity 的点已被覆盖"""
+        end = self.next_seq
+        start = min(max(since_seq, end - self.capacity, 0), end)
+        return start, end
 
 
 class HighFrequencySampler:
@@ -40,6 +79,7 @@ class HighFrequencySampler:
     架构:
     - 采样线程: 50Hz定时采样
     - 处理: 单线程实时重力去除
+    - 缓冲: 预分配的列式环形缓冲 SampleRing，读取方按序号消费
     """
 
     def __init__(self, sample_rate=SAMPLE_RATE_HZ):
@@ -50,8 +90,9 @@ class HighFrequencySampler:
         self._running = False
         self._sample_thread = None
 
-        # 采样缓冲
-        self._sample_buffer = deque(maxlen=sample_rate * 10)  # 10秒数据
+        # 采样缓冲：列式环形缓冲，保留最近 BUFFER_SECONDS 秒
+        self._ring = SampleRing(int(sample_rate * BUFFER_SECONDS))
+        self._read_floor = 0    # clear_buffer() 之后 get_output_buffer() 只返回更新的点
 
         # 最新值
         self._latest_raw = (0.0, 0.0, 0.0, 0.0)
@@ -174,22 +215,17 @@ class HighFrequencySampler:
                     logger.debug(f"[采样] idx={sample_idx}, 原始=({ax:.4f}, {ay:.4f}, {az:.4f}), 线性=({linear_x:.4f}, {linear_y:.4f}, {linear_z:.4f})")
 
                 with self._lock:
-                    self._sample_buffer.append({
-                        'sample_idx': sample_idx,
-                        'timestamp': timestamp,
-                        'ax': ax, 'ay': ay, 'az': az,
-                        'gx': gx if gx else 0,
-                        'gy': gy if gy else 0,
-                        'gz': gz if gz else 0,
-                        'gravity_x': gravity_x,
-                        'gravity_y': gravity_y,
-                        'gravity_z': gravity_z,
-                        'linear_x': linear_x,
-                        'linear_y': linear_y,
-                        'linear_z': linear_z,
-                        'linear_mag': linear_mag,
-                        'acc_mag': acc_mag
-                    })
+                    # 顺序与 CHANNELS 一致
+                    self._ring.write((
+                        timestamp,
+                        ax, ay, az,
+                        gx if gx else 0.0,
+                        gy if gy else 0.0,
+                        gz if gz else 0.0,
+                        gravity_x, gravity_y, gravity_z,
+                        linear_x, linear_y, linear_z,
+                        linear_mag, acc_mag,
+                    ))
                     self._latest_raw = (ax, ay, az, acc_mag)
                     self._latest_linear = (linear_x, linear_y, linear_z, linear_mag)
                     self._sample_count += 1
@@ -211,15 +247,43 @@ class HighFrequencySampler:
         with self._lock:
             return self._latest_linear
 
+    @property
+    def capacity(self):
+        """环形缓冲容量（采样点数）"""
+        return self._ring.capacity
+
+    def channel(self, name):
+        """通道数据列（array('d')），序号 seq 的点位于下标 seq % capacity"""
+        return self._ring.columns[name]
+
+    def samples_since(self, seq):
+        """
+        按序号消费采样数据，不复制也不清空缓冲
+
+        返回 (start, end)：序号 [start, end) 的点可通过 channel() 读取，
+        下次以 end 作为 seq 调用。读取方须在 BUFFER_SECONDS 内处理完，否则旧槽位会被覆盖。
+        """
+        with self._lock:
+            return self._ring.span(seq)
+
     def get_output_buffer(self):
-        """获取采样缓冲区数据"""
+        """获取采样缓冲区数据（字典列表，供离线采集工具使用）"""
         with self._lock:
-            return list(self._sample_buffer)
+            start, end = self._ring.span(self._read_floor)
+            capacity = self._ring.capacity
+            columns = self._ring.columns
+            samples = []
+            for seq in range(start, end):
+                slot = seq % capacity
+                sample = {name: columns[name][slot] for name in CHANNELS}
+                sample['sample_idx'] = seq
+                samples.append(sample)
+            return samples
 
     def clear_buffer(self):
-        """清空输出缓冲区"""
+        """清空输出缓冲区（只影响 get_output_buffer）"""
         with self._lock:
-            self._sample_buffer.clear()
+            self._read_floor = self._ring.next_seq
 
     def get_stats(self):
         """获取采样统计"""
@@ -0,0 +1,133 @@
+# -*- coding: UTF-8 -*-
+"""
+传感器数据分发模块
+
+从高频采样器按序号取出新的采样点，每个点只读取一次，依次分发给各检测器：
+- 步数检测: 重力去除后的线性加速度（附带原始加速度）
+- 姿态角 / 跌倒检测 / 姿态检测: 含重力的原始加速度
+
+所有检测器都以真实采样率运行（50Hz），不再由主循环每 0.1 秒各自读取一次最新值。
+步数只在运动模式计数：计步开关由模式处理函数设置，关闭期间采样点不送入步数检测器。
+检测结果（检测到步数、确认跌倒、姿态切换）会一直保留到调用方取走，
+两次取结果之间的所有采样点都不会漏判。
+"""
+
+import threading
+
+
+class SensorDispatcher:
+    """单次读取、多路分发的传感器处理流水线"""
+
+    def __init__(self, sampler, step_detector=None, fall_detector=None,
+                 posture_detector=None, attitude_calculator=None):
+        self.sampler = sampler
+        self.step_detector = step_detector
+        self.fall_detector = fall_detector
+        self.posture_detector = posture_detector
+        self.attitude_calculator = attitude_calculator
+
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self._step_counting = False   # 计步开关（运动模式开启）
+
+        # 最近一个采样点: (ax, ay, az, acc_mag)
+        self.latest = None
+        self.pitch, self.roll = 0, 0
+
+        # 待取走的检测结果
+        self._step_detected = False
+        self._step_record = {}
+        self._fall = False
+        self._fall_state = {}
+        self._posture_changed = False
+
+    def poll(self):
+        """处理上次之后的所有新采样点，返回处理的点数"""
+        with self._lock:
+            start, end = self.sampler.samples_since(self._cursor)
+            if start == end:
+                return 0
+
+            capacity = self.sampler.capacity
+            channel = self.sampler.channel
+            timestamps = channel('timestamp')
+            raw_x, raw_y, raw_z = channel('ax'), channel('ay'), channel('az')
+            linear_x, linear_y, linear_z = channel('linear_x'), channel('linear_y'), channel('linear_z')
+            acc_mags = channel('acc_mag')
+
+            step_detector = self.step_detector if self._step_counting else None
+            fall_detector = self.fall_detector
+            posture_detector = self.posture_detector
+            attitude_calculator = self.attitude_calculator
+
+            for seq in range(start, end):
+                slot = seq % capacity
+                ax, ay, az = raw_x[slot], raw_y[slot], raw_z[slot]
+
+                if step_detector:
+                    detected, record = step_detector.add_sample(
+                        linear_x[slot], linear_y[slot], linear_z[slot],
+                        None, None, None,
+                        timestamp=timestamps[slot],
+                        already_linear=True,
+                        raw_acc=(ax, ay, az)
+                    )
+                    if detected:
+                        self._step_detected = True
+                    if detected or not self._step_detected:
+                        self._step_record = record
+
+                if attitude_calculator:
+                    self.pitch, self.roll = attitude_calculator.update(ax, ay, az)
+
+                if fall_detector:
+                    is_fall, state = fall_detector.check(ax, ay, az)
+                    if is_fall:
+                        self._fall = True
+                    if is_fall or not self._fall:
+                        self._fall_state = state
+
+                if posture_detector:
+                    changed, _ = posture_detector.update(ax, ay, az)
+                    if changed:
+                        self._posture_changed = True
+
+            last = (end - 1) % capacity
+            self.latest = (raw_x[last], raw_y[last], raw_z[last], acc_mags[last])
+            self._cursor = end
+            return end - start
+
+    def set_step_counting(self, enabled):
+        """打开/关闭计步；切换时丢弃尚未取走的步数检测结果"""
+        with self._lock:
+            if self._step_counting == enabled:
+                return
+            self._step_counting = enabled
+            self._step_detected = False
+            self._step_record = {}
+
+    def take_step(self):
+        """取走步数检测结果: (期间是否检测到步数, 记录字典)"""
+        with self._lock:
+            result = (self._step_detected, self._step_record)
+            self._step_detected = False
+            return result
+
+    def take_fall(self):
+        """取走跌倒检测结果: (期间是否确认跌倒, 状态字典)"""
+        with self._lock:
+            result = (self._fall, self._fall_state)
+            self._fall = False
+            return result
+
+    def take_posture(self):
+        """取走姿态检测结果: (期间姿态是否切换, 当前姿态)"""
+        with self._lock:
+            changed = self._posture_changed
+            self._posture_changed = False
+            posture = self.posture_detector.get_posture() if self.posture_detector else "unknown"
+            return changed, posture
+
+    def get_latest(self):
+        """最近一个采样点的原始加速度: (ax, ay, az, acc_mag)，尚无数据时返回 None"""
+        return self.latest
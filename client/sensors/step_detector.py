@@ -15,13 +15,33 @@
 
 import time
 import math
-from collections import deque
+from bisect import bisect_left
+from types import MappingProxyType
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# 精简模式下未检测到步数时返回的记录（只读、共享，不为每个样本分配字典）
+EMPTY_RECORD = MappingProxyType({})
+
+# 统计窗口大小（样本数）
+STATS_WINDOW = 50
 
 
 class StepDetector:
-    """基于多阈值步数检测算法的步数检测器"""
+    """基于多阈值步数检测算法的步数检测器
 
-    def __init__(self, config=None):
+    默认为精简模式：滑动窗口是预分配的浮点环形数组，统计量用滑动 Welford 方法增量维护，
+    只有检测到步数时才生成完整记录，其余样本返回 EMPTY_RECORD。
+    detailed_records=True（调试 / 离线分析）时每个样本都返回包含失败原因的完整记录。
+    """
+
+    def __init__(self, config=None, detailed_records=False):
         if config is None:
             config = {
                 "t_max": 0.12,           # 波峰阈值 (g)
@@ -33,19 +53,27 @@ class StepDetector:
         self.t_max = config.get("t_max", 0.12)
         self.t_min = config.get("t_min", -0.06)
         self.window_size = config.get("window_size", 7)
+        self.detailed_records = detailed_records
 
         # 核心状态
         self.step_count = 0
         self.flag = 1  # 1=波峰检测, 2=过零点检测, 3=波谷检测
 
-        # 滑动窗口缓存
-        self.buffer = deque(maxlen=self.window_size)
+        # 滑动窗口缓存：垂直加速度及其时间戳的环形数组，_window_pos 指向最早的样本
+        self._window = [0.0] * self.window_size
+        self._window_time = [0.0] * self.window_size
+        self._window_pos = 0
+        self._window_count = 0
 
-        # 最新的检测记录
+        # 最新的检测记录（精简模式下为最近一次检测到步数的记录）
         self.latest_record = None
 
-        # 统计缓冲区
-        self.stats_buffer = deque(maxlen=50)
+        # 统计窗口：环形数组 + 滑动均值 / 平方差和
+        self._stats = [0.0] * STATS_WINDOW
+        self._stats_pos = 0
+        self._stats_count = 0
+        self._stats_mean = 0.0
+        self._stats_m2 = 0.0
         self.sample_count = 0
 
         # 导入重力去除器
@@ -63,73 +91,94 @@ class StepDetector:
             timestamp: 可选时间戳
 
         返回:
-            (是否检测到步数, 记录字典)
+            (是否检测到步数, 记录字典)；精简模式下未检测到步数时记录为 EMPTY_RECORD
         """
         if timestamp is None:
             timestamp = time.time()
 
         if already_linear:
-            linear_x, linear_y, linear_z = acc_x, acc_y, acc_z
+            linear_y = acc_y
             if raw_acc is None:
                 raw_x, raw_y, raw_z = acc_x, acc_y, acc_z
             else:
                 raw_x, raw_y, raw_z = raw_acc
-            acc_magnitude = math.sqrt(raw_x**2 + raw_y**2 + raw_z**2)
         else:
             raw_x, raw_y, raw_z = acc_x, acc_y, acc_z
-            acc_magnitude = math.sqrt(acc_x**2 + acc_y**2 + acc_z**2)
 
             # 使用重力去除器处理（即使没有陀螺仪也进行重力去除）
-            linear_acc = self.gravity_remover.add_sample(
+            linear_x, linear_y, linear_z = self.gravity_remover.add_sample(
                 acc_x, acc_y, acc_z,
                 gyro_x, gyro_y, gyro_z,
                 timestamp
             )
 
-            linear_x, linear_y, linear_z = linear_acc
-
         # 使用Y轴（垂直方向）投影作为合加速度
         # Y轴负方向向上，垂直方向加速度可有正负
         acc_deviation = linear_y
 
-        # 更新统计缓冲区
-        self.stats_buffer.append(acc_deviation)
+        # 更新统计窗口
+        self._update_stats(acc_deviation)
         self.sample_count += 1
 
-        # 添加到窗口
-        self.buffer.append({
-            "timestamp": timestamp,
-            "acc": acc_deviation,
-            "acc_raw": acc_magnitude,
-            "ax": raw_x,
-            "ay": raw_y,
-            "az": raw_z,
-            "linear_x": linear_x,
-            "linear_y": linear_y,
-            "linear_z": linear_z
-        })
+        # 添加到窗口（覆盖最早的样本）
+        slot = self._window_pos
+        self._window[slot] = acc_deviation
+        self._window_time[slot] = timestamp
+        self._window_pos = (slot + 1) % self.window_size
 
         # 窗口未满，无法检测
-        if len(self.buffer) < self.window_size:
-            record = self._create_record(
-                detected=False,
-                ax=acc_x,
-                ay=acc_y,
-                az=acc_z,
-                acc_mag=acc_magnitude,
-                acc_deviation=acc_deviation,
-                reason="window_not_ready"
-            )
-            self.latest_record = record
-            return False, record
+        if self._window_count < self.window_size:
+            self._window_count += 1
+            if self._window_count < self.window_size:
+                if not self.detailed_records:
+                    return False, EMPTY_RECORD
+                record = self._create_record(
+                    detected=False,
+                    ax=acc_x,
+                    ay=acc_y,
+                    az=acc_z,
+                    acc_mag=math.sqrt(raw_x**2 + raw_y**2 + raw_z**2),
+                    acc_deviation=acc_deviation,
+                    reason="window_not_ready"
+                )
+                self.latest_record = record
+                return False, record
 
         # 执行三阶段检测
-        detected, record = self._detect_by_three_stage(acc_deviation, acc_magnitude, acc_x, acc_y, acc_z)
+        detected, record = self._detect_by_three_stage(acc_deviation, raw_x, raw_y, raw_z, acc_x, acc_y, acc_z)
 
-        self.latest_record = record
+        if record is not EMPTY_RECORD:
+            self.latest_record = record
         return detected, record
 
-    def _detect_by_three_stage(self, acc_deviation, acc_raw, ax, ay, az):
+    def _update_stats(self, value):
+        """滑动 Welford：加入新值，窗口满时同时移出最早的值"""
+        slot = self._stats_pos
+        if self._stats_count < STATS_WINDOW:
+            self._stats_count += 1
+            delta = value - self._stats_mean
+            self._stats_mean += delta / self._stats_count
+            self._stats_m2 += delta * (value - self._stats_mean)
+        else:
+            old = self._stats[slot]
+            old_mean = self._stats_mean
+            self._stats_mean += (value - old) / STATS_WINDOW
+            self._stats_m2 += (value - old) * (value - self._stats_mean + old - old_mean)
+        self._stats[slot] = value
+        self._stats_pos = (slot + 1) % STATS_WINDOW
+
+        # 每转一圈按窗口重新计算一次，消除浮点累积误差
+        if self._stats_pos == 0:
+            self._stats_mean = math.fsum(self._stats) / STATS_WINDOW
+            self._stats_m2 = math.fsum((x - self._stats_mean) ** 2 for x in self._stats)
+
+    def _mean_std(self):
+        """统计窗口内的均值和标准差"""
+        if self._stats_count > 1:
+            return self._stats_mean, math.sqrt(max(self._stats_m2, 0.0) / self._stats_count)
+        return 0, 0
+
+    def _detect_by_three_stage(self, acc_deviation, raw_x, raw_y, raw_z, ax, ay, az):
         """
         三阶段检测算法
 
@@ -137,64 +186,63 @@ class StepDetector:
         1. Flag=1: 波峰阈值检测 (C[0-6] > T_max, 且C[3]最大)
         2. Flag=2: 过零点检测 (C[3] < 0, C[2] > 0)
         3. Flag=3: 波谷阈值检测 (C[0-6] < T_min, 且C[3]最小) → 步数+1, Flag重置为1
+
+        窗口按时间顺序的第 i 个样本位于环形数组的 (_window_pos + i) % window_size
         """
-        window_data = list(self.buffer)
-        acc_values = [s["acc"] for s in window_data]
+        window = self._window
+        size = self.window_size
+        detailed = self.detailed_records
 
         # 获取窗口中间值
-        mid_idx = self.window_size // 2
-        mid_acc = acc_values[mid_idx]
+        mid_idx = size // 2
+        mid_slot = (self._window_pos + mid_idx) % size
+        mid_acc = window[mid_slot]
 
         # 获取C[mid_idx-1]
-        c2_acc = acc_values[mid_idx - 1]
+        c2_acc = window[(mid_slot - 1) % size]
+
+        # 生成记录所需的样本数据（只在调试模式下每个样本都打包）
+        sample = (acc_deviation, raw_x, raw_y, raw_z, ax, ay, az) if detailed else None
 
         # === Flag=1: 波峰阈值检测 ===
         if self.flag == 1:
-            all_above_threshold = all(a > self.t_max for a in acc_values)
-            # 波峰条件：中间点比其余6个数都大
-            mid_is_peak = all(mid_acc > a for i, a in enumerate(acc_values) if i != mid_idx)
+            all_above_threshold = min(window) > self.t_max
+            # 波峰条件：中间点比其余点都大
+            mid_is_peak = mid_acc == max(window) and window.count(mid_acc) == 1
 
             if all_above_threshold and mid_is_peak:
                 self.flag = 2
-                return False, self._create_record(
-                    detected=False,
-                    ax=ax, ay=ay, az=az, acc_mag=acc_raw,
-                    acc_deviation=acc_deviation,
-                    method="peak_detected",
-                    reason="flag_1_to_2"
+                if detailed:
+                    return False, self._stage_record(sample, "flag_1_to_2", detected=False, method="peak_detected")
+            elif detailed:
+                # 波峰条件不满足，flag保持为1
+                return False, self._stage_record(
+                    sample,
+                    f"flag_1_peak_not_found(all_above={all_above_threshold}, mid_peak={mid_is_peak})",
+                    detected=False
                 )
-            # 波峰条件不满足，flag保持为1
-            return False, self._create_record(
-                detected=False,
-                ax=ax, ay=ay, az=az, acc_mag=acc_raw,
-                acc_deviation=acc_deviation,
-                reason=f"flag_1_peak_not_found(all_above={all_above_threshold}, mid_peak={mid_is_peak})"
-            )
+            return False, EMPTY_RECORD
 
         # === Flag=2: 过零点检测 ===
         elif self.flag == 2:
             if c2_acc > 0 and mid_acc < 0:
                 self.flag = 3
-                return False, self._create_record(
-                    detected=False,
-                    ax=ax, ay=ay, az=az, acc_mag=acc_raw,
-                    acc_deviation=acc_deviation,
-                    method="zero_crossing",
-                    reason="flag_2_to_3"
+                if detailed:
+                    return False, self._stage_record(sample, "flag_2_to_3", detected=False, method="zero_crossing")
+            elif detailed:
+                # 过零点条件不满足，flag保持为2
+                return False, self._stage_record(
+                    sample,
+                    f"flag_2_zero_not_found(c2={c2_acc:.3f}, mid={mid_acc:.3f})",
+                    detected=False
                 )
-            # 过零点条件不满足，flag保持为2
-            return False, self._create_record(
-                detected=False,
-                ax=ax, ay=ay, az=az, acc_mag=acc_raw,
-                acc_deviation=acc_deviation,
-                reason=f"flag_2_zero_not_found(c2={c2_acc:.3f}, mid={mid_acc:.3f})"
-            )
+            return False, EMPTY_RECORD
 
         # === Flag=3: 波谷阈值检测 ===
         elif self.flag == 3:
-            all_below_threshold = all(a < self.t_min for a in acc_values)
-            # 波谷条件：中间点小于其余6个数
-            mid_is_valley = all(mid_acc < a for i, a in enumerate(acc_values) if i != mid_idx)
+            all_below_threshold = max(window) < self.t_min
+            # 波谷条件：中间点小于其余点
+            mid_is_valley = mid_acc == min(window) and window.count(mid_acc) == 1
 
             if all_below_threshold and mid_is_valley:
                 # 检测到有效步数
@@ -202,45 +250,117 @@ class StepDetector:
                 self.flag = 1  # 重置到第一阶段
 
                 # 找到波谷对应的时间戳
-                valley_time = window_data[mid_idx]["timestamp"]
+                valley_time = self._window_time[mid_slot]
 
-                return True, self._create_record(
+                return True, self._stage_record(
+                    (acc_deviation, raw_x, raw_y, raw_z, ax, ay, az),
+                    "step_detected",
                     detected=True,
-                    ax=ax, ay=ay, az=az, acc_mag=acc_raw,
-                    acc_deviation=acc_deviation,
                     method="valley_confirmed",
                     threshold_upper=self.t_max,
                     threshold_lower=self.t_min,
-                    peak_time=valley_time,
-                    reason="step_detected"
+                    peak_time=valley_time
                 )
-            # 波谷条件不满足，flag保持为3
-            return False, self._create_record(
-                detected=False,
-                ax=ax, ay=ay, az=az, acc_mag=acc_raw,
-                acc_deviation=acc_deviation,
-                reason=f"flag_3_valley_not_found(below={all_below_threshold}, valley={mid_is_valley})"
-            )
+            if detailed:
+                # 波谷条件不满足，flag保持为3
+                return False, self._stage_record(
+                    sample,
+                    f"flag_3_valley_not_found(below={all_below_threshold}, valley={mid_is_valley})",
+                    detected=False
+                )
+            return False, EMPTY_RECORD
 
         # 阶段未完成
-        return False, self._create_record(
-            detected=False,
-            ax=ax, ay=ay, az=az, acc_mag=acc_raw,
-            acc_deviation=acc_deviation,
-            reason=f"flag_{self.flag}_processing"
+        if detailed:
+            return False, self._stage_record(sample, f"flag_{self.flag}_processing", detected=False)
+        return False, EMPTY_RECORD
+
+    def detect_batch(self, acc_deviation, timestamps=None):
+        """
+        批量三阶段检测（离线分析用，需要 numpy）
+
+        相当于在一个新建的检测器上依次对每个垂直加速度调用 add_sample(..., already_linear=True)，
+        步数与流式检测完全一致，不修改本检测器的状态。
+        先用滑动窗口视图一次算出每个窗口位置的波峰/过零/波谷条件，
+        状态机再按 1→2→3 依次查找下一个满足条件的位置，循环次数等于步数。
+
+        参数:
+            acc_deviation: 垂直方向线性加速度数组 (g)
+            timestamps: 可选，与 acc_deviation 等长的时间戳数组
+
+        返回:
+            dict: step_count 步数、step_index 每一步确认时的样本下标、
+            peak_time 每一步波谷对应的时间戳（提供 timestamps 时）
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("detect_batch 需要 numpy")
+
+        values = np.asarray(acc_deviation, dtype=np.float64)
+        size = self.window_size
+        result = {"step_count": 0, "step_index": np.zeros(0, dtype=np.int64)}
+        if timestamps is not None:
+            result["peak_time"] = np.zeros(0)
+        if len(values) < size:
+            return result
+
+        # 第 k 个窗口为样本 k .. k+size-1，在样本 k+size-1 处检测
+        # 窗口很小，逐列（窗口内第 j 个样本的视图，连续内存）比按行归约快
+        windows = sliding_window_view(values, size)
+        columns = [windows[:, j] for j in range(size)]
+        mid_idx = size // 2
+        mid = columns[mid_idx]
+        c2 = columns[mid_idx - 1]
+
+        window_max = columns[0].copy()
+        window_min = columns[0].copy()
+        mid_count = np.zeros(len(mid), dtype=np.int8)
+        for column in columns:
+            np.maximum(window_max, column, out=window_max)
+            np.minimum(window_min, column, out=window_min)
+            mid_count += column == mid
+        mid_unique = mid_count == 1
+
+        # 各阶段条件成立的窗口序号（升序）
+        peaks = np.flatnonzero((window_min > self.t_max) & (mid == window_max) & mid_unique)
+        zeros = np.flatnonzero((c2 > 0) & (mid < 0))
+        valleys = np.flatnonzero((window_max < self.t_min) & (mid == window_min) & mid_unique)
+
+        steps = []
+        position = 0
+        stages = (peaks.tolist(), zeros.tolist(), valleys.tolist())
+        while True:
+            # 每个阶段在上一阶段成立之后的下一个样本才开始检查
+            for events in stages:
+                found = bisect_left(events, position)
+                if found == len(events):
+                    break
+                position = events[found] + 1
+            else:
+                steps.append(position - 1)
+                continue
+            break
+
+        step_windows = np.asarray(steps, dtype=np.int64)
+        result["step_count"] = len(steps)
+        result["step_index"] = step_windows + size - 1
+        if timestamps is not None:
+            result["peak_time"] = np.asarray(timestamps, dtype=np.float64)[step_windows + mid_idx]
+        return result
+
+    def _stage_record(self, sample, reason, **kwargs):
+        """由三阶段检测的样本数据创建记录"""
+        acc_deviation, raw_x, raw_y, raw_z, ax, ay, az = sample
+        return self._create_record(
+            ax=ax, ay=ay, az=az, acc_mag=math.sqrt(raw_x**2 + raw_y**2 + raw_z**2),
+            acc_deviation=acc_deviation, reason=reason, **kwargs
         )
 
     def _create_record(self, detected, ax, ay, az, acc_mag, acc_deviation=0, method="none",
                        threshold_upper=None, threshold_lower=None,
                        peak_time=None, reason="none"):
         """创建检测记录"""
-        # 计算当前统计值
-        mean_acc = 0
-        std_acc = 0
-        if len(self.stats_buffer) > 1:
-            mean_acc = sum(self.stats_buffer) / len(self.stats_buffer)
-            variance = sum((x - mean_acc) ** 2 for x in self.stats_buffer) / len(self.stats_buffer)
-            std_acc = math.sqrt(variance)
+        # 当前统计值
+        mean_acc, std_acc = self._mean_std()
 
         record = {
             "detected": detected,
@@ -257,7 +377,7 @@ class StepDetector:
             "reason": reason,
             "peak_time": peak_time,
             "step_count": self.step_count,
-            "buffer_size": len(self.buffer),
+            "buffer_size": self._window_count,
             "mean_acc": mean_acc,
             "std_acc": std_acc
         }
@@ -274,21 +394,15 @@ class StepDetector:
 
     def get_current_stats(self):
         """获取当前状态统计"""
-        # 计算滑动窗口内的统计值
-        if len(self.stats_buffer) > 1:
-            mean_acc = sum(self.stats_buffer) / len(self.stats_buffer)
-            variance = sum((x - mean_acc) ** 2 for x in self.stats_buffer) / len(self.stats_buffer)
-            std_acc = math.sqrt(variance)
-        else:
-            mean_acc = 0
-            std_acc = 0
+        # 滑动窗口内的统计值
+        mean_acc, std_acc = self._mean_std()
 
         return {
             "step_count": self.step_count,
             "flag": self.flag,
             "threshold_upper": self.t_max,
             "threshold_lower": self.t_min,
-            "buffer_size": len(self.buffer),
+            "buffer_size": self._window_count,
             "mean_acc": mean_acc,
             "std_acc": std_acc,
             "sample_count": self.sample_count
@@ -298,9 +412,13 @@ class StepDetector:
         """重置检测器"""
         self.step_count = 0
         self.flag = 1
-        self.buffer.clear()
+        self._window_pos = 0
+        self._window_count = 0
         self.latest_record = None
-        self.stats_buffer.clear()
+        self._stats_pos = 0
+        self._stats_count = 0
+        self._stats_mean = 0.0
+        self._stats_m2 = 0.0
         self.sample_count = 0
         if self.gravity_remover:
             self.gravity_remover.reset()
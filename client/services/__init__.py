@@ -2,10 +2,16 @@
 """运行时服务模块"""
 
 from .gnss_manager import GNSSManager, GNSS_AVAILABLE
+from .http_client import HttpClient
 from .offline_manager import OfflineManager
+from .pending_journal import PendingJournal
+from .status_encoder import StatusDeltaEncoder
 
 __all__ = [
     'GNSSManager',
     'GNSS_AVAILABLE',
+    'HttpClient',
     'OfflineManager',
+    'PendingJournal',
+    'StatusDeltaEncoder',
 ]
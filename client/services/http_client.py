@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+"""共享 HTTP 长连接服务"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.logger import get_logger
+
+logger = get_logger('services.http_client')
+
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    Retry = None
+
+
+class HttpClient:
+    """
+    与服务端通信的共享连接池
+
+    通信线程、命令长轮询、运动记录上传和 OfflineManager 共用同一个 requests.Session，
+    保持 keep-alive 长连接，不再每次请求都重新握手。适配器不做自动重试（离线时快速失败），
+    连接出错后丢弃整个连接池，下一次请求自动重新建立连接。
+    """
+
+    def __init__(self, server_url, timeout=5, connect_timeout=3, pool_size=4):
+        self.server_url = server_url.rstrip('/')
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        session = requests.Session()
+        max_retries = Retry(total=0, connect=0, read=0, redirect=0) if Retry else 0
+        # 长轮询、状态上报、记录上传可能同时占用连接
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=max_retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def reset(self):
+        """关闭连接池，下次请求时重新连接"""
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """发送请求；timeout 为读取超时(秒)，连接超时固定为 connect_timeout"""
+        read_timeout = self.timeout if timeout is None else timeout
+        try:
+            return self.session.request(
+                method,
+                f"{self.server_url}{path}",
+                timeout=(min(self.connect_timeout, read_timeout), read_timeout),
+                **kwargs
+            )
+        except requests.ConnectionError:
+            # 服务端重启或网络中断后旧连接已失效
+            logger.debug("连接异常，重置连接池")
+            self.reset()
+            raise
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
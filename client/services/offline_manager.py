@@ -4,28 +4,65 @@
 from datetime import datetime
 import json
 import os
+import time
 import uuid
 
-import requests
-
 from utils.logger import get_logger
 
+from .http_client import HttpClient
+from .pending_journal import PendingJournal
+from .record_codec import CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, encode_payload
+
 logger = get_logger('services.offline_manager')
 
 
 class OfflineManager:
     """离线数据管理器"""
 
-    def __init__(self, server_url, cache_dir="/root/.smart-sports-belt"):
+    # 离线期间每缓存多少条状态快照写一次文件
+    STATUS_SAVE_EVERY = 30
+    # 运动记录中的逐点数据字段（用于估算同步分块大小）
+    DETAIL_FIELDS = ("series", "gnss_track")
+    # 旧版服务端不支持列式请求体时的响应状态码
+    UNSUPPORTED_BINARY_STATUS = (400, 404, 415)
+
+    def __init__(self, server_url, cache_dir="/root/.smart-sports-belt", max_status_backlog=3600,
+                 http_client=None, binary_records=True,
+                 sync_chunk_records=20, sync_chunk_points=20000, sync_time_budget=10,
+                 pending_fsync="always", pending_segment_bytes=1024 * 1024,
+                 cache_save_interval=30):
         self.server_url = server_url.rstrip('/')
+        self.http = http_client or HttpClient(self.server_url)
+        # 运动记录使用列式二进制上传；服务端不支持时自动退回 JSON
+        self.binary_records = binary_records
+        # 分块同步：每块最多记录数 / 逐点数据点数，单次同步最长耗时(秒)
+        self.sync_chunk_records = max(1, sync_chunk_records)
+        self.sync_chunk_points = max(1, sync_chunk_points)
+        self.sync_time_budget = sync_time_budget
         self.cache_dir = cache_dir
         self.cache_file = os.path.join(self.cache_dir, "cache.json")
+        # 旧版本的待同步记录文件，启动时迁移到追加写日志
         self.pending_file = os.path.join(self.cache_dir, "pending.json")
+        self.status_file = os.path.join(self.cache_dir, "status_backlog.json")
         self.device_file = os.path.join(self.cache_dir, "device_id.json")
 
         self.is_online = False
-        self.pending_data = []
         self.cache_data = {}
+        # 每日统计缓存延迟写：只在内容变化时落盘，且至少间隔 cache_save_interval 秒，退出时刷新
+        self.cache_save_interval = cache_save_interval
+        self._cache_dirty = False
+        self._cache_saved_at = None
+        # 待同步运动记录：分段追加写日志，不再每次整文件重写
+        self.pending_journal = PendingJournal(
+            os.path.join(self.cache_dir, "pending"),
+            segment_bytes=pending_segment_bytes,
+            fsync=pending_fsync,
+        )
+
+        # 尚未上报的状态快照（按时间顺序），在线时按上报间隔批量发送，离线时累积
+        self.status_backlog = []
+        self.max_status_backlog = max_status_backlog
+        self._unsaved_status = 0
 
         try:
             os.makedirs(self.cache_dir, exist_ok=True)
@@ -35,6 +72,7 @@ class OfflineManager:
         self.device_id = self._get_or_create_device_id()
         self._load_cache()
         self._load_pending()
+        self._load_status_backlog()
 
     def _atomic_save_json(self, file_path, data):
         temp_path = file_path + ".tmp"
@@ -65,28 +103,99 @@ class OfflineManager:
 
     def _load_pending(self):
         try:
-            if os.path.exists(self.pending_file):
-                with open(self.pending_file, 'r', encoding='utf-8') as file:
-                    self.pending_data = json.load(file) or []
+            self.pending_journal.load()
+        except Exception as e:
+            logger.warning(f"读取待同步记录失败: {e}")
+        self._migrate_pending_file()
+
+    def _migrate_pending_file(self):
+        """把旧版本 pending.json 中的记录写入追加写日志后删除该文件"""
+        if not os.path.exists(self.pending_file):
+            return
+        try:
+            with open(self.pending_file, 'r', encoding='utf-8') as file:
+                records = json.load(file) or []
+        except Exception:
+            records = []
+
+        records = [record for record in records if isinstance(record, dict)]
+        try:
+            for record in records:
+                self.append_pending_record(record)
+            os.remove(self.pending_file)
+            logger.info(f"已迁移 {len(records)} 条待同步记录")
+        except Exception as e:
+            logger.warning(f"迁移待同步记录失败: {e}")
+
+    @property
+    def pending_data(self):
+        """待同步记录（按追加顺序）"""
+        return self.pending_journal.records()
+
+    def _load_status_backlog(self):
+        try:
+            if os.path.exists(self.status_file):
+                with open(self.status_file, 'r', encoding='utf-8') as file:
+                    self.status_backlog = json.load(file) or []
         except Exception:
-            self.pending_data = []
+            self.status_backlog = []
 
     def _save_cache(self):
         try:
             self._atomic_save_json(self.cache_file, self.cache_data)
+            self._cache_dirty = False
+            self._cache_saved_at = time.monotonic()
         except Exception:
             pass
 
-    def _save_pending(self):
+    def flush_cache(self):
+        """把尚未落盘的每日统计写入文件"""
+        if self._cache_dirty:
+            self._save_cache()
+
+    def save_status_backlog(self):
+        """把未上报的状态快照写入文件（为空时删除文件）"""
+        self._unsaved_status = 0
         try:
-            self._atomic_save_json(self.pending_file, self.pending_data)
+            if self.status_backlog:
+                self._atomic_save_json(self.status_file, self.status_backlog)
+            elif os.path.exists(self.status_file):
+                os.remove(self.status_file)
         except Exception:
             pass
 
+    def append_status(self, snapshot, persist=False):
+        """缓存一条状态快照；persist=True（离线）时每 STATUS_SAVE_EVERY 条落盘一次"""
+        self.status_backlog.append(snapshot)
+        overflow = len(self.status_backlog) - self.max_status_backlog
+        if overflow > 0:
+            del self.status_backlog[:overflow]
+
+        if persist:
+            self._unsaved_status += 1
+            if self._unsaved_status >= self.STATUS_SAVE_EVERY:
+                self.save_status_backlog()
+
+    def peek_status_backlog(self, limit):
+        """最早的 limit 条待上报状态快照"""
+        return self.status_backlog[:limit]
+
+    def ack_status_backlog(self, count):
+        """上报成功后移除最早的 count 条快照"""
+        del self.status_backlog[:count]
+        if os.path.exists(self.status_file):
+            self.save_status_backlog()
+
+    @staticmethod
+    def new_record_id():
+        """运动记录唯一ID（服务端据此确认同步结果）"""
+        return uuid.uuid4().hex
+
     def append_pending_record(self, record):
         """追加待同步记录"""
-        self.pending_data.append(record)
-        self._save_pending()
+        if not record.get("record_id"):
+            record["record_id"] = self.new_record_id()
+        self.pending_journal.append(record)
 
     def update_cache(self, data):
         today = datetime.now().strftime("%Y-%m-%d")
@@ -103,12 +212,47 @@ class OfflineManager:
         last_steps = self.cache_data[today].get("steps", 0)
 
         if current_steps >= last_steps:
-            self.cache_data[today]["steps"] = current_steps
-            self.cache_data[today]["carbon"] = data.get("carbon_reduce", 0)
-            self.cache_data[today]["duration"] = data.get("sport_time_today", 0)
-            self.cache_data[today]["last_update"] = datetime.now().isoformat()
+            entry = self.cache_data[today]
+            values = {
+                "steps": current_steps,
+                "carbon": data.get("carbon_reduce", 0),
+                "duration": data.get("sport_time_today", 0),
+            }
+            if any(entry.get(key) != value for key, value in values.items()) or entry.get("last_update") is None:
+                entry.update(values)
+                entry["last_update"] = datetime.now().isoformat()
+                self._cache_dirty = True
 
-        self._save_cache()
+        if self._cache_dirty and (self._cache_saved_at is None
+                                  or time.monotonic() - self._cache_saved_at >= self.cache_save_interval):
+            self._save_cache()
+
+    def post_records(self, path, payload, timeout=10):
+        """上传运动记录请求体：优先列式二进制编码，服务端不支持时改用 JSON 重发"""
+        body = None
+        if self.binary_records:
+            try:
+                body = encode_payload(payload)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"运动记录列式编码失败，改用 JSON: {e}")
+
+        if body is not None:
+            response = self.http.post(
+                path,
+                data=body,
+                headers={"Content-Type": COLUMNAR_CONTENT_TYPE},
+                timeout=timeout,
+            )
+            # 只有旧版服务端拒绝该请求体类型时才改用 JSON；其余错误（如 5xx）交给正常的重试流程
+            if response.status_code not in self.UNSUPPORTED_BINARY_STATUS:
+                return response
+
+        response = self.http.post(path, json=payload, timeout=timeout)
+        if body is not None and response.status_code == 200:
+            # 旧版服务端只接受 JSON
+            logger.info("服务端不支持列式编码的运动记录，改用 JSON 上传")
+            self.binary_records = False
+        return response
 
     def set_online_status(self, is_online):
         """设置在线状态"""
@@ -122,38 +266,84 @@ class OfflineManager:
     def try_connect(self):
         """尝试连接服务器，返回是否成功"""
         try:
-            from requests.adapters import HTTPAdapter
-            from urllib3.util.retry import Retry
-
-            session = requests.Session()
-            retry = Retry(total=0, connect=0, read=0, redirect=0)
-            adapter = HTTPAdapter(max_retries=retry)
-            session.mount('http://', adapter)
-            session.mount('https://', adapter)
-
-            response = session.get(f"{self.server_url}/api/status", timeout=3)
+            response = self.http.get("/api/status", timeout=3)
             return response.status_code == 200
         except Exception:
             return False
 
+    def _record_points(self, record):
+        points = 1
+        for field in self.DETAIL_FIELDS:
+            value = record.get(field)
+            if isinstance(value, list):
+                points += len(value)
+        return points
+
+    def _next_chunk(self):
+        """从队首取一块待同步记录（至少一条）"""
+        chunk = []
+        points = 0
+        for record in self.pending_journal.records():
+            record_points = self._record_points(record)
+            if chunk and (len(chunk) >= self.sync_chunk_records
+                          or points + record_points > self.sync_chunk_points):
+                break
+            chunk.append(record)
+            points += record_points
+        return chunk
+
+    def _sync_chunk(self, chunk):
+        """上传一块记录，返回服务端确认的记录（请求失败时返回 None）"""
+        response = self.post_records(
+            "/api/sync_records",
+            {"device_id": self.device_id, "records": chunk},
+            timeout=10,
+        )
+        if response.status_code != 200:
+            logger.warning(f"分块同步失败: HTTP {response.status_code}")
+            return None
+
+        result = response.json()
+        acked_ids = result.get("acked_ids")
+        if acked_ids is None:
+            # 旧版服务端不返回 acked_ids，成功即整块已保存
+            return chunk
+        acked_ids = set(acked_ids)
+        return [record for record in chunk if record.get("record_id") in acked_ids]
+
     def sync_all_pending(self):
-        """批量同步所有待上传记录"""
-        if not self.is_online or not self.pending_data:
+        """
+        分块同步待上传记录
+
+        每块确认后立即在日志中追加确认帧，中断后下次从剩余记录继续；
+        单次调用最多耗时 sync_time_budget 秒，剩余记录留到下一次。结束后压缩日志。
+        """
+        if not self.is_online or not len(self.pending_journal):
             return 0
 
+        synced_count = 0
+        deadline = time.monotonic() + self.sync_time_budget
         try:
-            response = requests.post(
-                f"{self.server_url}/api/sync_records",
-                json={"records": self.pending_data},
-                timeout=10,
-            )
-            if response.status_code == 200:
-                result = response.json()
-                synced_count = result.get("synced_count", 0)
-                self.pending_data = []
-                self._save_pending()
-                logger.info(f"批量同步成功: {synced_count} 条记录")
-                return synced_count
+            while len(self.pending_journal) and time.monotonic() < deadline:
+                chunk = self._next_chunk()
+                acked = self._sync_chunk(chunk)
+                if not acked:
+                    break
+
+                self.pending_journal.ack([record["record_id"] for record in acked])
+                synced_count += len(acked)
         except Exception as e:
-            logger.warning(f"批量同步失败: {e}")
-        return 0
+            logger.warning(f"分块同步失败: {e}")
+
+        if synced_count:
+            try:
+                self.pending_journal.compact()
+            except Exception as e:
+                logger.warning(f"压缩待同步日志失败: {e}")
+            logger.info(f"同步成功: {synced_count} 条记录，剩余 {len(self.pending_journal)} 条")
+        return synced_count
+
+    def close(self):
+        """退出前刷新每日统计缓存并关闭待同步日志"""
+        self.flush_cache()
+        self.pending_journal.close()
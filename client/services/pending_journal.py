@@ -0,0 +1,208 @@
+# -*- coding: UTF-8 -*-
+"""
+待同步记录追加写日志
+
+待同步的运动记录带完整逐点数据，每追加一条就整文件重写 pending.json 的代价随离线时长平方增长。
+这里改为按段追加写：
+- 段文件 pending/000001.log ...，每行一个 JSON 帧
+  {"op": "add", "record": {...}} 新增记录；{"op": "ack", "ids": [...]} 记录已同步
+- 当前段超过 segment_bytes 后切换到新段
+- 启动时按段号顺序重放，最后一段损坏的尾部（掉电时写了一半的帧）截断
+- 同步后压缩：全部确认时删除所有段，否则把剩余记录重写为一个新段再删除旧段
+
+fsync 策略: always 每帧落盘 / rotate 切换段和关闭时落盘 / never 交给系统
+"""
+
+from collections import OrderedDict
+import json
+import os
+import threading
+
+from utils.logger import get_logger
+
+logger = get_logger('services.pending_journal')
+
+FSYNC_POLICIES = ("always", "rotate", "never")
+SEGMENT_SUFFIX = ".log"
+
+
+def _dumps_line(data):
+    return (json.dumps(data, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+class PendingJournal:
+    """按 record_id 索引的待同步记录队列，持久化为分段追加写日志"""
+
+    def __init__(self, directory, segment_bytes=1024 * 1024, fsync="always"):
+        if fsync not in FSYNC_POLICIES:
+            logger.warning(f"未知 fsync 策略 {fsync}，使用 always")
+            fsync = "always"
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+
+        self._records = OrderedDict()   # record_id -> 记录
+        self._segments = []             # 段号，升序
+        self._file = None               # 当前段文件（追加模式）
+        self._file_size = 0
+        self._dead_frames = 0           # 已确认记录的帧和确认帧，压缩时回收
+        self._lock = threading.RLock()
+
+    # ==================== 加载与恢复 ====================
+    def load(self):
+        """重放全部段，返回待同步记录列表"""
+        with self._lock:
+            self._close_file()
+            os.makedirs(self.directory, exist_ok=True)
+
+            self._records = OrderedDict()
+            self._dead_frames = 0
+            self._segments = sorted(
+                int(name[:-len(SEGMENT_SUFFIX)])
+                for name in os.listdir(self.directory)
+                if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+            )
+            for position, segment in enumerate(self._segments):
+                self._replay_segment(segment, is_last=(position == len(self._segments) - 1))
+            return list(self._records.values())
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"{segment:06d}{SEGMENT_SUFFIX}")
+
+    def _replay_segment(self, segment, is_last):
+        path = self._segment_path(segment)
+        valid_end = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                frame = None
+                if line.endswith(b"\n"):
+                    try:
+                        frame = json.loads(line.decode('utf-8'))
+                    except (UnicodeDecodeError, ValueError):
+                        frame = None
+
+                if not isinstance(frame, dict):
+                    if is_last:
+                        break
+                    logger.warning(f"待同步日志 {path} 中有损坏的帧，已跳过")
+                    valid_end += len(line)
+                    continue
+
+                self._apply(frame)
+                valid_end += len(line)
+
+        if is_last and valid_end < os.path.getsize(path):
+            logger.warning(f"待同步日志 {path} 尾部损坏，已截断")
+            with open(path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    def _apply(self, frame):
+        op = frame.get("op")
+        if op == "add":
+            record = frame.get("record")
+            if isinstance(record, dict) and record.get("record_id"):
+                if record["record_id"] in self._records:
+                    self._dead_frames += 1
+                self._records[record["record_id"]] = record
+        elif op == "ack":
+            self._dead_frames += 1
+            for record_id in frame.get("ids") or []:
+                if self._records.pop(record_id, None) is not None:
+                    self._dead_frames += 1
+
+    # ==================== 写入 ====================
+    def _open_segment(self, segment):
+        self._file = open(self._segment_path(segment), 'ab')
+        self._file_size = self._file.tell()
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        try:
+            self._file.flush()
+            if self.fsync != "never":
+                os.fsync(self._file.fileno())
+            self._file.close()
+        except OSError as e:
+            logger.warning(f"关闭待同步日志失败: {e}")
+        self._file = None
+
+    def _write_frame(self, frame):
+        data = _dumps_line(frame)
+        if self._file is None:
+            if not self._segments:
+                self._segments.append(1)
+            self._open_segment(self._segments[-1])
+        if self._file_size >= self.segment_bytes:
+            self._close_file()
+            self._segments.append(self._segments[-1] + 1)
+            self._open_segment(self._segments[-1])
+
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync == "always":
+            os.fsync(self._file.fileno())
+        self._file_size += len(data)
+
+    def append(self, record):
+        """追加一条待同步记录（必须带 record_id）"""
+        with self._lock:
+            self._write_frame({"op": "add", "record": record})
+            self._records[record["record_id"]] = record
+
+    def ack(self, record_ids):
+        """标记记录已同步"""
+        record_ids = [record_id for record_id in record_ids if record_id in self._records]
+        if not record_ids:
+            return
+        with self._lock:
+            self._write_frame({"op": "ack", "ids": record_ids})
+            for record_id in record_ids:
+                self._records.pop(record_id, None)
+            self._dead_frames += len(record_ids) + 1
+
+    # ==================== 压缩 ====================
+    def compact(self):
+        """回收已同步记录占用的空间"""
+        with self._lock:
+            if not self._dead_frames:
+                return
+
+            old_segments = list(self._segments)
+            self._close_file()
+            self._segments = []
+            self._dead_frames = 0
+
+            if self._records:
+                # 剩余记录写入新段后再删除旧段；中途掉电时重放会得到同样的结果
+                segment = (old_segments[-1] + 1) if old_segments else 1
+                path = self._segment_path(segment)
+                temp_path = path + ".tmp"
+                with open(temp_path, 'wb') as f:
+                    for record in self._records.values():
+                        f.write(_dumps_line({"op": "add", "record": record}))
+                    f.flush()
+                    if self.fsync != "never":
+                        os.fsync(f.fileno())
+                os.replace(temp_path, path)
+                self._segments = [segment]
+
+            for segment in old_segments:
+                try:
+                    os.remove(self._segment_path(segment))
+                except OSError:
+                    pass
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    # ==================== 查询 ====================
+    def records(self):
+        """待同步记录（按追加顺序）"""
+        with self._lock:
+            return list(self._records.values())
+
+    def __len__(self):
+        return len(self._records)
@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+"""
+运动记录列式二进制编码（上传用）
+
+运动记录的 series / gnss_track 是字段相同的字典列表，JSON 中每个点都重复键名。
+这里把“元素都是平铺字典的列表”按列存储：
+- 整数列：差分后打包为小端 int64 数组
+- 小数列：小数位不超过 7 位时按 10^位数 放大为整数再差分，否则打包为 float64 数组
+- 其他列（字符串、布尔等）：保存为 JSON 列表
+- 某列有缺失或 None 时另存一个掩码（0 缺失，1 有值，2 None）
+其余结构原样保存为 JSON 元数据，整体再用 zlib 压缩。
+
+格式: MAGIC + zlib(uint32 元数据长度 + 元数据 JSON + 各列二进制数据)
+解码见服务端 server/record_codec.py。
+"""
+
+from array import array
+import json
+import math
+import struct
+import sys
+import zlib
+
+MAGIC = b"SBC1"
+CONTENT_TYPE = "application/x-smart-belt-columnar"
+TABLE_KEY = "$table"
+MAX_DECIMALS = 7
+_INT64_LIMIT = 2 ** 62
+
+_MISSING = object()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_flat_rows(value):
+    if not value or not isinstance(value, list):
+        return False
+    for row in value:
+        if not isinstance(row, dict):
+            return False
+        for item in row.values():
+            if isinstance(item, (dict, list)):
+                return False
+    return True
+
+
+def _decimals(values):
+    """所有值可无损放大为整数的最小小数位数，不存在时返回 None"""
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10 ** decimals
+        ok = True
+        for value in values:
+            if not math.isfinite(value):
+                return None
+            scaled = round(value * scale)
+            if abs(scaled) >= _INT64_LIMIT or scaled / scale != value:
+                ok = False
+                break
+        if ok:
+            return decimals
+    return None
+
+
+def _pack(typecode, values):
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _delta(values):
+    previous = 0
+    result = []
+    for value in values:
+        result.append(value - previous)
+        previous = value
+    return result
+
+
+class _Encoder:
+    def __init__(self):
+        self.blobs = bytearray()
+
+    def _blob(self, data):
+        offset = len(self.blobs)
+        self.blobs.extend(data)
+        return [offset, len(data)]
+
+    def value(self, value):
+        if isinstance(value, dict):
+            return {key: self.value(item) for key, item in value.items()}
+        if isinstance(value, list):
+            if _is_flat_rows(value):
+                return {TABLE_KEY: self.table(value)}
+            return [self.value(item) for item in value]
+        return value
+
+    def table(self, rows):
+        keys = []
+        seen = set()
+        for row in rows:
+            for key in row:
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+
+        columns = []
+        for key in keys:
+            cells = [row.get(key, _MISSING) for row in rows]
+            column = {"k": key}
+
+            states = bytes(0 if cell is _MISSING else 2 if cell is None else 1 for cell in cells)
+            if states.count(1) != len(states):
+                column["m"] = self._blob(states)
+            values = [cell for cell in cells if cell is not _MISSING and cell is not None]
+
+            if values and all(_is_number(value) and not (isinstance(value, int) and abs(value) >= _INT64_LIMIT)
+                              for value in values):
+                if all(isinstance(value, int) for value in values):
+                    column["t"] = "i"
+                    column["b"] = self._blob(_pack("q", _delta(values)))
+                else:
+                    decimals = _decimals([float(value) for value in values])
+                    if decimals is None:
+                        column["t"] = "d"
+                        column["b"] = self._blob(_pack("d", [float(value) for value in values]))
+                    else:
+                        scale = 10 ** decimals
+                        column["t"] = "x"
+                        column["s"] = decimals
+                        column["b"] = self._blob(_pack("q", _delta([round(value * scale) for value in values])))
+            else:
+                column["t"] = "j"
+                column["v"] = values
+            columns.append(column)
+
+        return {"n": len(rows), "c": columns}
+
+
+def encode_payload(payload):
+    """把上传请求体（含运动记录）编码为列式二进制"""
+    encoder = _Encoder()
+    meta = json.dumps(encoder.value(payload), ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+    body = struct.pack("<I", len(meta)) + meta + bytes(encoder.blobs)
+    return MAGIC + zlib.compress(body, 6)
@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+"""状态上报增量编码"""
+
+# 每次上报都必须携带的字段
+ALWAYS_FIELDS = ("device_id", "timestamp")
+
+
+def _changed_fields(snapshot, base):
+    return {
+        key: value for key, value in snapshot.items()
+        if key in ALWAYS_FIELDS or base.get(key) != value
+    }
+
+
+class StatusDeltaEncoder:
+    """
+    状态上报增量编码器
+
+    每次上报带递增序号 seq；服务端确认（HTTP 200）后该快照成为基线，
+    之后只发送相对基线变化的字段并带上 base 序号。请求丢失时基线不变，下一次增量
+    仍包含全部变化；服务端基线不一致时返回 409，调用 reset() 后改发完整快照。
+    每 full_every 次上报强制发送一次完整快照。服务端未声明支持增量时始终发送完整快照。
+    """
+
+    def __init__(self, full_every=60, enabled=True):
+        self.full_every = max(1, int(full_every))
+        self.enabled = enabled
+        self.server_supports = False
+        self.seq = 0
+        self._base = None          # 服务端已确认的快照
+        self._base_seq = None
+        self._since_full = 0
+        self._pending = None       # (序号, 快照, 是否完整)
+
+    def reset(self):
+        """丢弃基线，下一次发送完整快照"""
+        self._base = None
+        self._base_seq = None
+        self._pending = None
+
+    def encode(self, snapshot):
+        """编码一次单条上报"""
+        self.seq += 1
+        full = (not self.enabled or not self.server_supports
+                or self._base is None or self._since_full >= self.full_every)
+        if full:
+            payload = dict(snapshot)
+        else:
+            payload = _changed_fields(snapshot, self._base)
+            payload["delta"] = True
+            payload["base"] = self._base_seq
+        payload["seq"] = self.seq
+        self._pending = (self.seq, snapshot, full)
+        return payload
+
+    def ack(self, result):
+        """服务端确认最近一次 encode() 的上报"""
+        self.server_supports = bool((result or {}).get("delta_supported"))
+        if self._pending is None:
+            return
+        seq, snapshot, full = self._pending
+        self._pending = None
+        self._base = snapshot
+        self._base_seq = seq
+        self._since_full = 0 if full else self._since_full + 1
+
+    def encode_batch(self, snapshots):
+        """
+        编码批量上报：第一条完整，其余相对前一条增量
+
+        批量上报不更新服务端序号，之后的单条上报从完整快照重新开始。
+        """
+        self.reset()
+        if not self.enabled or not self.server_supports:
+            return [dict(snapshot) for snapshot in snapshots]
+
+        encoded = []
+        previous = None
+        for snapshot in snapshots:
+            if previous is None:
+                encoded.append(dict(snapshot))
+            else:
+                item = _changed_fields(snapshot, previous)
+                item["delta"] = True
+                encoded.append(item)
+            previous = snapshot
+        return encoded
@@ -0,0 +1,10 @@
+# -*- coding: UTF-8 -*-
+"""设备端测试：按 client/ 目录的平铺导入方式加载模块（cd client && python -m pytest tests）"""
+
+import os
+import sys
+
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if CLIENT_DIR not in sys.path:
+    sys.path.insert(0, CLIENT_DIR)
@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+"""OfflineManager.post_records 的列式编码回退"""
+
+import shutil
+import tempfile
+import unittest
+
+from services.offline_manager import OfflineManager
+from services.record_codec import CONTENT_TYPE
+
+PAYLOAD = {"device_id": "test", "records": [{"record_id": "r1", "series": [{"t": 0, "v": 1.5}]}]}
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeHttp:
+    """按顺序返回预设状态码，记录每次请求是否为列式编码"""
+
+    def __init__(self, *status_codes):
+        self.status_codes = list(status_codes)
+        self.requests = []
+
+    def post(self, path, data=None, json=None, headers=None, timeout=None):
+        binary = bool(headers) and headers.get("Content-Type") == CONTENT_TYPE
+        self.requests.append("binary" if binary else "json")
+        return FakeResponse(self.status_codes.pop(0))
+
+
+class PostRecordsTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _manager(self, http):
+        manager = OfflineManager("http://localhost:5000", cache_dir=self.cache_dir, http_client=http)
+        self.addCleanup(manager.close)
+        return manager
+
+    def test_server_error_keeps_binary_encoding(self):
+        http = FakeHttp(500, 200)
+        manager = self._manager(http)
+
+        self.assertEqual(manager.post_records("/api/sync_records", PAYLOAD).status_code, 500)
+        self.assertEqual(manager.post_records("/api/sync_records", PAYLOAD).status_code, 200)
+        self.assertEqual(http.requests, ["binary", "binary"])
+        self.assertTrue(manager.binary_records)
+
+    def test_unsupported_content_type_falls_back_to_json(self):
+        for status in (400, 404, 415):
+            http = FakeHttp(status, 200, 200)
+            manager = self._manager(http)
+
+            self.assertEqual(manager.post_records("/api/sync_records", PAYLOAD).status_code, 200)
+            self.assertFalse(manager.binary_records)
+            manager.post_records("/api/sync_records", PAYLOAD)
+            self.assertEqual(http.requests, ["binary", "json", "json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
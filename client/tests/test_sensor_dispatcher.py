@@ -0,0 +1,72 @@
+# -*- coding: UTF-8 -*-
+"""SensorDispatcher 计步开关"""
+
+import math
+import unittest
+
+from sensors.high_freq_sampler import CHANNELS, SampleRing
+from sensors.sensor_dispatcher import SensorDispatcher
+from sensors.step_detector import StepDetector
+
+SAMPLE_RATE = 50
+STEP_CONFIG = {"t_max": 0.008, "t_min": -0.010, "window_size": 3}
+
+
+class FakeSampler:
+    """只提供分发器用到的采样器接口"""
+
+    def __init__(self, capacity=1024):
+        self._ring = SampleRing(capacity)
+        self.capacity = capacity
+
+    def channel(self, name):
+        return self._ring.columns[name]
+
+    def samples_since(self, seq):
+        return self._ring.span(seq)
+
+    def walk(self, seconds, start=0.0, cadence=2.0, amplitude=0.05):
+        """写入垂直方向正弦振动（约 cadence 步/秒）"""
+        for i in range(int(seconds * SAMPLE_RATE)):
+            t = start + i / SAMPLE_RATE
+            linear_y = amplitude * math.sin(2 * math.pi * cadence * t)
+            sample = dict.fromkeys(CHANNELS, 0.0)
+            sample.update(timestamp=t, ay=-1.0 + linear_y, linear_y=linear_y, acc_mag=1.0)
+            self._ring.write([sample[name] for name in CHANNELS])
+
+
+class StepCountingTest(unittest.TestCase):
+    def setUp(self):
+        self.sampler = FakeSampler()
+        self.step_detector = StepDetector(STEP_CONFIG)
+        self.dispatcher = SensorDispatcher(self.sampler, step_detector=self.step_detector)
+
+    def test_sport_mode_counts_steps(self):
+        self.dispatcher.set_step_counting(True)
+        self.sampler.walk(5)
+        self.dispatcher.poll()
+
+        detected, _ = self.dispatcher.take_step()
+        self.assertTrue(detected)
+        self.assertGreater(self.step_detector.get_step_count(), 0)
+
+    def test_life_mode_polling_leaves_step_count_unchanged(self):
+        self.step_detector.set_count(42)
+        self.dispatcher.set_step_counting(False)
+        self.sampler.walk(5)
+        self.dispatcher.poll()
+
+        self.assertEqual(self.step_detector.get_step_count(), 42)
+        self.assertEqual(self.dispatcher.take_step(), (False, {}))
+
+    def test_switching_off_clears_latched_step(self):
+        self.dispatcher.set_step_counting(True)
+        self.sampler.walk(5)
+        self.dispatcher.poll()
+        self.dispatcher.set_step_counting(False)
+
+        self.assertEqual(self.dispatcher.take_step(), (False, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,6 +20,9 @@ ensure_project_root()
 from utils.logger import get_logger
 logger = get_logger('tools.data_analyzer')
 
+# 批量三阶段检测（需要 numpy），用于统计各阈值组合下状态机实际计出的步数
+from sensors.step_detector import StepDetector, NUMPY_AVAILABLE
+
 
 def load_data(csv_file):
     """加载CSV数据"""
@@ -251,8 +254,8 @@ def analyze_three_stage_detection(data, real_step_count=None):
         mean_val - 0.5 * std_val,
     ]
 
-    logger.info(f"\n  {'T_max':<10} {'T_min':<10} {'波峰候选':<12} {'过零条件':<12} {'波谷候选':<12}")
-    logger.info("  " + "-" * 60)
+    logger.info(f"\n  {'T_max':<10} {'T_min':<10} {'波峰候选':<12} {'过零条件':<12} {'波谷候选':<12} {'步数':<8}")
+    logger.info("  " + "-" * 70)
 
     results = []
 
@@ -283,15 +286,23 @@ def analyze_three_stage_detection(data, real_step_count=None):
                 if all(v < t_min for v in window) and all(mid_val <= v for j, v in enumerate(window) if j != mid_idx):
                     valley_candidates += 1
 
+            # 三阶段状态机实际计出的步数
+            steps = None
+            if NUMPY_AVAILABLE:
+                detector = StepDetector({"t_max": t_max, "t_min": t_min, "window_size": window_size})
+                steps = detector.detect_batch(linear_y)['step_count']
+
             results.append({
                 't_max': t_max,
                 't_min': t_min,
                 'peaks': peak_candidates,
                 'zero': zero_ok,
-                'valleys': valley_candidates
+                'valleys': valley_candidates,
+                'steps': steps
             })
 
-            logger.info(f"  {t_max:<10.4f} {t_min:<10.4f} {peak_candidates:<12} {zero_ok:<12} {valley_candidates:<12}")
+            steps_text = steps if steps is not None else '-'
+            logger.info(f"  {t_max:<10.4f} {t_min:<10.4f} {peak_candidates:<12} {zero_ok:<12} {valley_candidates:<12} {steps_text:<8}")
 
     return results
 
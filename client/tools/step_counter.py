@@ -10,6 +10,7 @@
 import csv
 import os
 import math
+import time
 import argparse
 
 from common import ensure_project_root
@@ -84,7 +85,8 @@ def run_step_detection(csv_file):
         "t_min": step_config.get("t_min", -0.06),
         "window_size": step_config.get("window_size", 7),
     }
-    detector = StepDetector(detector_config)
+    # 需要每个样本的失败原因统计
+    detector = StepDetector(detector_config, detailed_records=True)
 
     # 设置重力去除参数
     detector.gravity_remover.set_parameters(
@@ -157,6 +159,51 @@ def run_step_detection(csv_file):
     return step_count
 
 
+def run_batch_step_detection(csv_file):
+    """
+    批量步数检测（需要 numpy）
+
+    直接使用 CSV 中预处理后的 linear_y，结果与逐样本 add_sample(..., already_linear=True) 完全一致，
+    适合对长时间记录做回归检查
+    """
+    data = load_data(csv_file)
+    if not data:
+        logger.error(f"无法加载数据: {csv_file}")
+        return
+
+    from sensors.step_detector import StepDetector, NUMPY_AVAILABLE
+    if not NUMPY_AVAILABLE:
+        logger.error("批量检测需要 numpy")
+        return
+
+    step_config = config.STEP_CONFIG
+    detector = StepDetector({
+        "t_max": step_config.get("t_max", 0.12),
+        "t_min": step_config.get("t_min", -0.06),
+        "window_size": step_config.get("window_size", 7),
+    })
+
+    start = time.perf_counter()
+    result = detector.detect_batch(
+        [d['linear_y'] for d in data],
+        timestamps=[d['timestamp'] for d in data]
+    )
+    elapsed = time.perf_counter() - start
+
+    step_count = result['step_count']
+    logger.info(f"[批量检测结果] {len(data)} 个样本，耗时 {elapsed*1000:.1f} ms")
+    logger.info(f"检测到的步数: {step_count}")
+
+    peak_times = result['peak_time']
+    if len(peak_times) > 1:
+        avg_interval = (peak_times[-1] - peak_times[0]) / (len(peak_times) - 1)
+        if avg_interval > 0:
+            logger.info(f"平均步频: {60.0 / avg_interval:.1f} 步/分钟")
+            logger.info(f"平均步间隔: {avg_interval*1000:.0f} ms")
+
+    return step_count
+
+
 def find_latest_data_file():
     """查找最新的数据文件"""
     search_dirs = ['data/gravity', 'data']
@@ -178,6 +225,8 @@ def find_latest_data_file():
 def main():
     parser = argparse.ArgumentParser(description='步数检测 - 使用主程序模块')
     parser.add_argument('file', nargs='?', help='CSV数据文件路径（默认自动查找最新）')
+    parser.add_argument('--batch', action='store_true',
+                        help='使用预处理后的 linear_y 批量检测（需要 numpy）')
 
     args = parser.parse_args()
 
@@ -194,7 +243,10 @@ def main():
         return
 
     logger.info(f"分析文件: {input_file}")
-    run_step_detection(input_file)
+    if args.batch:
+        run_batch_step_detection(input_file)
+    else:
+        run_step_detection(input_file)
 
 
 if __name__ == '__main__':
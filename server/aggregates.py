@@ -0,0 +1,181 @@
+# -*- coding: UTF-8 -*-
+"""
+历史数据聚合索引
+
+每台设备按日期维护前缀和：prefix[i] 为最早一天到第 i 天的累计值。
+- 终身合计 = 最后一个前缀和
+- 最近 N 天合计 = 两个前缀和相减（二分定位日期区间）
+状态上报只会改写今天（最后一天），更新为 O(1)；补写更早的日期时才重算其后的前缀和。
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+
+AGGREGATE_FIELDS = ("step", "carbon_reduce", "sport_time")
+
+
+def _day_ordinal(date):
+    if isinstance(date, str):
+        date = datetime.strptime(date, "%Y-%m-%d")
+    return date.toordinal()
+
+
+def _entry_values(entry):
+    values = []
+    for field in AGGREGATE_FIELDS:
+        try:
+            values.append(float(entry.get(field, 0) or 0))
+        except Exception:
+            values.append(0.0)
+    return tuple(values)
+
+
+def _add(a, b):
+    return tuple(x + y for x, y in zip(a, b))
+
+
+ZERO = (0.0,) * len(AGGREGATE_FIELDS)
+
+
+class DailyAggregates:
+    """单台设备的逐日前缀和"""
+
+    def __init__(self):
+        self._days = []        # 日序号，升序
+        self._values = []      # 每日统计值
+        self._prefix = []      # 前缀和
+        self._positions = {}   # 日序号 -> 下标
+        self._lock = threading.Lock()
+
+    def set_day(self, date, entry):
+        """写入某天的统计（覆盖旧值）"""
+        if not isinstance(entry, dict):
+            return
+
+        ordinal = _day_ordinal(date)
+        values = _entry_values(entry)
+
+        with self._lock:
+            pos = self._positions.get(ordinal)
+            if pos is None:
+                if self._days and ordinal < self._days[-1]:
+                    # 补写更早的日期：插入后重建下标和其后的前缀和
+                    insort(self._days, ordinal)
+                    pos = self._days.index(ordinal)
+                    self._values.insert(pos, values)
+                    self._prefix.insert(pos, ZERO)
+                    for i in range(pos, len(self._days)):
+                        self._positions[self._days[i]] = i
+                    self._rebuild_prefix(pos)
+                    return
+
+                pos = len(self._days)
+                self._days.append(ordinal)
+                self._values.append(values)
+                self._prefix.append(ZERO)
+                self._positions[ordinal] = pos
+            else:
+                self._values[pos] = values
+
+            self._rebuild_prefix(pos)
+
+    def _rebuild_prefix(self, start):
+        """从 start 开始重算前缀和；start 为最后一天时只算一项"""
+        running = self._prefix[start - 1] if start > 0 else ZERO
+        for i in range(start, len(self._days)):
+            running = _add(running, self._values[i])
+            self._prefix[i] = running
+
+    def total(self, field):
+        """终身合计"""
+        column = AGGREGATE_FIELDS.index(field)
+        with self._lock:
+            return self._prefix[-1][column] if self._prefix else 0
+
+    def range_sum(self, field, first_date, last_date):
+        """[first_date, last_date] 区间合计"""
+        column = AGGREGATE_FIELDS.index(field)
+        with self._lock:
+            lo = bisect_left(self._days, _day_ordinal(first_date))
+            hi = bisect_right(self._days, _day_ordinal(last_date))
+            if hi <= lo:
+                return 0
+            upper = self._prefix[hi - 1][column]
+            lower = self._prefix[lo - 1][column] if lo > 0 else 0
+            return upper - lower
+
+
+class AggregateIndex:
+    """设备ID -> DailyAggregates"""
+
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def _device(self, device_id):
+        aggregates = self._devices.get(device_id)
+        if aggregates is None:
+            with self._lock:
+                aggregates = self._devices.setdefault(device_id, DailyAggregates())
+        return aggregates
+
+    def load(self, storage):
+        """从持久化的历史数据重建索引（启动时调用一次）"""
+        devices = {}
+        for device_id in storage.list_history_devices():
+            aggregates = DailyAggregates()
+            for date, entry in storage.get_all_history(device_id).items():
+                try:
+                    aggregates.set_day(date, entry)
+                except ValueError:
+                    continue
+            devices[device_id] = aggregates
+        with self._lock:
+            self._devices = devices
+
+    def update(self, device_id, date, entry):
+        """状态上报写入今日数据时同步更新"""
+        self._device(device_id).set_day(date, entry)
+
+    def total(self, device_id, field):
+        aggregates = self._devices.get(device_id)
+        return aggregates.total(field) if aggregates is not None else 0
+
+    def sum_days(self, device_id, field, days, today=None):
+        """最近 days 天（含今天）的合计"""
+        if today is None:
+            today = datetime.now()
+        aggregates = self._devices.get(device_id)
+        if aggregates is None:
+            return 0
+        first = today - timedelta(days=days - 1)
+        return aggregates.range_sum(field, first, today)
+
+
+class StorageAggregates:
+    """
+    直接由存储后端求和（SqliteStorage 走索引）
+
+    多工作进程部署时各进程的内存索引无法同步，改用此实现，接口与 AggregateIndex 一致。
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def load(self, storage):
+        pass
+
+    def update(self, device_id, date, entry):
+        pass
+
+    def total(self, device_id, field):
+        return self.storage.sum_history(field, device_id=device_id)
+
+    def sum_days(self, device_id, field, days, today=None):
+        if today is None:
+            today = datetime.now()
+        first = today - timedelta(days=days - 1)
+        return self.storage.sum_history(
+            field, first.strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d"), device_id
+        )
@@ -0,0 +1,112 @@
+# -*- coding: UTF-8 -*-
+"""
+响应压缩
+
+按 Accept-Encoding 协商 br（安装了 brotli 时）或 gzip，只压缩文本类响应。
+带 ETag 的响应（静态页面、缓存的只读接口、运动记录详情）内容由 ETag 唯一确定，
+压缩结果按 (ETag, 编码) 缓存，同一内容只压缩一次。
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+}
+
+
+def compress_body(body, encoding, level=6):
+    if encoding == "br":
+        return brotli.compress(body, quality=min(level + 1, 11))
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class Compressor:
+    """Flask 响应压缩（after_request 钩子）"""
+
+    def __init__(self, min_size=512, level=6, max_bytes=8 * 1024 * 1024):
+        self.min_size = min_size
+        self.level = level
+        self.max_bytes = max_bytes
+        self._variants = OrderedDict()   # (etag, 编码) -> 压缩后内容
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def choose_encoding(self, accept_encodings):
+        if BROTLI_AVAILABLE and accept_encodings["br"]:
+            return "br"
+        if accept_encodings["gzip"]:
+            return "gzip"
+        return None
+
+    def after_request(self, response):
+        response.vary.add("Accept-Encoding")
+
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        etag, _ = response.get_etag()
+        compressed = self._compress(body, encoding, etag)
+        if len(compressed) >= len(body):
+            return response
+
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            # 不同编码的响应字节不同，改为弱 ETag，If-None-Match 按弱比较仍能命中
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress(self, body, encoding, etag):
+        if not etag:
+            return compress_body(body, encoding, self.level)
+
+        key = (etag, encoding)
+        with self._lock:
+            cached = self._variants.get(key)
+            if cached is not None:
+                self._variants.move_to_end(key)
+                return cached
+
+        compressed = compress_body(body, encoding, self.level)
+        if len(compressed) > self.max_bytes:
+            return compressed
+
+        with self._lock:
+            if key not in self._variants:
+                self._variants[key] = compressed
+                self._size += len(compressed)
+                while self._size > self.max_bytes:
+                    _, evicted = self._variants.popitem(last=False)
+                    self._size -= len(evicted)
+        return compressed
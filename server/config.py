@@ -0,0 +1,36 @@
+# -*- coding: UTF-8 -*-
+"""
+服务端配置文件
+包含数据目录、存储后端、持久化参数等
+"""
+
+import os
+
+# ==================== 数据目录 ====================
+DATA_DIR = os.environ.get(
+    "SMART_BELT_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"),
+)
+
+# ==================== 存储后端 ====================
+# json: data/*.json 文件（默认）
+# sqlite: data/smart_belt.db，按日期/记录时间/设备建索引
+STORAGE_BACKEND = os.environ.get("SMART_BELT_STORAGE", "json")
+SQLITE_PATH = os.path.join(DATA_DIR, "smart_belt.db")
+
+# ==================== 运行时状态 ====================
+# local: 设备状态、命令队列、事件通知保存在进程内（开发服务器 server.py，默认）
+# sqlite: 保存在 SQLITE_PATH 中，多个工作进程共享（生产部署 wsgi.py）
+STATE_BACKEND = os.environ.get("SMART_BELT_STATE", "local")
+STATE_POLL_INTERVAL = 0.2                # sqlite 状态下长轮询/SSE 查询间隔(秒)
+
+# ==================== 持久化参数 ====================
+SAVE_INTERVAL = 30                       # JSON后端历史数据最长合并间隔(秒)
+WRITE_BEHIND_DELAY = 0.5                 # 紧急记录/运动记录/设置变更后的最长落盘延迟(秒)
+SPORT_RECORDS_COMPACT_THRESHOLD = 200    # 运动记录日志累计多少条后合并进快照
+
+# ==================== 设备上报 ====================
+STATUS_BATCH_MAX = 3600                  # /api/status/batch 单次最多快照数（1 秒一条约 1 小时）
+
+# ==================== 运动统计参数 ====================
+CARBON_PER_STEP = 0.03
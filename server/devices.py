@@ -0,0 +1,225 @@
+# -*- coding: UTF-8 -*-
+"""
+设备状态分区
+
+每台设备一个 DeviceState：实时状态、步数基线、今日计数日期。
+设备注册表负责状态的原子读写、命令队列和变更通知，不同设备互不阻塞：
+- DeviceRegistry: 进程内实现，每台设备各自持有锁、命令队列和事件中心（默认）
+- SqliteDeviceRegistry (shared_state.py): 多个工作进程共享的实现，接口一致
+"""
+
+import copy
+import re
+import threading
+import time
+from datetime import datetime
+
+from events import EventHub
+from storage import DEFAULT_DEVICE_ID
+
+DEVICE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+
+def normalize_device_id(value):
+    """校验设备ID，非法或为空时返回 None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not DEVICE_ID_PATTERN.match(value):
+        return None
+    return value
+
+
+def default_device_status():
+    return {
+        "mode": 0,
+        "temperature": 25.0,
+        "humidity": 50.0,
+        "brightness": 100,
+        "posture": "unknown",
+        "pace": 0,
+        "pace_str": "--'--\"",
+        "step": 0,
+        "carbon_reduce": 0,
+        "emergency": False,
+        "sport_time_today": 0,
+        "activity_hours": [],
+        "last_update": None,
+        "online": False,
+        "sitting_duration": 0,
+        "sport_duration": 0,
+        "message_showing": False
+    }
+
+
+class DeviceState:
+    """单台设备的状态数据"""
+
+    def __init__(self, device_id, now=None):
+        if now is None:
+            now = datetime.now()
+
+        self.device_id = device_id
+        self.status = default_device_status()
+        self.last_step = 0                          # 上次上报的步数
+        self.stats_date = now.strftime("%Y-%m-%d")  # 今日计数器所属日期
+        self.status_seq = None                      # 最近一次上报的序号（增量上报的基线）
+
+    def rollover(self, now=None):
+        """跨天时重置今日计数器"""
+        if now is None:
+            now = datetime.now()
+
+        today = now.strftime("%Y-%m-%d")
+        if today != self.stats_date:
+            self.status["step"] = 0
+            self.status["carbon_reduce"] = 0
+            self.stats_date = today
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "last_step": self.last_step,
+            "stats_date": self.stats_date,
+            "status_seq": self.status_seq,
+        }
+
+    @classmethod
+    def from_dict(cls, device_id, data):
+        state = cls(device_id)
+        state.status.update(data.get("status") or {})
+        state.last_step = data.get("last_step", 0)
+        state.stats_date = data.get("stats_date", state.stats_date)
+        state.status_seq = data.get("status_seq")
+        return state
+
+
+class _LocalDevice:
+    """进程内设备分区：状态 + 锁 + 命令队列 + 事件中心"""
+
+    def __init__(self, device_id):
+        self.state = DeviceState(device_id)
+        self.commands = []
+        self.lock = threading.Lock()
+        self.command_ready = threading.Condition(self.lock)  # 长轮询等待新命令
+        self.events = EventHub()                    # status / emergency / sport_records / settings
+
+
+class DeviceRegistry:
+    """
+    进程内设备注册表：只在首次出现新设备时加全局锁
+
+    只有设备上报（update / 命令下发 / 事件发布）会登记新设备；
+    只读请求（状态查询、SSE、命令轮询）遇到未知设备时不登记，避免随机设备ID占满内存。
+    """
+
+    def __init__(self, on_create=None):
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._created = threading.Condition(self._lock)  # 新设备登记时唤醒等待中的只读请求
+        self._on_create = on_create
+        self.primary_id = DEFAULT_DEVICE_ID  # 最近一次上报状态的设备，页面未指定设备时使用
+
+    def _device(self, device_id):
+        device = self._devices.get(device_id)
+        if device is not None:
+            return device
+
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is None:
+                device = _LocalDevice(device_id)
+                if self._on_create:
+                    self._on_create(device.state)
+                self._devices[device_id] = device
+                self._created.notify_all()
+        return device
+
+    def _wait_device(self, device_id, timeout):
+        """等待设备被登记，超时返回 None"""
+        with self._created:
+            self._created.wait_for(lambda: device_id in self._devices, timeout)
+            return self._devices.get(device_id)
+
+    # ---------- 状态 ----------
+    def update(self, device_id, fn):
+        """在设备锁内执行 fn(state) 修改状态，返回 fn 的返回值"""
+        device = self._device(device_id)
+        with device.lock:
+            return fn(device.state)
+
+    def read(self, device_id, fn):
+        """在设备锁内执行 fn(state) 读取状态（fn 可做不需要持久化的修正，如在线检测）；未知设备读取默认状态"""
+        device = self._devices.get(device_id)
+        if device is None:
+            state = DeviceState(device_id)
+            if self._on_create:
+                self._on_create(state)
+            return fn(state)
+        with device.lock:
+            return fn(device.state)
+
+    def touch(self, device_id):
+        """记录最近活跃设备"""
+        self.primary_id = device_id
+
+    def device_ids(self):
+        with self._lock:
+            return list(self._devices.keys())
+
+    def snapshots(self):
+        """所有设备状态的副本"""
+        result = []
+        for device_id in self.device_ids():
+            result.append(self.read(device_id, copy.deepcopy))
+        return result
+
+    # ---------- 命令队列 ----------
+    def push_command(self, device_id, command):
+        """加入命令队列并唤醒长轮询"""
+        device = self._device(device_id)
+        with device.command_ready:
+            device.commands.append(command)
+            device.command_ready.notify_all()
+
+    def pop_commands(self, device_id, timeout=0):
+        """取出全部待执行命令；timeout > 0 时队列为空会等待新命令"""
+        device = self._devices.get(device_id)
+        if device is None:
+            if timeout <= 0:
+                return []
+            deadline = time.monotonic() + timeout
+            device = self._wait_device(device_id, timeout)
+            if device is None:
+                return []
+            timeout = max(0, deadline - time.monotonic())
+        with device.command_ready:
+            if timeout > 0:
+                device.command_ready.wait_for(lambda: device.commands, timeout)
+            commands = device.commands.copy()
+            device.commands.clear()
+        return commands
+
+    # ---------- 变更通知 ----------
+    def publish(self, device_id, topic):
+        return self._device(device_id).events.publish(topic)
+
+    def broadcast(self, topic):
+        """全局数据变化（如设置）通知所有设备的订阅者"""
+        for device_id in self.device_ids():
+            self.publish(device_id, topic)
+
+    def version(self, device_id):
+        device = self._devices.get(device_id)
+        return device.events.version if device is not None else 0
+
+    def wait(self, device_id, since, timeout=None):
+        device = self._devices.get(device_id)
+        if device is None:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            device = self._wait_device(device_id, timeout)
+            if device is None:
+                return since, set()
+            if deadline is not None:
+                timeout = max(0, deadline - time.monotonic())
+        return device.events.wait(since, timeout)
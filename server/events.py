@@ -0,0 +1,53 @@
+# -*- coding: UTF-8 -*-
+"""
+服务端变更通知
+
+写入方 publish(topic) 递增版本号并唤醒等待者；
+SSE 推送和长轮询通过 wait(since, timeout) 等待版本变化，不再按固定间隔轮询。
+"""
+
+import threading
+from collections import deque
+
+
+class EventHub:
+    """版本号 + 条件变量的轻量事件中心"""
+
+    def __init__(self, backlog=256):
+        self._cond = threading.Condition()
+        self._version = 0
+        self._events = deque(maxlen=backlog)  # (版本号, 话题)
+        self._topics = set()
+
+    @property
+    def version(self):
+        with self._cond:
+            return self._version
+
+    def publish(self, topic):
+        """发布一次变更，返回新版本号"""
+        with self._cond:
+            self._version += 1
+            self._events.append((self._version, topic))
+            self._topics.add(topic)
+            self._cond.notify_all()
+            return self._version
+
+    def wait(self, since, timeout=None):
+        """
+        等待 since 之后的变更
+
+        返回: (最新版本号, 变更话题集合)，超时未变化时话题集合为空
+        等待者落后太多（事件已滚出缓冲）时返回全部已知话题。
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > since, timeout)
+
+            if self._version <= since:
+                return self._version, set()
+
+            if self._events and self._events[0][0] > since + 1:
+                return self._version, set(self._topics)
+
+            topics = {topic for version, topic in self._events if version > since}
+            return self._version, topics
@@ -0,0 +1,146 @@
+# -*- coding: UTF-8 -*-
+"""
+状态上报压测：比较不同工作进程数下 POST /api/status 的吞吐量
+
+每组工作进程数启动一个 gunicorn（wsgi.py，临时数据目录），
+由多个客户端进程各自保持长连接，轮流以不同设备ID上报状态，统计每秒请求数。
+
+用法:
+    cd server
+    python loadtest.py                       # 默认比较 1 / 2 / 4 个工作进程
+    python loadtest.py --workers 1 2 4 8 --clients 16 --duration 10
+
+吞吐量能否随工作进程数增长取决于 CPU 核数：单核机器上多个进程只会互相抢占。
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HOST = "127.0.0.1"
+
+
+def wait_ready(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=1)
+            conn.request("GET", "/api/settings")
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+    return False
+
+
+def client_worker(port, client_index, devices, duration, result_queue):
+    """单个客户端：长连接循环上报，返回 (成功数, 失败数)"""
+    conn = http.client.HTTPConnection(HOST, port, timeout=10)
+    headers = {"Content-Type": "application/json"}
+    ok = failed = 0
+    step = 0
+    deadline = time.monotonic() + duration
+
+    while time.monotonic() < deadline:
+        step += 1
+        payload = {
+            "device_id": f"load-{(client_index + step) % devices}",
+            "mode": 1,
+            "step": step,
+            "temperature": 25.0,
+            "humidity": 50.0,
+            "posture": "standing",
+        }
+        try:
+            conn.request("POST", "/api/status", json.dumps(payload), headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+            else:
+                failed += 1
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection(HOST, port, timeout=10)
+
+    conn.close()
+    result_queue.put((ok, failed))
+
+
+def run_round(workers, clients, devices, duration, port, threads):
+    data_dir = tempfile.mkdtemp(prefix="smart_belt_load_")
+    env = dict(os.environ, SMART_BELT_DATA_DIR=data_dir,
+               SMART_BELT_STORAGE="sqlite", SMART_BELT_STATE="sqlite")
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "-w", str(workers), "-k", "gthread", "--threads", str(threads),
+        "-b", f"{HOST}:{port}", "--log-level", "warning",
+        "wsgi:app",
+    ]
+    server_dir = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(command, cwd=server_dir, env=env,
+                               stdout=subprocess.DEVNULL)
+    try:
+        if not wait_ready(port):
+            print(f"[压测] {workers} 个工作进程启动超时")
+            return None
+
+        result_queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=client_worker,
+                                    args=(port, i, devices, duration, result_queue))
+            for i in range(clients)
+        ]
+        started = time.monotonic()
+        for proc in procs:
+            proc.start()
+        results = [result_queue.get() for _ in procs]
+        elapsed = time.monotonic() - started
+        for proc in procs:
+            proc.join()
+
+        ok = sum(r[0] for r in results)
+        failed = sum(r[1] for r in results)
+        return ok / elapsed, failed
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST /api/status 吞吐量压测")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端进程数")
+    parser.add_argument("--devices", type=int, default=32, help="模拟设备数")
+    parser.add_argument("--duration", type=float, default=5.0, help="每组持续秒数")
+    parser.add_argument("--threads", type=int, default=4, help="每个工作进程的线程数")
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+
+    print(f"CPU 核数: {os.cpu_count()}  客户端: {args.clients}  设备: {args.devices}")
+    print(f"{'工作进程':>8} {'请求/秒':>10} {'失败':>6}")
+    for workers in args.workers:
+        result = run_round(workers, args.clients, args.devices,
+                           args.duration, args.port, args.threads)
+        if result is None:
+            continue
+        rate, failed = result
+        print(f"{workers:>8} {rate:>10.1f} {failed:>6}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+# -*- coding: UTF-8 -*-
+"""
+一次性迁移脚本：data/*.json -> SQLite
+
+用法:
+    cd server
+    python migrate_to_sqlite.py
+    SMART_BELT_STORAGE=sqlite python server.py
+"""
+
+import sys
+
+import config
+from storage import migrate_json_to_sqlite
+
+
+def main():
+    print(f"源目录: {config.DATA_DIR}")
+    print(f"目标库: {config.SQLITE_PATH}")
+    try:
+        counts = migrate_json_to_sqlite(config.DATA_DIR, config.SQLITE_PATH)
+    except Exception as e:
+        print(f"[迁移] 失败: {e}")
+        return 1
+
+    print(f"[迁移] 历史数据 {counts['history']} 天")
+    print(f"[迁移] 紧急记录 {counts['emergency']} 条")
+    print(f"[迁移] 运动记录 {counts['sport_records']} 条")
+    print("[迁移] 完成，原 JSON 文件保持不变")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# -*- coding: UTF-8 -*-
+"""
+后台持久化线程
+
+写接口只修改内存并调用 mark_dirty(dataset)；写线程为每个数据集记录首次变脏的时间，
+到期后只写变化的数据集。同一数据集在到期前的多次变更合并为一次写入，
+请求处理线程不再等待磁盘 I/O。停止时写出全部脏数据。
+"""
+
+import threading
+import time
+
+
+class BackgroundWriter:
+    """按数据集合并写入的后台写线程"""
+
+    def __init__(self, storage, delays=None, default_delay=0.5):
+        self.storage = storage
+        self.delays = dict(delays or {})
+        self.default_delay = default_delay
+        self._dirty = {}    # 数据集 -> 截止时间
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.storage.attach_writer(self.mark_dirty)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, dataset):
+        """标记数据集待写入；已标记的数据集不推迟截止时间，保证最长落盘延迟"""
+        with self._cond:
+            if dataset not in self._dirty:
+                self._dirty[dataset] = time.monotonic() + self.delays.get(dataset, self.default_delay)
+                self._cond.notify()
+
+    def _take_due(self):
+        """等待到有数据集到期，返回到期的数据集；停止后返回全部剩余数据集"""
+        with self._cond:
+            while True:
+                if not self._running:
+                    due = list(self._dirty)
+                    self._dirty.clear()
+                    return due
+
+                now = time.monotonic()
+                due = [dataset for dataset, deadline in self._dirty.items() if deadline <= now]
+                if due:
+                    for dataset in due:
+                        del self._dirty[dataset]
+                    return due
+
+                timeout = min(self._dirty.values()) - now if self._dirty else None
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._write(self._take_due())
+            with self._cond:
+                if not self._running and not self._dirty:
+                    return
+
+    def _write(self, datasets):
+        if not datasets:
+            return
+        try:
+            self.storage.flush(datasets)
+        except Exception as e:
+            print(f"[数据] 保存失败 {datasets}: {e}")
+
+    def flush(self):
+        """立即写出全部脏数据集（调用线程中执行）"""
+        with self._cond:
+            datasets = list(self._dirty)
+            self._dirty.clear()
+        self._write(datasets)
+
+    def stop(self, timeout=10):
+        """停止写线程并写出剩余数据（退出钩子）"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+        # 兜底：线程未能按时退出或停止后仍有写入时，在当前线程写出剩余数据
+        self.flush()
+        print("[数据] 已保存")
@@ -0,0 +1,128 @@
+# -*- coding: UTF-8 -*-
+"""
+运动记录列式二进制解码
+
+设备端（client/services/record_codec.py）把 series / gnss_track 等平铺字典列表按列编码后上传，
+格式: MAGIC + zlib(uint32 元数据长度 + 元数据 JSON + 各列二进制数据)
+元数据中 {"$table": {"n": 行数, "c": [列, ...]}} 表示一个列式表，列的字段：
+- k: 键名；m: 掩码 [偏移, 长度]（0 缺失，1 有值，2 None，省略表示全部有值）
+- t: 列类型 i 差分 int64 / x 按 10^s 放大的差分 int64 / d float64 / j JSON 列表 v
+- b: 数值列的二进制数据 [偏移, 长度]（小端）
+
+元数据来自请求，分配行之前先校验：行数不超过 MAX_TABLE_ROWS 且与各列数据、掩码长度一致，
+s 为 0..MAX_SCALE_DIGITS 的整数。
+"""
+
+from array import array
+from itertools import accumulate
+import json
+import struct
+import sys
+import zlib
+
+MAGIC = b"SBC1"
+CONTENT_TYPE = "application/x-smart-belt-columnar"
+TABLE_KEY = "$table"
+MAX_PAYLOAD_BYTES = 64 * 1024 * 1024    # 解压后上限
+MAX_TABLE_ROWS = 200000                 # 单个列式表的最大行数
+MAX_SCALE_DIGITS = 7                    # x 列的最大小数位数（与设备端 MAX_DECIMALS 一致）
+
+
+class CodecError(ValueError):
+    """二进制请求体格式错误"""
+
+
+def _unpack(typecode, blobs, ref):
+    offset, length = ref
+    values = array(typecode)
+    values.frombytes(blobs[offset:offset + length])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _decode_column(column, blobs):
+    kind = column.get("t")
+    if kind == "i":
+        return list(accumulate(_unpack("q", blobs, column["b"])))
+    if kind == "x":
+        digits = column.get("s", 0)
+        if not _is_int(digits) or not 0 <= digits <= MAX_SCALE_DIGITS:
+            raise CodecError(f"列 {column.get('k')} 的小数位数无效: {digits!r}")
+        scale = 10 ** digits
+        return [value / scale for value in accumulate(_unpack("q", blobs, column["b"]))]
+    if kind == "d":
+        return list(_unpack("d", blobs, column["b"]))
+    if kind == "j":
+        return list(column.get("v", []))
+    raise CodecError(f"未知列类型: {kind}")
+
+
+def _decode_table(table, blobs):
+    count = table["n"]
+    if not _is_int(count) or not 0 <= count <= MAX_TABLE_ROWS:
+        raise CodecError(f"列式表行数无效: {count!r}")
+
+    # 先解码并核对全部列，再分配行
+    columns = []
+    for column in table["c"]:
+        key = column["k"]
+        values = _decode_column(column, blobs)
+        states = None
+        if "m" in column:
+            offset, length = column["m"]
+            states = blobs[offset:offset + length]
+            if len(states) != count:
+                raise CodecError(f"列 {key} 掩码长度错误")
+            expected = states.count(1)
+        else:
+            expected = count
+        if len(values) != expected:
+            raise CodecError(f"列 {key} 数据长度错误")
+        columns.append((key, iter(values), states))
+
+    rows = [{} for _ in range(count)]
+    for key, values, states in columns:
+        if states is not None:
+            for row, state in zip(rows, states):
+                if state == 1:
+                    row[key] = next(values)
+                elif state == 2:
+                    row[key] = None
+        else:
+            for row in rows:
+                row[key] = next(values)
+    return rows
+
+
+def _decode_value(value, blobs):
+    if isinstance(value, dict):
+        if TABLE_KEY in value and len(value) == 1:
+            return _decode_table(value[TABLE_KEY], blobs)
+        return {key: _decode_value(item, blobs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_value(item, blobs) for item in value]
+    return value
+
+
+def decode_payload(data):
+    """解码列式二进制请求体，返回与 JSON 请求体相同的结构"""
+    if not data.startswith(MAGIC):
+        raise CodecError("不是列式编码的请求体")
+    try:
+        decompressor = zlib.decompressobj()
+        body = decompressor.decompress(data[len(MAGIC):], MAX_PAYLOAD_BYTES)
+        if decompressor.unconsumed_tail:
+            raise CodecError("请求体过大")
+        (meta_length,) = struct.unpack_from("<I", body)
+        meta = json.loads(body[4:4 + meta_length].decode("utf-8"))
+        blobs = body[4 + meta_length:]
+        return _decode_value(meta, blobs)
+    except CodecError:
+        raise
+    except (zlib.error, struct.error, ValueError, KeyError, TypeError, StopIteration) as e:
+        raise CodecError(f"列式请求体解析失败: {e}")
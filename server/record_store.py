@@ -0,0 +1,311 @@
+# -*- coding: UTF-8 -*-
+"""
+运动记录追加写存储
+
+存储结构:
+- 摘要快照 (sport_records.json): {"records": [...], "detail_refs": [...]}
+- 摘要日志 (sport_records.log): 每行一个 JSON 帧 {"seq": n, "record": {...}, "detail": [offset, length]}
+- 详情日志 (sport_record_details.log): 每行一条详情（series / gnss_track），按偏移量随机读取
+
+写入一条记录只追加一行详情和一行摘要，代价与单条记录大小相关，与历史总量无关；
+摘要常驻内存，详情按需读取；摘要日志累计到一定条数后合并进快照（压缩），
+加载时重放日志并截断损坏的尾部。
+
+write_behind 为真时 extend() 只更新内存，由后台写线程调用 flush() 落盘；
+尚未落盘的详情从内存读取，快照只包含已落盘的记录。
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from sport_records import normalize_sport_record, split_sport_record
+
+
+def _dumps_line(data):
+    return (json.dumps(data, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+class SportRecordStore:
+    """运动记录存储：摘要快照 + 摘要日志 + 详情日志"""
+
+    def __init__(self, snapshot_path, log_path, detail_path,
+                 compact_threshold=200, fsync=True, detail_cache_size=16, write_behind=False):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.detail_path = detail_path
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self.detail_cache_size = detail_cache_size
+        self.write_behind = write_behind
+
+        self.records = []       # 摘要
+        self.detail_refs = []   # 详情位置 [offset, length]，无详情或未落盘为 None
+        self._flushed = 0       # 已写入快照/日志的记录条数
+        self._pending_details = {}  # 未落盘记录的详情: 序号 -> 详情
+        self._log_entries = 0
+        self._detail_cache = OrderedDict()
+        self._lock = threading.RLock()      # 保护内存数据
+        self._io_lock = threading.RLock()   # 串行化落盘与压缩，文件 I/O 不持有 _lock
+
+    # ==================== 加载与恢复 ====================
+    def load(self):
+        """加载快照并重放日志，返回摘要列表"""
+        with self._lock:
+            records, detail_refs, legacy = self._load_snapshot()
+            snapshot_count = len(records)
+            log_entries, recovered = self._replay_log(records, detail_refs, legacy, snapshot_count)
+
+            self.records = records
+            self.detail_refs = detail_refs
+            self._flushed = len(records)
+            self._pending_details = {}
+            self._log_entries = log_entries
+            self._detail_cache.clear()
+
+            if recovered:
+                print("[数据] 运动记录日志尾部损坏，已截断恢复")
+
+            migrated = self._migrate_legacy(legacy)
+            if migrated:
+                print(f"[数据] 旧版运动记录已拆分为摘要/详情: {migrated}条")
+            if migrated or log_entries >= self.compact_threshold:
+                self.compact()
+            return self.records
+
+    def _load_snapshot(self):
+        """
+        读取快照
+
+        返回: (摘要列表, 详情位置列表, 旧版记录序号集合)
+        旧版纯列表快照中的记录仍带有逐点数据，需要迁移。
+        """
+        if not os.path.exists(self.snapshot_path):
+            return [], [], set()
+
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[数据] 运动记录快照读取失败: {e}")
+            return [], [], set()
+
+        if isinstance(data, dict) and "detail_refs" in data:
+            records = data.get("records") or []
+            detail_refs = data.get("detail_refs") or []
+            detail_refs = (detail_refs + [None] * len(records))[:len(records)]
+            return records, detail_refs, set()
+
+        if isinstance(data, dict):
+            data = data.get("records", [])
+        records = data if isinstance(data, list) else []
+        return records, [None] * len(records), set(range(len(records)))
+
+    def _replay_log(self, records, detail_refs, legacy, snapshot_count):
+        """
+        重放摘要日志
+
+        返回: (有效日志条数, 是否截断了损坏尾部)
+        序号小于快照条数的帧说明压缩时已并入快照（压缩后未来得及清空日志），直接跳过；
+        没有 detail 字段的帧来自旧版日志，记录仍带逐点数据。
+        """
+        if not os.path.exists(self.log_path):
+            return 0, False
+
+        entries = 0
+        valid_end = 0
+        recovered = False
+
+        with open(self.log_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    recovered = True
+                    break
+                try:
+                    frame = json.loads(line.decode('utf-8'))
+                    seq = int(frame["seq"])
+                    record = frame["record"]
+                except Exception:
+                    recovered = True
+                    break
+
+                valid_end += len(line)
+                entries += 1
+                if seq < snapshot_count:
+                    continue
+                if "detail" not in frame:
+                    legacy.add(len(records))
+                records.append(record)
+                detail_refs.append(frame.get("detail"))
+
+        if recovered:
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(valid_end)
+
+        return entries, recovered
+
+    def _migrate_legacy(self, legacy):
+        """旧版记录：标准化一次并把逐点数据移入详情日志"""
+        if not legacy:
+            return 0
+
+        indexes = sorted(legacy)
+        details = []
+        for idx in indexes:
+            summary, detail = split_sport_record(normalize_sport_record(self.records[idx]))
+            self.records[idx] = summary
+            details.append(detail)
+
+        refs = self._append_details(details)
+        for idx, ref in zip(indexes, refs):
+            self.detail_refs[idx] = ref
+        return len(indexes)
+
+    # ==================== 写入 ====================
+    def append(self, record):
+        """追加单条记录"""
+        self.extend([record])
+
+    def extend(self, records):
+        """追加多条已标准化的记录；非 write_behind 模式下立即落盘"""
+        if not records:
+            return
+
+        with self._lock:
+            start = len(self.records)
+            for offset, record in enumerate(records):
+                summary, detail = split_sport_record(record)
+                self.records.append(summary)
+                self.detail_refs.append(None)
+                if detail:
+                    self._pending_details[start + offset] = detail
+
+        if not self.write_behind:
+            self.flush()
+
+    def flush(self):
+        """
+        将未落盘的记录写入详情日志和摘要日志，返回写入条数
+
+        先写详情再写摘要：崩溃时最多留下无人引用的详情，不会出现指向缺失详情的摘要。
+        """
+        with self._io_lock:
+            with self._lock:
+                start = self._flushed
+                stop = len(self.records)
+                if start >= stop:
+                    return 0
+                summaries = self.records[start:stop]
+                details = [self._pending_details.get(idx) for idx in range(start, stop)]
+
+            refs = self._append_details(details)
+
+            lines = []
+            for seq, (summary, ref) in enumerate(zip(summaries, refs), start):
+                lines.append(_dumps_line({"seq": seq, "record": summary, "detail": ref}))
+            self._append_bytes(self.log_path, b"".join(lines))
+
+            with self._lock:
+                self.detail_refs[start:stop] = refs
+                for idx in range(start, stop):
+                    self._pending_details.pop(idx, None)
+                self._flushed = stop
+                self._log_entries += stop - start
+                need_compact = self._log_entries >= self.compact_threshold
+
+            if need_compact:
+                self.compact()
+            return stop - start
+
+    def _append_bytes(self, path, data):
+        """追加写入并返回写入前的文件偏移"""
+        with open(path, 'ab') as f:
+            offset = f.tell()
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        return offset
+
+    def _append_details(self, details):
+        """追加详情，返回每条详情的 [offset, length]（无详情为 None）"""
+        chunks = [_dumps_line(detail) if detail else None for detail in details]
+        payload = b"".join(chunk for chunk in chunks if chunk)
+        if not payload:
+            return [None] * len(details)
+
+        offset = self._append_bytes(self.detail_path, payload)
+        refs = []
+        for chunk in chunks:
+            if chunk is None:
+                refs.append(None)
+                continue
+            refs.append([offset, len(chunk)])
+            offset += len(chunk)
+        return refs
+
+    # ==================== 读取 ====================
+    def get_detail(self, index):
+        """按需读取单条记录的详情，最近读取的详情保留在小缓存中"""
+        with self._lock:
+            if index < 0 or index >= len(self.detail_refs):
+                return None
+            pending = self._pending_details.get(index)
+            if pending is not None:
+                return pending
+            ref = self.detail_refs[index]
+            if not ref:
+                return None
+
+            cached = self._detail_cache.get(index)
+            if cached is not None:
+                self._detail_cache.move_to_end(index)
+                return cached
+
+            offset, length = ref
+            try:
+                with open(self.detail_path, 'rb') as f:
+                    f.seek(offset)
+                    detail = json.loads(f.read(length).decode('utf-8'))
+            except Exception as e:
+                print(f"[数据] 运动记录详情读取失败 #{index}: {e}")
+                return None
+
+            self._detail_cache[index] = detail
+            if len(self._detail_cache) > self.detail_cache_size:
+                self._detail_cache.popitem(last=False)
+            return detail
+
+    # ==================== 压缩 ====================
+    def compact(self):
+        """将摘要日志合并进快照并清空日志（详情日志只追加，不参与压缩；只包含已落盘的记录）"""
+        with self._io_lock:
+            with self._lock:
+                count = self._flushed
+                snapshot = {"records": self.records[:count], "detail_refs": self.detail_refs[:count]}
+
+            temp_path = self.snapshot_path + ".tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                os.replace(temp_path, self.snapshot_path)
+            except Exception as e:
+                print(f"[数据] 运动记录压缩失败: {e}")
+                if os.path.exists(temp_path):
+                    try:
+                        os.remove(temp_path)
+                    except Exception:
+                        pass
+                return False
+
+            # 快照已包含全部已落盘记录，此时即使崩溃，日志中的旧帧也会按序号跳过
+            with open(self.log_path, 'w', encoding='utf-8'):
+                pass
+            with self._lock:
+                self._log_entries = 0
+            print(f"[数据] 运动记录已压缩: {count}条")
+            return True
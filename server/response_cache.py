@@ -0,0 +1,109 @@
+# -*- coding: UTF-8 -*-
+"""
+只读接口响应缓存
+
+每类数据（history / sport_records / emergency）一个版本号，写入时 bump(dataset) 递增；
+响应按 路由 + 参数 + 相关数据版本 缓存序列化后的 JSON，数据未变化时直接复用。
+ETag 取响应内容摘要，客户端带 If-None-Match 命中时返回 304，不再传输响应体。
+视图设置的 X- 开头响应头（如分页游标）随响应体一起缓存。
+多工作进程部署时传入共享的版本计数器（shared_state.SqliteVersionCounter），各进程缓存同步失效。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+
+
+class ResponseCache:
+    """按数据版本失效的 LRU 响应缓存（按响应体总字节数限制容量）"""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, counter=None):
+        self.max_bytes = max_bytes
+        self.counter = counter
+        self._entries = OrderedDict()   # key -> (etag, body, headers)
+        self._size = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def bump(self, dataset):
+        """数据写入后调用，使依赖该数据的缓存失效"""
+        if self.counter is not None:
+            self.counter.bump(dataset)
+            return
+        with self._lock:
+            self._versions[dataset] = self._versions.get(dataset, 0) + 1
+
+    def versions(self, datasets):
+        if self.counter is not None:
+            return self.counter.versions(datasets)
+        with self._lock:
+            return tuple(self._versions.get(dataset, 0) for dataset in datasets)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, headers=()):
+        etag = hashlib.sha1(body).hexdigest()
+        entry = (etag, body, tuple(headers))
+        if len(body) > self.max_bytes:
+            return entry
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = entry
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return entry
+
+    def cached(self, *datasets, vary=None):
+        """
+        视图装饰器：缓存 200 响应并处理 If-None-Match
+
+        vary: 可选函数，返回参数之外影响响应的值（如当前日期、默认设备）
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = (
+                    request.endpoint,
+                    tuple(sorted(kwargs.items())),
+                    tuple(sorted(request.args.items(multi=True))),
+                    # 未带 device_id 参数时按请求头选择设备，不同设备不能共用缓存
+                    request.headers.get('X-Device-Id'),
+                    vary() if vary else None,
+                    self.versions(datasets),
+                )
+                entry = self.get(key)
+                if entry is None:
+                    response = view(*args, **kwargs)
+                    if not isinstance(response, Response) or response.status_code != 200:
+                        return response
+                    headers = [(name, value) for name, value in response.headers.items()
+                               if name.startswith('X-')]
+                    entry = self.put(key, response.get_data(), headers)
+
+                etag, body, headers = entry
+                # 压缩后的响应使用弱 ETag，这里按弱比较
+                if request.if_none_match.contains_weak(etag):
+                    response = Response(status=304)
+                else:
+                    response = Response(body, mimetype='application/json')
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+                response.vary.add('X-Device-Id')
+                for name, value in headers:
+                    response.headers[name] = value
+                return response
+            return wrapper
+        return decorator
@@ -4,565 +4,586 @@ Flask服务器程序 - 运动腰带系统
 提供REST API和Web界面
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from datetime import datetime, timedelta
+import atexit
+import hashlib
 import json
 import threading
 import time
 import os
-
-# 数据保存调度器
-last_save_time = 0
-save_lock = threading.Lock()
-SAVE_INTERVAL = 30  # 30秒保存一次
-
-def atomic_save(filepath, data):
-    """原子性保存：先写临时文件，再重命名"""
-    temp_path = filepath + ".tmp"
-    try:
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        os.replace(temp_path, filepath)
-    except Exception as e:
-        print(f"保存失败 {filepath}: {e}")
-        if os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-
-def schedule_save():
-    """定时保存调度器"""
-    global last_save_time
-    if time.time() - last_save_time > SAVE_INTERVAL:
-        save_all_data()
-        last_save_time = time.time()
-
-def save_all_data():
-    """保存所有数据"""
-    with save_lock:
-        try:
-            atomic_save(HISTORY_FILE, sport_history)
-            atomic_save(EMERGENCY_FILE, emergency_records)
-            atomic_save(SPORT_RECORDS_FILE, sport_records)
-            atomic_save(SETTINGS_FILE, {"sitting_remind_duration": sitting_remind_duration})
-            print(f"[数据] 已保存")
-        except Exception as e:
-            print(f"[数据] 保存失败: {e}")
+import signal
+import sys
+
+import config
+from storage import DEFAULT_DEVICE_ID, create_storage
+from sport_records import DETAIL_FIELDS, normalize_sport_record
+from devices import DeviceRegistry, normalize_device_id
+from aggregates import AggregateIndex, StorageAggregates
+from response_cache import ResponseCache
+from compression import Compressor
+from persistence import BackgroundWriter
+from record_codec import CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, CodecError, decode_payload
+from shared_state import SqliteDeviceRegistry, SqliteVersionCounter
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "X-Total-Count"])
 
-MODE_VALUES = (0, 1, 2)
-CARBON_PER_STEP = 0.03
-
-# 全局数据存储
-device_status = {
-    "mode": 0,
-    "temperature": 25.0,
-    "humidity": 50.0,
-    "brightness": 100,
-    "posture": "unknown",
-    "pace": 0,
-    "pace_str": "--'--\"",
-    "step": 0,
-    "carbon_reduce": 0,
-    "emergency": False,
-    "sport_time_today": 0,
-    "activity_hours": [],
-    "last_update": None,
-    "online": False,
-    "sitting_duration": 0,
-    "sport_duration": 0,
-    "message_showing": False
-}
-
-# 控制命令队列
-control_commands = []
-command_lock = threading.Lock()
-
-# 紧急记录
-emergency_records = []
-
-# 历史运动数据
-sport_history = {}
-
-# 运动记录
-sport_records = []
-
-# 设备状态跟踪
-device_last_step = 0  # 上次上报的步数
-device_stats_date = datetime.now().strftime("%Y-%m-%d")
-
-# 久坐提醒设置（秒）
-sitting_remind_duration = 3600
-
-# 数据文件路径
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
-EMERGENCY_FILE = os.path.join(DATA_DIR, "emergency.json")
-HISTORY_FILE = os.path.join(DATA_DIR, "history.json")
-SPORT_RECORDS_FILE = os.path.join(DATA_DIR, "sport_records.json")
-SETTINGS_FILE = os.path.join(DATA_DIR, "settings.json")
+# 响应压缩：按 Accept-Encoding 选择 br/gzip，带 ETag 的响应复用已压缩结果
+compressor = Compressor()
+compressor.init_app(app)
 
-# 确保数据目录存在
-os.makedirs(DATA_DIR, exist_ok=True)
+MODE_VALUES = (0, 1, 2)
 
-# ==================== 数据持久化 ====================
-def rollover_daily_device_counters(now=None):
-    """跨天时重置服务端维护的今日计数器"""
-    global device_stats_date
+# 增量上报中可省略的字段（未携带时沿用服务端已有值）
+STATUS_DELTA_FIELDS = (
+    "mode", "temperature", "humidity", "brightness", "posture", "pace", "pace_str",
+    "emergency", "sport_time_today", "activity_hours", "sitting_duration",
+    "sport_duration", "message_showing",
+)
+CARBON_PER_STEP = config.CARBON_PER_STEP
 
-    if now is None:
-        now = datetime.now()
+# 推送通道参数
+STREAM_KEEPALIVE = 15        # SSE 心跳间隔(秒)
+COMMAND_POLL_TIMEOUT = 25    # 命令长轮询默认等待时长(秒)
+COMMAND_POLL_MAX_TIMEOUT = 55
 
-    today = now.strftime("%Y-%m-%d")
-    if today != device_stats_date:
-        device_status["step"] = 0
-        device_status["carbon_reduce"] = 0
-        device_stats_date = today
+MAX_STATUS_DAYS = 3660       # 状态 / 历史接口按天查询的最大天数
 
+# 确保数据目录存在
+os.makedirs(config.DATA_DIR, exist_ok=True)
+
+# 多工作进程部署（wsgi.py）时设备状态、缓存版本号放在 SQLite 中共享；
+# 各进程的 JSON 存储互不同步，共享状态必须搭配 SQLite 存储后端
+SHARED_STATE = config.STATE_BACKEND == "sqlite"
+if SHARED_STATE and config.STORAGE_BACKEND != "sqlite":
+    raise RuntimeError(
+        f"共享状态 (SMART_BELT_STATE=sqlite) 需要 SQLite 存储后端，当前为 {config.STORAGE_BACKEND}"
+    )
+
+# 持久化后端（历史数据、紧急记录、运动记录、设置）
+storage = create_storage(config)
+
+# 后台写线程：请求只改内存并标记脏数据集，历史数据最长合并 SAVE_INTERVAL 秒，其余数据集尽快落盘
+writer = BackgroundWriter(
+    storage,
+    delays={"history": config.SAVE_INTERVAL},
+    default_delay=config.WRITE_BEHIND_DELAY,
+)
+
+# 历史数据聚合索引（终身合计 + 按日前缀和），状态查询不再逐日求和；
+# 共享状态下各进程索引无法同步，改为由 SQLite 按索引求和
+aggregates = StorageAggregates(storage) if SHARED_STATE else AggregateIndex()
+
+# 只读接口响应缓存：history / sport_records / emergency 写入时失效，支持 ETag/304
+response_cache = ResponseCache(
+    counter=SqliteVersionCounter(config.SQLITE_PATH) if SHARED_STATE else None
+)
 
+# ==================== 数据持久化 ====================
 def load_data():
     """加载历史数据"""
-    global emergency_records, sport_history, sport_records, sitting_remind_duration
-    
-    try:
-        if os.path.exists(EMERGENCY_FILE):
-            with open(EMERGENCY_FILE, 'r', encoding='utf-8') as f:
-                emergency_records = json.load(f)
-    except:
-        emergency_records = []
-    
-    try:
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                sport_history = json.load(f)
-    except:
-        sport_history = {}
-    
-    try:
-        if os.path.exists(SPORT_RECORDS_FILE):
-            with open(SPORT_RECORDS_FILE, 'r', encoding='utf-8') as f:
-                sport_records = json.load(f)
-    except:
-        sport_records = []
-    
-    try:
-        if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                settings = json.load(f)
-                sitting_remind_duration = settings.get("sitting_remind_duration", 3600)
-    except:
-        sitting_remind_duration = 3600
+    storage.load()
+    aggregates.load(storage)
+    if SHARED_STATE:
+        devices.load()
+        response_cache.counter.load()
 
+    writer.start()
+    atexit.register(writer.stop)
 
-def init_device_daily_counters_from_history(now=None):
-    """服务端重启后，用已持久化的今日数据恢复计数器，避免回到0"""
-    global device_last_step, device_stats_date
 
+def init_device_daily_counters_from_history(device, now=None):
+    """设备分区创建时（含服务端重启后首次上报），用已持久化的今日数据恢复计数器，避免回到0"""
     if now is None:
         now = datetime.now()
 
     today = now.strftime("%Y-%m-%d")
-    device_stats_date = today
+    device.stats_date = today
+    status = device.status
 
-    today_history = sport_history.get(today) if isinstance(sport_history, dict) else None
+    today_history = storage.get_history_day(today, device.device_id)
     if isinstance(today_history, dict):
         try:
-            device_status["step"] = max(0, int(today_history.get("step", 0) or 0))
+            status["step"] = max(0, int(today_history.get("step", 0) or 0))
         except Exception:
-            device_status["step"] = 0
+            status["step"] = 0
 
         try:
-            device_status["carbon_reduce"] = round(float(today_history.get("carbon_reduce", 0) or 0), 4)
+            status["carbon_reduce"] = round(float(today_history.get("carbon_reduce", 0) or 0), 4)
         except Exception:
-            device_status["carbon_reduce"] = 0
+            status["carbon_reduce"] = 0
 
-        device_last_step = device_status["step"]
+        device.last_step = status["step"]
     else:
-        device_status["step"] = 0
-        device_status["carbon_reduce"] = 0
-        device_last_step = 0
-
-def save_emergency():
-    """保存紧急记录"""
+        status["step"] = 0
+        status["carbon_reduce"] = 0
+        device.last_step = 0
+
+
+# 设备状态分区：状态、步数基线、命令队列、事件中心均按设备ID隔离
+if SHARED_STATE:
+    devices = SqliteDeviceRegistry(
+        config.SQLITE_PATH,
+        on_create=init_device_daily_counters_from_history,
+        poll_interval=config.STATE_POLL_INTERVAL,
+    )
+else:
+    devices = DeviceRegistry(on_create=init_device_daily_counters_from_history)
+
+
+def request_device_id(data=None):
+    """请求中的设备ID：查询参数 > 请求体 > X-Device-Id 请求头，均未提供时返回 None"""
+    candidates = (
+        request.args.get("device_id"),
+        data.get("device_id") if isinstance(data, dict) else None,
+        request.headers.get("X-Device-Id"),
+    )
+    for value in candidates:
+        device_id = normalize_device_id(value)
+        if device_id:
+            return device_id
+    return None
+
+
+def _stamp_device_id(records, device_id):
+    """为未携带设备ID的记录补上上报设备"""
+    for record in records:
+        if isinstance(record, dict) and not record.get("device_id"):
+            record["device_id"] = device_id
+    return records
+
+
+def request_payload():
+    """请求体：JSON，或设备端上传运动记录时使用的列式二进制编码"""
+    if request.mimetype == COLUMNAR_CONTENT_TYPE:
+        return decode_payload(request.get_data())
+    return request.json
+
+
+def store_emergency_records(device_id, records):
+    """追加紧急记录"""
     try:
-        atomic_save(EMERGENCY_FILE, emergency_records)
+        storage.add_emergencies(_stamp_device_id(records, device_id))
     except Exception as e:
         print(f"保存紧急记录失败: {e}")
+        raise
+    response_cache.bump("emergency")
+    devices.publish(device_id, "emergency")
 
-def save_history():
-    """保存历史数据"""
-    try:
-        atomic_save(HISTORY_FILE, sport_history)
-    except Exception as e:
-        print(f"保存历史数据失败: {e}")
+def store_sport_records(device_id, records):
+    """
+    追加运动记录（只写入新增记录，不重写历史）
 
-def save_sport_records():
-    """保存运动记录"""
+    record_id 已保存过的记录（设备端重试）不会重复写入，返回实际新增条数。
+    """
     try:
-        atomic_save(SPORT_RECORDS_FILE, sport_records)
+        added = storage.add_sport_records(_stamp_device_id(records, device_id))
     except Exception as e:
         print(f"保存运动记录失败: {e}")
+        raise
+    if added:
+        response_cache.bump("sport_records")
+        devices.publish(device_id, "sport_records")
+    return added
+
+def get_sitting_remind_duration():
+    """久坐提醒时长（秒）；每次从存储读取，多个工作进程看到同一份设置"""
+    try:
+        return int(storage.get_settings().get("sitting_remind_duration", 3600))
+    except Exception:
+        return 3600
 
-def save_settings():
+def save_settings(settings):
     """保存设置"""
     try:
-        settings = {"sitting_remind_duration": sitting_remind_duration}
-        atomic_save(SETTINGS_FILE, settings)
+        storage.save_settings(settings)
     except Exception as e:
         print(f"保存设置失败: {e}")
+    devices.broadcast("settings")
 
 
-def _safe_int(value, default=0):
-    """安全转换为整数"""
-    try:
-        return int(value)
-    except Exception:
-        return default
+# ==================== API端点 ====================
 
+# 页面缓存：文件名 -> (修改时间, 内容, ETag)
+_page_cache = {}
 
-def _safe_float(value, default=0.0):
-    """安全转换为浮点数"""
-    try:
-        return float(value)
-    except Exception:
-        return default
 
+def send_page(filename):
+    """返回页面；内容按修改时间缓存，ETag 为内容摘要，压缩结果由 compressor 按 ETag 复用"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    mtime = os.path.getmtime(path)
+    cached = _page_cache.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            body = f.read()
+        cached = (mtime, body, hashlib.sha1(body).hexdigest())
+        _page_cache[filename] = cached
 
-def _build_pace_str(duration_seconds, distance_km):
-    """根据时长和距离生成配速字符串"""
-    duration_seconds = _safe_float(duration_seconds, 0)
-    distance_km = _safe_float(distance_km, 0)
+    response = Response(cached[1], mimetype='text/html')
+    response.set_etag(cached[2])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
-    if duration_seconds <= 0 or distance_km <= 0:
-        return None
+@app.route('/')
+def index():
+    """返回控制页面"""
+    return send_page('control.html')
 
-    pace_min_per_km = (duration_seconds / 60.0) / distance_km
-    if pace_min_per_km <= 0 or pace_min_per_km > 99:
-        return None
+@app.route('/history')
+def history_page():
+    """历史统计页面"""
+    return send_page('history.html')
 
-    minutes = int(pace_min_per_km)
-    seconds = int(round((pace_min_per_km - minutes) * 60))
-    if seconds >= 60:
-        minutes += 1
-        seconds -= 60
-    return f"{minutes}'{seconds:02d}\""
+@app.route('/sport_record_detail')
+def sport_record_detail_page():
+    """运动记录详情页面"""
+    return send_page('sport_record_detail.html')
 
+def expand_status_delta(state, data):
+    """
+    增量上报：data 只包含相对 base 序号那次上报变化的字段，补全为完整请求体
 
-def normalize_sport_record(record):
-    """标准化运动记录，兼容旧记录缺失字段的情况"""
-    if not isinstance(record, dict):
-        return record
+    服务端记录的最近序号与 base 不一致（服务端重启、中间的上报未收到）时返回 None，
+    设备端应改发完整快照。
+    """
+    if state.status_seq is None or data.get("base") != state.status_seq:
+        return None
 
-    item = dict(record)
-    series = item.get("series")
-
-    distance_km = _safe_float(item.get("distance_km"), 0)
-    distance_step_km = _safe_float(item.get("distance_step_km"), 0)
-    distance_gnss_km = _safe_float(item.get("distance_gnss_km"), 0)
-    distance_source = item.get("distance_source") if isinstance(item.get("distance_source"), str) else ""
-    avg_stride_m = _safe_float(item.get("avg_stride_m"), 0)
-    avg_cadence_spm = _safe_float(item.get("avg_cadence_spm"), 0)
-    carbon_reduce = _safe_float(item.get("carbon_reduce"), 0)
-    gnss_valid_ratio = _safe_float(item.get("gnss_valid_ratio"), 0)
-    gnss_fix_samples = max(0, _safe_int(item.get("gnss_fix_samples"), 0))
-    gnss_total_samples = max(0, _safe_int(item.get("gnss_total_samples"), 0))
-    gnss_satellite_max = max(0, _safe_int(item.get("gnss_satellite_max"), 0))
-
-    clean_gnss_track = []
-    raw_gnss_track = item.get("gnss_track")
-    if isinstance(raw_gnss_track, list):
-        for point in raw_gnss_track:
-            if not isinstance(point, dict):
-                continue
+    full = {field: state.status[field] for field in STATUS_DELTA_FIELDS}
+    full["step"] = state.last_step
+    full.update(data)
+    return full
 
-            lat = _safe_float(point.get("lat"), None)
-            lon = _safe_float(point.get("lon"), None)
-            if lat is None or lon is None:
-                continue
-            if abs(lat) > 90 or abs(lon) > 180:
-                continue
 
-            clean_point = {
-                "lat": round(lat, 7),
-                "lon": round(lon, 7),
-            }
+def apply_status_update(state, data, current_time):
+    """
+    将一次状态上报应用到设备状态（调用方保证对该设备串行执行）
 
-            t = _safe_int(point.get("t"), None)
-            if t is not None and t >= 0:
-                clean_point["t"] = t
-
-            point_distance_km = _safe_float(point.get("distance_km"), None)
-            if point_distance_km is not None and point_distance_km >= 0:
-                clean_point["distance_km"] = round(point_distance_km, 3)
-
-            satellites = _safe_int(point.get("satellites"), None)
-            if satellites is not None and satellites >= 0:
-                clean_point["satellites"] = satellites
-
-            speed_kmh = _safe_float(point.get("speed_kmh"), None)
-            if speed_kmh is None:
-                speed_kmh = _safe_float(point.get("gnss_speed_kmh"), None)
-            if speed_kmh is not None and speed_kmh >= 0:
-                clean_point["speed_kmh"] = round(speed_kmh, 2)
-
-            heading_deg = _safe_float(point.get("heading_deg"), None)
-            if heading_deg is not None:
-                clean_point["heading_deg"] = round(heading_deg % 360, 1)
-
-            utc = point.get("utc")
-            if isinstance(utc, str) and utc:
-                clean_point["utc"] = utc
-
-            clean_gnss_track.append(clean_point)
-
-    if clean_gnss_track:
-        item["gnss_track"] = clean_gnss_track
-        if distance_gnss_km <= 0:
-            track_distances = [_safe_float(point.get("distance_km"), 0) for point in clean_gnss_track]
-            valid_track_distances = [value for value in track_distances if value >= 0]
-            if valid_track_distances:
-                distance_gnss_km = round(max(valid_track_distances), 3)
-    elif "gnss_track" in item:
-        item["gnss_track"] = []
-
-    if isinstance(series, list) and series:
-        distance_points = [_safe_float(point.get("distance_km"), 0) for point in series if isinstance(point, dict)]
-        stride_points = [_safe_float(point.get("stride_m"), 0) for point in series if isinstance(point, dict)]
-        cadence_points = [_safe_float(point.get("cadence_spm"), 0) for point in series if isinstance(point, dict)]
-        carbon_points = [_safe_float(point.get("carbon_reduce"), 0) for point in series if isinstance(point, dict)]
-
-        valid_distances = [value for value in distance_points if value > 0]
-        valid_strides = [value for value in stride_points if value > 0]
-        valid_cadences = [value for value in cadence_points if value > 0]
-        valid_carbons = [value for value in carbon_points if value >= 0]
-
-        if distance_km <= 0 and valid_distances:
-            distance_km = round(max(valid_distances), 3)
-
-        if avg_stride_m <= 0 and valid_strides:
-            avg_stride_m = round(sum(valid_strides) / len(valid_strides), 2)
-
-        if avg_cadence_spm <= 0 and valid_cadences:
-            avg_cadence_spm = round(sum(valid_cadences) / len(valid_cadences), 1)
-
-        if carbon_reduce <= 0 and valid_carbons:
-            carbon_reduce = round(max(valid_carbons), 2)
-
-    steps = max(0, _safe_int(item.get("step"), 0))
-    duration = max(0, _safe_float(item.get("duration"), 0))
-
-    if distance_step_km <= 0 and distance_source != "gnss" and distance_km > 0:
-        distance_step_km = round(distance_km, 3)
-    if distance_source == "gnss" and distance_gnss_km <= 0 and distance_km > 0:
-        distance_gnss_km = round(distance_km, 3)
-
-    if distance_source == "gnss" and distance_gnss_km > 0:
-        distance_km = distance_gnss_km
-    elif distance_km <= 0:
-        if distance_step_km > 0:
-            distance_km = distance_step_km
-        elif distance_gnss_km > 0:
-            distance_km = distance_gnss_km
-    if distance_km <= 0 and steps > 0 and avg_stride_m > 0:
-        distance_km = round((steps * avg_stride_m) / 1000.0, 3)
-
-    if avg_stride_m <= 0 and steps > 0 and distance_km > 0:
-        avg_stride_m = round((distance_km * 1000.0) / steps, 2)
-
-    if avg_cadence_spm <= 0 and steps > 0 and duration > 0:
-        avg_cadence_spm = round((steps / duration) * 60.0, 1)
-
-    if carbon_reduce <= 0 and steps > 0:
-        carbon_reduce = round(steps * CARBON_PER_STEP, 2)
-
-    if not item.get("pace"):
-        item["pace"] = _build_pace_str(duration, distance_km) or "--'--\""
-
-    gnss_valid_ratio = min(1.0, max(0.0, gnss_valid_ratio))
-    if gnss_total_samples > 0 and gnss_fix_samples > gnss_total_samples:
-        gnss_fix_samples = gnss_total_samples
-
-    if distance_source not in ("step", "gnss"):
-        distance_source = "gnss" if distance_gnss_km > 0 else "step"
-    elif distance_source == "gnss" and distance_gnss_km <= 0 and distance_step_km > 0:
-        distance_source = "step"
-
-    if distance_km > 0:
-        item["distance_km"] = distance_km
-    if distance_step_km > 0:
-        item["distance_step_km"] = distance_step_km
-    if distance_gnss_km > 0:
-        item["distance_gnss_km"] = distance_gnss_km
-    if avg_stride_m > 0:
-        item["avg_stride_m"] = avg_stride_m
-    if avg_cadence_spm > 0:
-        item["avg_cadence_spm"] = avg_cadence_spm
-    item["distance_source"] = distance_source
-    item["carbon_reduce"] = round(max(0, carbon_reduce), 2)
-    item["gnss_valid_ratio"] = gnss_valid_ratio
-    item["gnss_fix_samples"] = gnss_fix_samples
-    item["gnss_total_samples"] = gnss_total_samples
-    item["gnss_satellite_max"] = gnss_satellite_max
-
-    return item
+    返回: (今日历史数据, 是否需要新增紧急记录)
+    """
+    state.rollover(current_time)
+    status = state.status
 
-# ==================== API端点 ====================
+    current_mode = data.get("mode", 0)
 
-@app.route('/')
-def index():
-    """返回控制页面"""
-    return send_from_directory(os.path.dirname(__file__), 'control.html')
+    # 获取当前步数
+    current_step = max(0, int(data.get("step", 0) or 0))
 
-@app.route('/history')
-def history_page():
-    """历史统计页面"""
-    return send_from_directory(os.path.dirname(__file__), 'history.html')
+    # 计算步数增量
+    if current_step >= state.last_step:
+        step_increment = current_step - state.last_step
+    else:
+        step_increment = current_step
+
+    # 计算碳排放增量（仅在运动模式）
+    carbon_increment = 0
+
+    # 只有在运动模式(MODE_SPORT=1)时才累加碳排放
+    if current_mode == 1 and step_increment > 0:
+        carbon_increment = step_increment * CARBON_PER_STEP
+        status["carbon_reduce"] = round(
+            status["carbon_reduce"] + carbon_increment, 4
+        )
+
+    # 更新步数记录
+    state.last_step = current_step
+
+    # 更新设备状态
+    status.update({
+        "mode": current_mode,
+        "temperature": data.get("temperature", status["temperature"]),
+        "humidity": data.get("humidity", status["humidity"]),
+        "brightness": data.get("brightness", status["brightness"]),
+        "posture": data.get("posture", status["posture"]),
+        "pace": data.get("pace", status["pace"]),
+        "pace_str": data.get("pace_str", status["pace_str"]),
+        "step": status["step"] + step_increment,
+        "carbon_reduce": status["carbon_reduce"],
+        "emergency": data.get("emergency", status["emergency"]),
+        "sport_time_today": data.get("sport_time_today", status["sport_time_today"]),
+        "activity_hours": data.get("activity_hours", status["activity_hours"]),
+        "sitting_duration": data.get("sitting_duration", status["sitting_duration"]),
+        "sport_duration": data.get("sport_duration", status["sport_duration"]),
+        "message_showing": data.get("message_showing", status["message_showing"]),
+        "last_update": current_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "online": True
+    })
+
+    today_entry = {
+        "sport_time": status["sport_time_today"],
+        "activity_hours": status["activity_hours"],
+        "step": status["step"],
+        "carbon_reduce": status["carbon_reduce"],
+    }
+
+    # 紧急情况只在进入时记录一次
+    record_emergency = bool(data.get("emergency")) and not status.get("emergency_recorded")
+    status["emergency_recorded"] = bool(data.get("emergency"))
+
+    # 完整快照和补全后的增量都记录序号；批量上报不带序号，之后的增量需重新发送完整快照
+    state.status_seq = data.get("seq")
+
+    return today_entry, record_emergency
 
-@app.route('/sport_record_detail')
-def sport_record_detail_page():
-    """运动记录详情页面"""
-    return send_from_directory(os.path.dirname(__file__), 'sport_record_detail.html')
 
 @app.route('/api/status', methods=['POST'])
 def update_status():
-    """接收设备状态更新"""
-    global device_status, sport_history, device_last_step
-
+    """接收设备状态更新（按设备ID分区，未携带设备ID的旧客户端归入默认设备）"""
     try:
         data = request.json or {}
         current_time = datetime.now()
-        rollover_daily_device_counters(current_time)
 
         current_mode = data.get("mode", 0)
         if current_mode not in MODE_VALUES:
             return jsonify({"status": "error", "message": "无效模式值"}), 400
 
-        # 获取当前步数
-        current_step = max(0, int(data.get("step", 0) or 0))
-
-        # 计算步数增量
-        if current_step >= device_last_step:
-            step_increment = current_step - device_last_step
-        else:
-            step_increment = current_step
+        device_id = request_device_id(data) or DEFAULT_DEVICE_ID
 
-        # 计算碳排放增量（仅在运动模式）
-        carbon_increment = 0
-
-        # 只有在运动模式(MODE_SPORT=1)时才累加碳排放
-        if current_mode == 1 and step_increment > 0:
-            carbon_increment = step_increment * CARBON_PER_STEP
-            device_status["carbon_reduce"] = round(
-                device_status["carbon_reduce"] + carbon_increment, 4
-            )
+        def apply(state):
+            full = expand_status_delta(state, data) if data.get("delta") else data
+            if full is None:
+                return None
+            return apply_status_update(state, full, current_time)
 
-        # 更新步数记录
-        device_last_step = current_step
-
-        # 更新设备状态
-        device_status.update({
-            "mode": current_mode,
-            "temperature": data.get("temperature", device_status["temperature"]),
-            "humidity": data.get("humidity", device_status["humidity"]),
-            "brightness": data.get("brightness", device_status["brightness"]),
-            "posture": data.get("posture", device_status["posture"]),
-            "pace": data.get("pace", device_status["pace"]),
-            "pace_str": data.get("pace_str", device_status["pace_str"]),
-            "step": device_status["step"] + step_increment,
-            "carbon_reduce": device_status["carbon_reduce"],
-            "emergency": data.get("emergency", device_status["emergency"]),
-            "sport_time_today": data.get("sport_time_today", device_status["sport_time_today"]),
-            "activity_hours": data.get("activity_hours", device_status["activity_hours"]),
-            "sitting_duration": data.get("sitting_duration", device_status["sitting_duration"]),
-            "sport_duration": data.get("sport_duration", device_status["sport_duration"]),
-            "message_showing": data.get("message_showing", device_status["message_showing"]),
-            "last_update": current_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "online": True
-        })
+        result = devices.update(device_id, apply)
+        if result is None:
+            return jsonify({"status": "resync", "message": "增量基线不一致，请发送完整状态"}), 409
+        today_entry, record_emergency = result
+        devices.touch(device_id)
 
-        # 更新今日历史数据
-        today = current_time.strftime("%Y-%m-%d")
-        if today not in sport_history:
-            sport_history[today] = {
-                "sport_time": 0,
-                "activity_hours": [],
-                "step": 0,
-                "carbon_reduce": 0
-            }
+        day_entries = {current_time.strftime("%Y-%m-%d"): today_entry}
+        emergency_times = [current_time] if record_emergency else []
+        persist_status_updates(device_id, day_entries, emergency_times)
 
-        sport_history[today]["sport_time"] = device_status["sport_time_today"]
-        sport_history[today]["activity_hours"] = device_status["activity_hours"]
-        sport_history[today]["carbon_reduce"] = device_status["carbon_reduce"]
-        sport_history[today]["step"] = device_status["step"]
-
-        # 定期保存历史数据（使用新的调度器）
-        schedule_save()
-
-        # 处理紧急情况
-        if data.get("emergency") and not device_status.get("emergency_recorded"):
-            emergency_records.append({
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "message": "检测到摔倒，需要紧急救助",
-                "location": "未知",
-                "resolved": False
-            })
-            save_emergency()
-            device_status["emergency_recorded"] = True
-        elif not data.get("emergency"):
-            device_status["emergency_recorded"] = False
-        
         # 返回待执行的命令
-        with command_lock:
-            commands = control_commands.copy()
-            control_commands.clear()
+        commands = devices.pop_commands(device_id)
         
         return jsonify({
             "status": "ok",
             "commands": commands,
-            "sitting_remind_duration": sitting_remind_duration
+            "sitting_remind_duration": get_sitting_remind_duration(),
+            "delta_supported": True
         })
         
     except Exception as e:
         print(f"更新状态错误: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/status', methods=['GET'])
-def get_status():
-    """获取设备状态"""
-    rollover_daily_device_counters()
 
-    carbon_from_history = 0
-    days = request.args.get('days', type=int)
-    today = datetime.now()
+def persist_status_updates(device_id, day_entries, emergency_times):
+    """状态上报后写入每日历史、聚合索引和紧急记录，并通知订阅者"""
+    for date, entry in day_entries.items():
+        storage.put_history_day(date, entry, device_id)
+        aggregates.update(device_id, date, entry)
+    response_cache.bump("history")
 
-    if days and days > 0:
-        for i in range(days):
-            date = (today - timedelta(days=i)).strftime("%Y-%m-%d")
-            if date in sport_history:
-                carbon_from_history += sport_history[date].get("carbon_reduce", 0)
-    else:
-        for history in sport_history.values():
-            carbon_from_history += history.get("carbon_reduce", 0)
+    # 处理紧急情况
+    if emergency_times:
+        store_emergency_records(device_id, [{
+            "time": event_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "message": "检测到摔倒，需要紧急救助",
+            "location": "未知",
+            "resolved": False
+        } for event_time in emergency_times])
+
+    devices.publish(device_id, "status")
+
+
+def parse_snapshot_time(value, now):
+    """批量上报中快照的时间：支持 "%Y-%m-%d %H:%M:%S" 或 Unix 时间戳，无效时返回 None；晚于服务器时间的按当前时间处理"""
+    try:
+        if isinstance(value, (int, float)):
+            snapshot_time = datetime.fromtimestamp(value)
+        else:
+            snapshot_time = datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+    return min(snapshot_time, now)
+
+
+def apply_status_batch(state, snapshots):
+    """
+    按时间顺序应用一批状态快照（调用方保证对该设备串行执行）
+
+    早于设备最近一次上报时间的快照已被后续状态覆盖，直接跳过。
+    返回: (按日期的历史数据, 紧急记录时间列表, 应用条数)
+    """
+    day_entries = {}
+    emergency_times = []
+    applied = 0
+
+    last_update = state.status.get("last_update")
+    last_time = datetime.strptime(last_update, "%Y-%m-%d %H:%M:%S") if last_update else None
+
+    for snapshot_time, data in snapshots:
+        if last_time and snapshot_time < last_time:
+            continue
+        today_entry, record_emergency = apply_status_update(state, data, snapshot_time)
+        day_entries[snapshot_time.strftime("%Y-%m-%d")] = today_entry
+        if record_emergency:
+            emergency_times.append(snapshot_time)
+        last_time = snapshot_time
+        applied += 1
+
+    return day_entries, emergency_times, applied
+
+
+@app.route('/api/status/batch', methods=['POST'])
+def update_status_batch():
+    """
+    批量接收状态快照（设备缓冲上报或离线恢复后补传）
+
+    请求体: {"device_id": ..., "statuses": [{...状态字段, "timestamp": ...}, ...]}
+    每条快照与 /api/status 的请求体相同，按 timestamp 顺序逐条累加步数和碳减排。
+    带 "delta": true 的快照只包含相对前一条快照变化的字段（第一条必须是完整快照）。
+    """
+    try:
+        data = request.json
+        if isinstance(data, list):
+            data = {"statuses": data}
+        elif not isinstance(data, dict):
+            data = {}
+        items = data.get("statuses")
+        if not isinstance(items, list):
+            return jsonify({"status": "error", "message": "statuses 必须是数组"}), 400
+        if len(items) > config.STATUS_BATCH_MAX:
+            return jsonify({"status": "error", "message": f"单次最多 {config.STATUS_BATCH_MAX} 条"}), 400
+
+        current_time = datetime.now()
+        snapshots = []
+        rejected = 0
+        previous = None
+        for item in items:
+            if isinstance(item, dict) and item.get("delta"):
+                if previous is None:
+                    rejected += 1
+                    continue
+                item = {**previous, **item}
+            if not isinstance(item, dict) or item.get("mode", 0) not in MODE_VALUES:
+                rejected += 1
+                continue
+            previous = item
+            snapshot_time = parse_snapshot_time(item.get("timestamp"), current_time)
+            if snapshot_time is None:
+                rejected += 1
+                continue
+            snapshots.append((snapshot_time, item))
+        snapshots.sort(key=lambda snapshot: snapshot[0])
+
+        device_id = request_device_id(data) or DEFAULT_DEVICE_ID
+        applied = 0
+        if snapshots:
+            day_entries, emergency_times, applied = devices.update(
+                device_id, lambda state: apply_status_batch(state, snapshots)
+            )
+            devices.touch(device_id)
+            if applied:
+                persist_status_updates(device_id, day_entries, emergency_times)
+
+        commands = devices.pop_commands(device_id)
+
+        return jsonify({
+            "status": "ok",
+            "accepted": applied,
+            "skipped": len(snapshots) - applied,
+            "rejected": rejected,
+            "commands": commands,
+            "sitting_remind_duration": get_sitting_remind_duration(),
+            "delta_supported": True
+        })
+
+    except Exception as e:
+        print(f"批量更新状态错误: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def _status_snapshot(state, now):
+    """状态副本；跨天重置和离线判定只作用于本次读取"""
+    state.rollover(now)
+    status = state.status
 
     # 设备在线检测
-    if device_status["last_update"]:
+    if status["last_update"]:
         try:
-            last_time = datetime.strptime(device_status["last_update"], "%Y-%m-%d %H:%M:%S")
-            if datetime.now() - last_time > timedelta(seconds=10):
-                device_status["online"] = False
+            last_time = datetime.strptime(status["last_update"], "%Y-%m-%d %H:%M:%S")
+            if now - last_time > timedelta(seconds=10):
+                status["online"] = False
         except:
-            device_status["online"] = False
+            status["online"] = False
 
-    device_status['carbon_reduce_all'] = round(carbon_from_history, 4)
+    return dict(status)
 
-    return jsonify(device_status)
+
+def build_status_payload(device_id=None, days=None):
+    """生成设备状态（GET /api/status 与 SSE 推送共用）；未指定设备时使用最近活跃的设备"""
+    device_id = device_id or devices.primary_id
+    today = datetime.now()
+
+    if days and days > 0:
+        days = min(days, MAX_STATUS_DAYS)
+        carbon_from_history = aggregates.sum_days(device_id, "carbon_reduce", days, today)
+    else:
+        carbon_from_history = aggregates.total(device_id, "carbon_reduce")
+
+    payload = devices.read(device_id, lambda state: _status_snapshot(state, today))
+    payload['carbon_reduce_all'] = round(carbon_from_history, 4)
+    payload['device_id'] = device_id
+    return payload
+
+
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    """获取设备状态"""
+    days = request.args.get('days', type=int)
+    return jsonify(build_status_payload(request_device_id(), days))
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """SSE 推送：状态变化时推送 status，其余数据变化时推送对应事件供页面重新拉取"""
+    days = request.args.get('days', type=int)
+    device_id = request_device_id() or devices.primary_id
+
+    def generate():
+        version = devices.version(device_id)
+        yield _sse_event("status", build_status_payload(device_id, days))
+        while True:
+            version, topics = devices.wait(device_id, version, timeout=STREAM_KEEPALIVE)
+            if not topics:
+                yield ": keepalive\n\n"
+                continue
+            for topic in sorted(topics):
+                if topic == "status":
+                    yield _sse_event("status", build_status_payload(device_id, days))
+                else:
+                    yield _sse_event(topic, {"version": version})
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/commands', methods=['GET'])
+def poll_commands():
+    """设备端长轮询获取命令，有命令立即返回，否则最多等待 timeout 秒"""
+    timeout = request.args.get('timeout', COMMAND_POLL_TIMEOUT, type=float)
+    timeout = max(0.0, min(timeout, COMMAND_POLL_MAX_TIMEOUT))
+    device_id = request_device_id() or DEFAULT_DEVICE_ID
+    return jsonify({
+        "status": "ok",
+        "commands": devices.pop_commands(device_id, timeout),
+        "sitting_remind_duration": get_sitting_remind_duration()
+    })
 
 @app.route('/api/control', methods=['POST'])
 def send_control():
-    """发送控制命令"""
+    """发送控制命令（未指定设备时发给最近活跃的设备）"""
     try:
         data = request.json or {}
         command = data.get("command")
@@ -570,9 +591,10 @@ def send_control():
         if command == "change_mode" and data.get("mode") not in MODE_VALUES:
             return jsonify({"status": "error", "message": "无效模式值"}), 400
         
-        with command_lock:
-            control_commands.append(data)
-        
+        device_id = request_device_id(data) or devices.primary_id
+        data.pop("device_id", None)
+        devices.push_command(device_id, data)
+
         print(f"收到控制命令: {command}")
         return jsonify({"status": "ok"})
         
@@ -581,45 +603,52 @@ def send_control():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/emergency', methods=['GET'])
+@response_cache.cached("emergency")
 def get_emergency_records():
-    """获取紧急记录"""
-    return jsonify(emergency_records)
+    """获取紧急记录（指定 device_id 时只返回该设备的记录）"""
+    return jsonify(storage.list_emergencies(request_device_id()))
 
 @app.route('/api/emergency/<int:index>', methods=['PUT'])
 def resolve_emergency(index):
     """标记紧急情况已解决"""
     try:
-        if 0 <= index < len(emergency_records):
-            emergency_records[index]["resolved"] = True
-            save_emergency()
+        if storage.resolve_emergency(index):
+            response_cache.bump("emergency")
+            devices.broadcast("emergency")
             return jsonify({"status": "ok"})
         return jsonify({"status": "error", "message": "记录不存在"}), 404
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def _history_vary():
+    """历史查询结果还取决于当前日期和默认设备"""
+    return datetime.now().strftime("%Y-%m-%d"), devices.primary_id
+
+
 @app.route('/api/history', methods=['GET'])
+@response_cache.cached("history", vary=_history_vary)
 def get_history():
     """获取历史数据"""
     days = request.args.get('days', 7, type=int)
     all_records = request.args.get('all', 0, type=int)
 
+    device_id = request_device_id() or devices.primary_id
+
     result = {}
     today = datetime.now()
 
     if all_records:
-        for date in sorted(sport_history.keys()):
-            result[date] = sport_history.get(date, {
-                "sport_time": 0,
-                "activity_hours": [],
-                "step": 0,
-                "carbon_reduce": 0,
-            })
+        return jsonify(storage.get_all_history(device_id))
+
+    days = min(days, MAX_STATUS_DAYS)
+    if days <= 0:
         return jsonify(result)
 
-    for i in range(days):
-        date = (today - timedelta(days=i)).strftime("%Y-%m-%d")
-        if date in sport_history:
-            result[date] = sport_history[date]
+    dates = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    history = storage.get_history_range(dates[-1], dates[0], device_id)
+    for date in dates:
+        if date in history:
+            result[date] = history[date]
         else:
             result[date] = {
                 "sport_time": 0,
@@ -637,30 +666,64 @@ def send_message():
         data = request.json
         message = data.get("message", "")
         
-        with command_lock:
-            control_commands.append({
-                "command": "message",
-                "content": message
-            })
-        
+        devices.push_command(request_device_id(data) or devices.primary_id, {
+            "command": "message",
+            "content": message
+        })
+
         return jsonify({"status": "ok"})
         
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/sport_records', methods=['GET'])
+@response_cache.cached("sport_records")
 def get_sport_records():
-    """获取运动记录"""
+    """
+    获取运动记录（指定 device_id 时只返回该设备的记录，_index 仍为全局序号）
+
+    分页参数:
+    - limit: 每页条数，不传返回全部
+    - reverse=1: 从新到旧；before_index 为上界（不含）
+    - reverse=0: 从旧到新；after_index 为下界（不含），不传时返回最新 limit 条（兼容旧用法）
+    - cursor: 上一页响应头 X-Next-Cursor 的值，按方向等同于 before_index / after_index
+    - fields: 逗号分隔的字段投影，如 time,duration,distance_km；_index 总是返回
+    响应头 X-Total-Count 为记录总数，X-Next-Cursor 仅在还有下一页时返回。
+    """
     include_series = request.args.get('include_series', 0, type=int)
     limit = request.args.get('limit', type=int)
     reverse = request.args.get('reverse', 0, type=int)
-
-    indexed_records = list(enumerate(sport_records))
-    if reverse:
-        indexed_records = indexed_records[::-1]
-
-    if limit and limit > 0:
-        indexed_records = indexed_records[:limit] if reverse else indexed_records[-limit:]
+    after_index = request.args.get('after_index', type=int)
+    before_index = request.args.get('before_index', type=int)
+    cursor = request.args.get('cursor', type=int)
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    device_id = request_device_id()
+
+    if limit is not None and limit <= 0:
+        limit = None
+    if cursor is not None:
+        if reverse:
+            before_index = cursor
+        else:
+            after_index = cursor
+
+    # 多取一条判断是否还有下一页
+    from_end = bool(reverse) or after_index is None
+    indexed_records = storage.page_sport_records(
+        after_index=after_index,
+        before_index=before_index,
+        limit=limit + 1 if limit else None,
+        descending=from_end,
+        device_id=device_id,
+    )
+    has_more = limit is not None and len(indexed_records) > limit
+    if has_more:
+        indexed_records = indexed_records[:limit]
+    if from_end and not reverse:
+        indexed_records.reverse()
+
+    # 只有显式要求逐点数据时才读取详情
+    load_detail = bool(include_series) or any(field in DETAIL_FIELDS for field in fields)
 
     result = []
     for idx, record in indexed_records:
@@ -668,71 +731,89 @@ def get_sport_records():
             result.append({"_index": idx, "data": record})
             continue
 
-        item = normalize_sport_record(record)
+        # 记录入库时已标准化，列表只复制摘要
+        source = storage.get_sport_record(idx) if load_detail else record
+        if fields:
+            item = {field: source[field] for field in fields if field in source}
+        else:
+            item = dict(source)
         item["_index"] = idx
-        if not include_series:
-            item.pop("series", None)
-            item.pop("gnss_track", None)
         result.append(item)
 
-    return jsonify(result)
+    response = jsonify(result)
+    response.headers['X-Total-Count'] = str(storage.count_sport_records(device_id))
+    # 升序且未给下界时返回的是最新一页（兼容旧用法），不提供游标
+    if has_more and result and (reverse or after_index is not None):
+        response.headers['X-Next-Cursor'] = str(result[-1]["_index"])
+    return response
 
 
 @app.route('/api/sport_records/<int:record_index>', methods=['GET'])
+@response_cache.cached()  # 记录写入后不再修改，缓存无需失效
 def get_sport_record(record_index):
     """获取单条运动记录"""
     include_series = request.args.get('include_series', 1, type=int)
 
-    if record_index < 0 or record_index >= len(sport_records):
+    record = storage.get_sport_record(record_index, include_detail=bool(include_series))
+    if record is None:
         return jsonify({"status": "error", "message": "记录不存在"}), 404
 
-    record = sport_records[record_index]
     if not isinstance(record, dict):
         return jsonify(record)
 
-    item = normalize_sport_record(record)
+    item = dict(record)
     item["_index"] = record_index
-    if not include_series:
-        item.pop("series", None)
-        item.pop("gnss_track", None)
     return jsonify(item)
 
 @app.route('/api/sport_records', methods=['POST'])
 def add_sport_record():
-    """添加运动记录"""
+    """添加运动记录（JSON 或列式二进制）"""
     try:
-        data = request.json or {}
+        data = request_payload() or {}
         if not data:
             return jsonify({"status": "error", "message": "数据为空"}), 400
-        sport_records.append(normalize_sport_record(data))
-        save_sport_records()
-        return jsonify({"status": "ok"})
+        device_id = request_device_id(data) or DEFAULT_DEVICE_ID
+        added = store_sport_records(device_id, [normalize_sport_record(data)])
+        return jsonify({"status": "ok", "duplicate": not added})
+    except CodecError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
 @app.route('/api/sync_records', methods=['POST'])
 def sync_records():
-    """批量同步运动记录（离线模式切换到在线时使用）"""
+    """
+    批量同步运动记录（离线模式切换到在线时使用，JSON 或列式二进制）
+
+    设备端分块上传，响应中的 acked_ids 为已保存记录的 record_id。
+    """
     try:
-        data = request.json or {}
+        data = request_payload() or {}
         records = data.get("records", [])
 
         if not records:
             return jsonify({"status": "ok", "synced_count": 0})
 
-        synced_count = 0
-        for record in records:
-            sport_records.append(normalize_sport_record(record))
-            synced_count += 1
-
-        save_sport_records()
-        print(f"[同步] 批量接收 {synced_count} 条运动记录")
-
+        device_id = request_device_id(data) or DEFAULT_DEVICE_ID
+        normalized = [normalize_sport_record(record) for record in records]
+        added = store_sport_records(device_id, normalized)
+        synced_count = len(normalized)
+        print(f"[同步] 批量接收 {synced_count} 条运动记录，新增 {added} 条")
+
+        # 设备端按 record_id 确认后从待同步队列中删除（重复上传的记录同样确认）
+        acked_ids = [
+            record["record_id"] for record in normalized
+            if isinstance(record, dict) and record.get("record_id")
+        ]
         return jsonify({
             "status": "ok",
-            "synced_count": synced_count
+            "synced_count": synced_count,
+            "duplicates": synced_count - added,
+            "acked_ids": acked_ids
         })
+    except CodecError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         print(f"批量同步错误: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -743,17 +824,17 @@ def sync_emergency():
     """批量同步紧急记录"""
     try:
         data = request.json
-        records = data.get("records", [])
+        if not isinstance(data, dict):
+            return jsonify({"status": "error", "message": "请求体必须是 JSON 对象"}), 400
+        records = data.get("records") or []
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            return jsonify({"status": "error", "message": "records 必须是记录对象数组"}), 400
 
         if not records:
             return jsonify({"status": "ok", "synced_count": 0})
 
-        synced_count = 0
-        for record in records:
-            emergency_records.append(record)
-            synced_count += 1
-
-        save_emergency()
+        store_emergency_records(request_device_id(data) or DEFAULT_DEVICE_ID, records)
+        synced_count = len(records)
         print(f"[同步] 批量接收 {synced_count} 条紧急记录")
 
         return jsonify({
@@ -767,51 +848,90 @@ def sync_emergency():
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
     """获取设置"""
-    return jsonify({"sitting_remind_duration": sitting_remind_duration})
+    return jsonify({"sitting_remind_duration": get_sitting_remind_duration()})
 
 @app.route('/api/settings', methods=['POST'])
 def update_settings():
     """更新设置"""
-    global sitting_remind_duration
     try:
         data = request.json or {}
-        new_duration = int(data.get("sitting_remind_duration", sitting_remind_duration))
+        new_duration = int(data.get("sitting_remind_duration", get_sitting_remind_duration()))
         if new_duration < 60:
             return jsonify({"status": "error", "message": "提醒时长不能小于60秒"}), 400
 
-        sitting_remind_duration = new_duration
-        save_settings()
+        save_settings({"sitting_remind_duration": new_duration})
         return jsonify({"status": "ok"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/devices', methods=['GET'])
+def list_devices():
+    """列出已上报过状态的设备及其在线情况"""
+    now = datetime.now()
+    result = []
+    for state in devices.snapshots():
+        status = _status_snapshot(state, now)
+        if not status["last_update"]:
+            continue
+        result.append({
+            "device_id": state.device_id,
+            "online": status["online"],
+            "mode": status["mode"],
+            "last_update": status["last_update"],
+        })
+    result.sort(key=lambda item: item["last_update"], reverse=True)
+    return jsonify({"primary": devices.primary_id, "devices": result})
+
 # ==================== 启动服务 ====================
+def _is_stale(status, now):
+    """在线但超过10秒未上报"""
+    if not status["last_update"] or not status["online"]:
+        return False
+    try:
+        last_time = datetime.strptime(status["last_update"], "%Y-%m-%d %H:%M:%S")
+        return now - last_time > timedelta(seconds=10)
+    except:
+        return False
+
+
+def _mark_offline(state, now):
+    if not _is_stale(state.status, now):
+        return False
+    state.status["online"] = False
+    return True
+
+
 def check_offline():
-    """定期检查设备在线状态"""
+    """定期检查各设备在线状态（先在快照中筛选，只对超时设备加锁修改）"""
     while True:
         time.sleep(5)
-        if device_status["last_update"]:
-            try:
-                last_time = datetime.strptime(device_status["last_update"], "%Y-%m-%d %H:%M:%S")
-                if datetime.now() - last_time > timedelta(seconds=10):
-                    if device_status["online"]:
-                        device_status["online"] = False
-                        print("设备已离线")
-            except:
-                pass
+        now = datetime.now()
+        for state in devices.snapshots():
+            if not _is_stale(state.status, now):
+                continue
+            if devices.update(state.device_id, lambda current: _mark_offline(current, now)):
+                devices.publish(state.device_id, "status")
+                print(f"设备已离线: {state.device_id}")
+
+
+def init_server():
+    """加载数据并启动后台线程（开发服务器与 wsgi.py 共用）"""
+    load_data()
+    offline_thread = threading.Thread(target=check_offline, daemon=True)
+    offline_thread.start()
+
 
 if __name__ == "__main__":
+    # SIGTERM 也走正常退出流程，触发 atexit 中的写线程落盘
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     print("=" * 50)
     print("运动腰带Flask服务器")
     print("=" * 50)
     
-    load_data()
-    init_device_daily_counters_from_history()
-    print(f"✓ 加载历史数据: {len(emergency_records)}条紧急记录")
-    print(f"✓ 加载运动记录: {len(sport_records)}条")
-    
-    offline_thread = threading.Thread(target=check_offline, daemon=True)
-    offline_thread.start()
+    init_server()
+    print(f"✓ 存储后端: {config.STORAGE_BACKEND}")
+    print(f"✓ 加载运动记录: {storage.count_sport_records()}条")
     
     print("✓ 服务器启动在 http://0.0.0.0:5000")
     print("✓ 控制页面: http://localhost:5000")
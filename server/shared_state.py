@@ -0,0 +1,240 @@
+# -*- coding: UTF-8 -*-
+"""
+多工作进程共享状态（SQLite）
+
+生产部署（wsgi.py）下多个工作进程各自处理请求，进程内的设备状态、命令队列、
+事件中心和缓存版本号无法共享，这里把它们放进与存储后端相同的 SQLite 库：
+- device_state: 每台设备一行（状态 JSON），读-改-写在 BEGIN IMMEDIATE 事务中完成
+- device_commands: 命令队列，取出即删除
+- device_events: 变更事件，自增 id 即版本号；device_id 为 '*' 的事件发给所有设备
+- data_versions: 只读接口缓存的数据版本号
+
+跨进程没有条件变量，长轮询和 SSE 按 poll_interval 查询事件/命令表。
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from devices import DeviceState
+from storage import DEFAULT_DEVICE_ID
+
+SHARED_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_state (
+    device_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS device_commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_device_commands_device ON device_commands (device_id, id);
+
+CREATE TABLE IF NOT EXISTS device_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    topic TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_device_events_device ON device_events (device_id, id);
+
+CREATE TABLE IF NOT EXISTS shared_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    dataset TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+BROADCAST_DEVICE_ID = "*"
+EVENT_RETENTION = 10000     # 事件表保留的最近事件条数
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class _SqliteShared:
+    """每线程一个连接，自动提交模式，写操作显式使用 BEGIN IMMEDIATE"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def load(self):
+        """建表（多个进程同时执行也安全）"""
+        self._conn().executescript(SHARED_STATE_SCHEMA)
+
+
+class SqliteDeviceRegistry(_SqliteShared):
+    """跨进程共享的设备注册表，接口与 devices.DeviceRegistry 一致"""
+
+    def __init__(self, db_path, on_create=None, poll_interval=0.2):
+        super().__init__(db_path)
+        self._on_create = on_create
+        self.poll_interval = poll_interval
+
+    def _new_state(self, device_id):
+        state = DeviceState(device_id)
+        if self._on_create:
+            self._on_create(state)
+        return state
+
+    def _load_state(self, conn, device_id):
+        row = conn.execute("SELECT data FROM device_state WHERE device_id = ?", (device_id,)).fetchone()
+        if row is None:
+            return None
+        return DeviceState.from_dict(device_id, json.loads(row["data"]))
+
+    # ---------- 状态 ----------
+    def update(self, device_id, fn):
+        """在写事务中执行 fn(state) 并写回，返回 fn 的返回值"""
+        with self._transaction() as conn:
+            state = self._load_state(conn, device_id) or self._new_state(device_id)
+            result = fn(state)
+            conn.execute(
+                "INSERT OR REPLACE INTO device_state (device_id, data) VALUES (?, ?)",
+                (device_id, _dumps(state.to_dict())),
+            )
+        return result
+
+    def read(self, device_id, fn):
+        """读取状态副本并执行 fn(state)，修改不写回"""
+        state = self._load_state(self._conn(), device_id) or self._new_state(device_id)
+        return fn(state)
+
+    @property
+    def primary_id(self):
+        row = self._conn().execute("SELECT value FROM shared_meta WHERE key = 'primary_device'").fetchone()
+        return row["value"] if row else DEFAULT_DEVICE_ID
+
+    def touch(self, device_id):
+        """记录最近活跃设备；未变化时不写库"""
+        if self.primary_id == device_id:
+            return
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_meta (key, value) VALUES ('primary_device', ?)",
+                (device_id,),
+            )
+
+    def device_ids(self):
+        rows = self._conn().execute("SELECT device_id FROM device_state").fetchall()
+        return [row["device_id"] for row in rows]
+
+    def snapshots(self):
+        rows = self._conn().execute("SELECT device_id, data FROM device_state").fetchall()
+        return [DeviceState.from_dict(row["device_id"], json.loads(row["data"])) for row in rows]
+
+    # ---------- 命令队列 ----------
+    def push_command(self, device_id, command):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO device_commands (device_id, data) VALUES (?, ?)",
+                (device_id, _dumps(command)),
+            )
+
+    def _take_commands(self, device_id):
+        conn = self._conn()
+        if not conn.execute("SELECT 1 FROM device_commands WHERE device_id = ? LIMIT 1", (device_id,)).fetchone():
+            return []
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, data FROM device_commands WHERE device_id = ? ORDER BY id", (device_id,)
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    "DELETE FROM device_commands WHERE device_id = ? AND id <= ?",
+                    (device_id, rows[-1]["id"]),
+                )
+        return [json.loads(row["data"]) for row in rows]
+
+    def pop_commands(self, device_id, timeout=0):
+        """取出全部待执行命令；timeout > 0 时按 poll_interval 轮询等待"""
+        deadline = time.monotonic() + timeout
+        while True:
+            commands = self._take_commands(device_id)
+            remaining = deadline - time.monotonic()
+            if commands or remaining <= 0:
+                return commands
+            time.sleep(min(self.poll_interval, remaining))
+
+    # ---------- 变更通知 ----------
+    def publish(self, device_id, topic):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO device_events (device_id, topic) VALUES (?, ?)", (device_id, topic)
+            )
+            version = cursor.lastrowid
+            if version % 1000 == 0:
+                conn.execute("DELETE FROM device_events WHERE id <= ?", (version - EVENT_RETENTION,))
+        return version
+
+    def broadcast(self, topic):
+        self.publish(BROADCAST_DEVICE_ID, topic)
+
+    def version(self, device_id):
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM device_events").fetchone()[0]
+
+    def wait(self, device_id, since, timeout=None):
+        """等待 since 之后发给该设备（或全部设备）的事件，返回 (最新版本号, 话题集合)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            rows = self._conn().execute(
+                "SELECT id, topic FROM device_events WHERE id > ? AND device_id IN (?, ?) ORDER BY id",
+                (since, device_id, BROADCAST_DEVICE_ID),
+            ).fetchall()
+            if rows:
+                return rows[-1]["id"], {row["topic"] for row in rows}
+
+            if deadline is None:
+                time.sleep(self.poll_interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return since, set()
+            time.sleep(min(self.poll_interval, remaining))
+
+
+class SqliteVersionCounter(_SqliteShared):
+    """跨进程共享的数据版本号（供 ResponseCache 使用）"""
+
+    def bump(self, dataset):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO data_versions (dataset, version) VALUES (?, 1) "
+                "ON CONFLICT(dataset) DO UPDATE SET version = version + 1",
+                (dataset,),
+            )
+
+    def versions(self, datasets):
+        rows = self._conn().execute("SELECT dataset, version FROM data_versions").fetchall()
+        current = {row["dataset"]: row["version"] for row in rows}
+        return tuple(current.get(dataset, 0) for dataset in datasets)
@@ -0,0 +1,233 @@
+# -*- coding: UTF-8 -*-
+"""
+运动记录格式处理
+
+- normalize_sport_record: 标准化运动记录，兼容旧记录缺失字段的情况
+- split_sport_record: 拆分为摘要（列表接口使用）和详情（逐点 series / gnss_track）
+
+记录在入库时标准化并拆分一次，列表接口只读摘要，不再逐点处理。
+"""
+
+from config import CARBON_PER_STEP
+
+# 只在详情中保存的逐点字段
+DETAIL_FIELDS = ("series", "gnss_track")
+
+
+def _safe_int(value, default=0):
+    """安全转换为整数"""
+    try:
+        return int(value)
+    except Exception:
+        return default
+
+
+def _safe_float(value, default=0.0):
+    """安全转换为浮点数"""
+    try:
+        return float(value)
+    except Exception:
+        return default
+
+
+def _build_pace_str(duration_seconds, distance_km):
+    """根据时长和距离生成配速字符串"""
+    duration_seconds = _safe_float(duration_seconds, 0)
+    distance_km = _safe_float(distance_km, 0)
+
+    if duration_seconds <= 0 or distance_km <= 0:
+        return None
+
+    pace_min_per_km = (duration_seconds / 60.0) / distance_km
+    if pace_min_per_km <= 0 or pace_min_per_km > 99:
+        return None
+
+    minutes = int(pace_min_per_km)
+    seconds = int(round((pace_min_per_km - minutes) * 60))
+    if seconds >= 60:
+        minutes += 1
+        seconds -= 60
+    return f"{minutes}'{seconds:02d}\""
+
+
+def normalize_sport_record(record):
+    """标准化运动记录，兼容旧记录缺失字段的情况"""
+    if not isinstance(record, dict):
+        return record
+
+    item = dict(record)
+    series = item.get("series")
+
+    distance_km = _safe_float(item.get("distance_km"), 0)
+    distance_step_km = _safe_float(item.get("distance_step_km"), 0)
+    distance_gnss_km = _safe_float(item.get("distance_gnss_km"), 0)
+    distance_source = item.get("distance_source") if isinstance(item.get("distance_source"), str) else ""
+    avg_stride_m = _safe_float(item.get("avg_stride_m"), 0)
+    avg_cadence_spm = _safe_float(item.get("avg_cadence_spm"), 0)
+    carbon_reduce = _safe_float(item.get("carbon_reduce"), 0)
+    gnss_valid_ratio = _safe_float(item.get("gnss_valid_ratio"), 0)
+    gnss_fix_samples = max(0, _safe_int(item.get("gnss_fix_samples"), 0))
+    gnss_total_samples = max(0, _safe_int(item.get("gnss_total_samples"), 0))
+    gnss_satellite_max = max(0, _safe_int(item.get("gnss_satellite_max"), 0))
+
+    clean_gnss_track = []
+    raw_gnss_track = item.get("gnss_track")
+    if isinstance(raw_gnss_track, list):
+        for point in raw_gnss_track:
+            if not isinstance(point, dict):
+                continue
+
+            lat = _safe_float(point.get("lat"), None)
+            lon = _safe_float(point.get("lon"), None)
+            if lat is None or lon is None:
+                continue
+            if abs(lat) > 90 or abs(lon) > 180:
+                continue
+
+            clean_point = {
+                "lat": round(lat, 7),
+                "lon": round(lon, 7),
+            }
+
+            t = _safe_int(point.get("t"), None)
+            if t is not None and t >= 0:
+                clean_point["t"] = t
+
+            point_distance_km = _safe_float(point.get("distance_km"), None)
+            if point_distance_km is not None and point_distance_km >= 0:
+                clean_point["distance_km"] = round(point_distance_km, 3)
+
+            satellites = _safe_int(point.get("satellites"), None)
+            if satellites is not None and satellites >= 0:
+                clean_point["satellites"] = satellites
+
+            speed_kmh = _safe_float(point.get("speed_kmh"), None)
+            if speed_kmh is None:
+                speed_kmh = _safe_float(point.get("gnss_speed_kmh"), None)
+            if speed_kmh is not None and speed_kmh >= 0:
+                clean_point["speed_kmh"] = round(speed_kmh, 2)
+
+            heading_deg = _safe_float(point.get("heading_deg"), None)
+            if heading_deg is not None:
+                clean_point["heading_deg"] = round(heading_deg % 360, 1)
+
+            utc = point.get("utc")
+            if isinstance(utc, str) and utc:
+                clean_point["utc"] = utc
+
+            clean_gnss_track.append(clean_point)
+
+    if clean_gnss_track:
+        item["gnss_track"] = clean_gnss_track
+        if distance_gnss_km <= 0:
+            track_distances = [_safe_float(point.get("distance_km"), 0) for point in clean_gnss_track]
+            valid_track_distances = [value for value in track_distances if value >= 0]
+            if valid_track_distances:
+                distance_gnss_km = round(max(valid_track_distances), 3)
+    elif "gnss_track" in item:
+        item["gnss_track"] = []
+
+    if isinstance(series, list) and series:
+        distance_points = [_safe_float(point.get("distance_km"), 0) for point in series if isinstance(point, dict)]
+        stride_points = [_safe_float(point.get("stride_m"), 0) for point in series if isinstance(point, dict)]
+        cadence_points = [_safe_float(point.get("cadence_spm"), 0) for point in series if isinstance(point, dict)]
+        carbon_points = [_safe_float(point.get("carbon_reduce"), 0) for point in series if isinstance(point, dict)]
+
+        valid_distances = [value for value in distance_points if value > 0]
+        valid_strides = [value for value in stride_points if value > 0]
+        valid_cadences = [value for value in cadence_points if value > 0]
+        valid_carbons = [value for value in carbon_points if value >= 0]
+
+        if distance_km <= 0 and valid_distances:
+            distance_km = round(max(valid_distances), 3)
+
+        if avg_stride_m <= 0 and valid_strides:
+            avg_stride_m = round(sum(valid_strides) / len(valid_strides), 2)
+
+        if avg_cadence_spm <= 0 and valid_cadences:
+            avg_cadence_spm = round(sum(valid_cadences) / len(valid_cadences), 1)
+
+        if carbon_reduce <= 0 and valid_carbons:
+            carbon_reduce = round(max(valid_carbons), 2)
+
+    steps = max(0, _safe_int(item.get("step"), 0))
+    duration = max(0, _safe_float(item.get("duration"), 0))
+
+    if distance_step_km <= 0 and distance_source != "gnss" and distance_km > 0:
+        distance_step_km = round(distance_km, 3)
+    if distance_source == "gnss" and distance_gnss_km <= 0 and distance_km > 0:
+        distance_gnss_km = round(distance_km, 3)
+
+    if distance_source == "gnss" and distance_gnss_km > 0:
+        distance_km = distance_gnss_km
+    elif distance_km <= 0:
+        if distance_step_km > 0:
+            distance_km = distance_step_km
+        elif distance_gnss_km > 0:
+            distance_km = distance_gnss_km
+    if distance_km <= 0 and steps > 0 and avg_stride_m > 0:
+        distance_km = round((steps * avg_stride_m) / 1000.0, 3)
+
+    if avg_stride_m <= 0 and steps > 0 and distance_km > 0:
+        avg_stride_m = round((distance_km * 1000.0) / steps, 2)
+
+    if avg_cadence_spm <= 0 and steps > 0 and duration > 0:
+        avg_cadence_spm = round((steps / duration) * 60.0, 1)
+
+    if carbon_reduce <= 0 and steps > 0:
+        carbon_reduce = round(steps * CARBON_PER_STEP, 2)
+
+    if not item.get("pace"):
+        item["pace"] = _build_pace_str(duration, distance_km) or "--'--\""
+
+    gnss_valid_ratio = min(1.0, max(0.0, gnss_valid_ratio))
+    if gnss_total_samples > 0 and gnss_fix_samples > gnss_total_samples:
+        gnss_fix_samples = gnss_total_samples
+
+    if distance_source not in ("step", "gnss"):
+        distance_source = "gnss" if distance_gnss_km > 0 else "step"
+    elif distance_source == "gnss" and distance_gnss_km <= 0 and distance_step_km > 0:
+        distance_source = "step"
+
+    if distance_km > 0:
+        item["distance_km"] = distance_km
+    if distance_step_km > 0:
+        item["distance_step_km"] = distance_step_km
+    if distance_gnss_km > 0:
+        item["distance_gnss_km"] = distance_gnss_km
+    if avg_stride_m > 0:
+        item["avg_stride_m"] = avg_stride_m
+    if avg_cadence_spm > 0:
+        item["avg_cadence_spm"] = avg_cadence_spm
+    item["distance_source"] = distance_source
+    item["carbon_reduce"] = round(max(0, carbon_reduce), 2)
+    item["gnss_valid_ratio"] = gnss_valid_ratio
+    item["gnss_fix_samples"] = gnss_fix_samples
+    item["gnss_total_samples"] = gnss_total_samples
+    item["gnss_satellite_max"] = gnss_satellite_max
+
+    return item
+
+
+def split_sport_record(record):
+    """
+    拆分运动记录
+
+    返回: (摘要, 详情)，没有逐点数据时详情为 None
+    """
+    if not isinstance(record, dict):
+        return record, None
+
+    summary = {key: value for key, value in record.items() if key not in DETAIL_FIELDS}
+    detail = {key: record[key] for key in DETAIL_FIELDS if key in record}
+    return summary, (detail or None)
+
+
+def merge_sport_record(summary, detail):
+    """合并摘要和详情为完整记录"""
+    if not isinstance(summary, dict):
+        return summary
+    item = dict(summary)
+    if detail:
+        item.update(detail)
+    return item
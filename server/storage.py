@@ -0,0 +1,714 @@
+# -*- coding: UTF-8 -*-
+"""
+服务端持久化层
+
+两种后端，接口一致，由 config.STORAGE_BACKEND 选择:
+- JsonStorage: data/*.json 文件，数据常驻内存（默认）
+- SqliteStorage: data/smart_belt.db，按日期/记录时间/设备建索引，查询直接走索引
+
+历史数据、紧急记录、运动记录、设置项均通过本模块读写，server.py 不再直接持有数据。
+历史数据按设备分区；紧急记录和运动记录带 device_id 字段，可按设备过滤，序号全局唯一。
+
+JSON 后端挂接后台写线程（attach_writer）后，写接口只改内存并标记数据集为脏，
+由写线程合并后调用 flush(datasets) 落盘；未挂接时写接口直接落盘。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+
+from record_store import SportRecordStore
+from sport_records import merge_sport_record, normalize_sport_record, split_sport_record
+
+DEFAULT_DEVICE_ID = "default"
+
+# 可单独落盘的数据集
+DATASETS = ("history", "emergency", "settings", "sport_records")
+
+
+def atomic_save(filepath, data):
+    """原子性保存：先写临时文件，再重命名"""
+    temp_path = filepath + ".tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, filepath)
+    except Exception as e:
+        print(f"保存失败 {filepath}: {e}")
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except:
+                pass
+
+
+def _load_json(filepath, default):
+    """读取JSON文件，失败返回默认值"""
+    try:
+        if os.path.exists(filepath):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return default
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _record_device_id(record):
+    if isinstance(record, dict) and record.get("device_id"):
+        return str(record["device_id"])
+    return DEFAULT_DEVICE_ID
+
+
+def _record_id(record):
+    """设备端生成的记录唯一ID（旧记录没有时返回 None）"""
+    if isinstance(record, dict) and record.get("record_id"):
+        return str(record["record_id"])
+    return None
+
+
+def _parse_history(data):
+    """新格式 {"devices": {设备ID: {日期: 数据}}}；旧格式 {日期: 数据} 归入默认设备"""
+    if not isinstance(data, dict):
+        return {}
+    devices = data.get("devices")
+    if isinstance(devices, dict):
+        return {str(device_id): days for device_id, days in devices.items() if isinstance(days, dict)}
+    return {DEFAULT_DEVICE_ID: data} if data else {}
+
+
+def _json_paths(data_dir):
+    return {
+        "emergency": os.path.join(data_dir, "emergency.json"),
+        "history": os.path.join(data_dir, "history.json"),
+        "sport_records": os.path.join(data_dir, "sport_records.json"),
+        "sport_records_log": os.path.join(data_dir, "sport_records.log"),
+        "sport_record_details": os.path.join(data_dir, "sport_record_details.log"),
+        "settings": os.path.join(data_dir, "settings.json"),
+    }
+
+
+# ==================== JSON 后端 ====================
+class JsonStorage:
+    """JSON 文件后端：数据常驻内存，历史/紧急记录/设置整文件保存，运动记录追加写"""
+
+    def __init__(self, data_dir, compact_threshold=200):
+        self.paths = _json_paths(data_dir)
+        self.history = {}            # {设备ID: {日期: 数据}}
+        self.emergency_records = []
+        self.settings = {}
+        self.record_store = SportRecordStore(
+            self.paths["sport_records"],
+            self.paths["sport_records_log"],
+            self.paths["sport_record_details"],
+            compact_threshold=compact_threshold,
+        )
+        self._device_records = {}    # {设备ID: [运动记录序号]}
+        self._record_ids = set()     # 已保存记录的 record_id，重复上传时直接跳过
+        self._lock = threading.RLock()
+        self.on_dirty = None         # 后台写线程的脏标记回调
+
+    def attach_writer(self, mark_dirty):
+        """挂接后台写线程：此后写接口不再直接落盘"""
+        self.on_dirty = mark_dirty
+        self.record_store.write_behind = True
+
+    def _changed(self, dataset):
+        if self.on_dirty:
+            self.on_dirty(dataset)
+        else:
+            self.flush([dataset])
+
+    def load(self):
+        """加载全部数据"""
+        self.history = _parse_history(_load_json(self.paths["history"], {}))
+
+        emergency_records = _load_json(self.paths["emergency"], [])
+        self.emergency_records = emergency_records if isinstance(emergency_records, list) else []
+
+        settings = _load_json(self.paths["settings"], {})
+        self.settings = settings if isinstance(settings, dict) else {}
+
+        try:
+            self.record_store.load()
+        except Exception as e:
+            print(f"加载运动记录失败: {e}")
+            self.record_store.records = []
+
+        self._device_records = {}
+        self._record_ids = set()
+        self._index_device_records(0)
+
+    def _index_device_records(self, start):
+        """为 start 之后的运动记录建立设备索引和 record_id 索引"""
+        records = self.record_store.records
+        for idx in range(start, len(records)):
+            self._device_records.setdefault(_record_device_id(records[idx]), []).append(idx)
+            record_id = _record_id(records[idx])
+            if record_id:
+                self._record_ids.add(record_id)
+
+    # ---------- 历史数据 ----------
+    def get_history_day(self, date, device_id=DEFAULT_DEVICE_ID):
+        return self.history.get(device_id, {}).get(date)
+
+    def put_history_day(self, date, entry, device_id=DEFAULT_DEVICE_ID):
+        with self._lock:
+            self.history.setdefault(device_id, {})[date] = entry
+        self._changed("history")
+
+    def get_history_range(self, first_date, last_date, device_id=DEFAULT_DEVICE_ID):
+        """查询 [first_date, last_date]（YYYY-MM-DD）内的历史，只返回存在的日期"""
+        with self._lock:
+            history = self.history.get(device_id, {})
+            return {date: entry for date, entry in history.items() if first_date <= date <= last_date}
+
+    def get_all_history(self, device_id=DEFAULT_DEVICE_ID):
+        """按日期升序返回全部历史"""
+        with self._lock:
+            history = self.history.get(device_id, {})
+            return {date: history[date] for date in sorted(history.keys())}
+
+    def sum_history(self, field, first_date=None, last_date=None, device_id=DEFAULT_DEVICE_ID):
+        """对历史字段求和；first_date / last_date（含，YYYY-MM-DD）为空时不限制该端"""
+        with self._lock:
+            history = self.history.get(device_id, {})
+            entries = [
+                entry for date, entry in history.items()
+                if (first_date is None or date >= first_date) and (last_date is None or date <= last_date)
+            ]
+        return sum(entry.get(field, 0) or 0 for entry in entries if isinstance(entry, dict))
+
+    def list_history_devices(self):
+        with self._lock:
+            return sorted(self.history.keys())
+
+    # ---------- 紧急记录 ----------
+    def add_emergencies(self, records):
+        with self._lock:
+            self.emergency_records.extend(records)
+        self._changed("emergency")
+
+    def list_emergencies(self, device_id=None):
+        """返回紧急记录；指定 device_id 时只返回该设备的记录"""
+        if device_id is None:
+            return list(self.emergency_records)
+        return [record for record in self.emergency_records if _record_device_id(record) == device_id]
+
+    def resolve_emergency(self, index):
+        with self._lock:
+            if not 0 <= index < len(self.emergency_records):
+                return False
+            self.emergency_records[index]["resolved"] = True
+        self._changed("emergency")
+        return True
+
+    # ---------- 运动记录 ----------
+    def add_sport_records(self, records):
+        """
+        追加已标准化的记录，存储时拆分为摘要和详情
+
+        record_id 已存在的记录（设备端重试上传）跳过，返回实际新增条数。
+        """
+        with self._lock:
+            new_records = []
+            seen = set()
+            for record in records:
+                record_id = _record_id(record)
+                if record_id:
+                    if record_id in self._record_ids or record_id in seen:
+                        continue
+                    seen.add(record_id)
+                new_records.append(record)
+            if not new_records:
+                return 0
+
+            start = len(self.record_store.records)
+            self.record_store.extend(new_records)
+            self._index_device_records(start)
+        if self.on_dirty:
+            self.on_dirty("sport_records")
+        return len(new_records)
+
+    def count_sport_records(self, device_id=None):
+        if device_id is None:
+            return len(self.record_store.records)
+        return len(self._device_records.get(device_id, ()))
+
+    def get_sport_record(self, index, include_detail=True):
+        records = self.record_store.records
+        if not 0 <= index < len(records):
+            return None
+        if not include_detail:
+            return records[index]
+        return merge_sport_record(records[index], self.record_store.get_detail(index))
+
+    def page_sport_records(self, after_index=None, before_index=None, limit=None,
+                           descending=False, device_id=None):
+        """
+        按序号分页：返回序号在 (after_index, before_index) 之间的 (序号, 摘要)
+
+        descending 为真时从区间高端开始取、按序号降序返回；摘要为共享对象，调用方不要修改。
+        二分定位区间，代价只与 limit 相关。
+        """
+        records = self.record_store.records
+        if device_id is None:
+            indexes = range(len(records))
+        else:
+            indexes = self._device_records.get(device_id, [])
+
+        lo = 0 if after_index is None else bisect_right(indexes, after_index)
+        hi = len(indexes) if before_index is None else bisect_left(indexes, before_index)
+        if limit is not None:
+            if descending:
+                lo = max(lo, hi - limit)
+            else:
+                hi = min(hi, lo + limit)
+        if hi <= lo:
+            return []
+
+        result = [(idx, records[idx]) for idx in indexes[lo:hi]]
+        if descending:
+            result.reverse()
+        return result
+
+    # ---------- 设置 ----------
+    def get_settings(self):
+        return dict(self.settings)
+
+    def save_settings(self, settings):
+        with self._lock:
+            self.settings = dict(settings)
+        self._changed("settings")
+
+    def flush(self, datasets):
+        """
+        将指定数据集写入磁盘
+
+        持锁只复制容器（历史条目整体替换、不原地修改），序列化和写文件不持锁。
+        """
+        for dataset in datasets:
+            if dataset == "sport_records":
+                self.record_store.flush()
+                continue
+
+            with self._lock:
+                if dataset == "history":
+                    data = {"devices": {device_id: dict(days) for device_id, days in self.history.items()}}
+                elif dataset == "emergency":
+                    data = [dict(record) if isinstance(record, dict) else record
+                            for record in self.emergency_records]
+                elif dataset == "settings":
+                    data = dict(self.settings)
+                else:
+                    continue
+            atomic_save(self.paths[dataset], data)
+
+    def save_all(self):
+        """写入全部数据集"""
+        self.flush(DATASETS)
+
+    def close(self):
+        self.save_all()
+
+
+# ==================== SQLite 后端 ====================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    device_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    sport_time NUMERIC NOT NULL DEFAULT 0,
+    step INTEGER NOT NULL DEFAULT 0,
+    carbon_reduce REAL NOT NULL DEFAULT 0,
+    activity_hours TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (device_id, date)
+);
+CREATE INDEX IF NOT EXISTS idx_history_date ON history (date);
+
+CREATE TABLE IF NOT EXISTS emergency_records (
+    idx INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    time TEXT,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_emergency_time ON emergency_records (time);
+CREATE INDEX IF NOT EXISTS idx_emergency_device ON emergency_records (device_id, idx);
+
+CREATE TABLE IF NOT EXISTS sport_records (
+    idx INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    time TEXT,
+    data TEXT NOT NULL,
+    record_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sport_records_time ON sport_records (time);
+CREATE INDEX IF NOT EXISTS idx_sport_records_device ON sport_records (device_id, idx);
+
+CREATE TABLE IF NOT EXISTS sport_record_details (
+    idx INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+# 数据库结构版本（PRAGMA user_version）
+# 1: 运动记录拆分为摘要 sport_records 和详情 sport_record_details
+# 2: sport_records 增加 record_id 列及唯一索引（重复上传去重）
+SQLITE_SCHEMA_VERSION = 2
+
+
+class SqliteStorage:
+    """SQLite 后端：每线程一个连接，WAL 模式，查询走索引，不在内存中保留全量数据"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self):
+        """建表并升级旧版数据库（不加载数据）"""
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.executescript(SQLITE_SCHEMA)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._split_legacy_records(conn)
+            if version < 2:
+                self._add_record_id_column(conn)
+            conn.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+
+    @staticmethod
+    def _split_legacy_records(conn):
+        """旧版库中运动记录整条保存，标准化一次并拆出详情"""
+        rows = conn.execute("SELECT idx, data FROM sport_records").fetchall()
+        migrated = 0
+        for row in rows:
+            summary, detail = split_sport_record(normalize_sport_record(json.loads(row["data"])))
+            conn.execute("UPDATE sport_records SET data = ? WHERE idx = ?", (_dumps(summary), row["idx"]))
+            if detail:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sport_record_details (idx, data) VALUES (?, ?)",
+                    (row["idx"], _dumps(detail)),
+                )
+            migrated += 1
+        if migrated:
+            print(f"[数据] 旧版运动记录已拆分为摘要/详情: {migrated}条")
+
+    @staticmethod
+    def _add_record_id_column(conn):
+        """旧版库补 record_id 列（从摘要中回填），并建立唯一索引"""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(sport_records)")}
+        if "record_id" not in columns:
+            conn.execute("ALTER TABLE sport_records ADD COLUMN record_id TEXT")
+
+        seen = set()
+        for row in conn.execute("SELECT idx, data FROM sport_records WHERE record_id IS NULL").fetchall():
+            record_id = _record_id(json.loads(row["data"]))
+            if record_id and record_id not in seen:
+                seen.add(record_id)
+                conn.execute("UPDATE sport_records SET record_id = ? WHERE idx = ?", (record_id, row["idx"]))
+
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_sport_records_record_id ON sport_records (record_id)"
+        )
+
+    def is_empty(self):
+        conn = self._conn()
+        for table in ("history", "emergency_records", "sport_records", "settings"):
+            if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    # ---------- 历史数据 ----------
+    @staticmethod
+    def _history_row_to_entry(row):
+        try:
+            activity_hours = json.loads(row["activity_hours"])
+        except Exception:
+            activity_hours = []
+        return {
+            "sport_time": row["sport_time"],
+            "activity_hours": activity_hours,
+            "step": row["step"],
+            "carbon_reduce": row["carbon_reduce"],
+        }
+
+    def get_history_day(self, date, device_id=DEFAULT_DEVICE_ID):
+        row = self._conn().execute(
+            "SELECT * FROM history WHERE device_id = ? AND date = ?", (device_id, date)
+        ).fetchone()
+        return self._history_row_to_entry(row) if row else None
+
+    def put_history_day(self, date, entry, device_id=DEFAULT_DEVICE_ID):
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO history "
+                "(device_id, date, sport_time, step, carbon_reduce, activity_hours) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    device_id,
+                    date,
+                    entry.get("sport_time", 0) or 0,
+                    entry.get("step", 0) or 0,
+                    entry.get("carbon_reduce", 0) or 0,
+                    _dumps(entry.get("activity_hours") or []),
+                ),
+            )
+
+    def get_history_range(self, first_date, last_date, device_id=DEFAULT_DEVICE_ID):
+        rows = self._conn().execute(
+            "SELECT * FROM history WHERE device_id = ? AND date BETWEEN ? AND ?",
+            (device_id, first_date, last_date),
+        ).fetchall()
+        return {row["date"]: self._history_row_to_entry(row) for row in rows}
+
+    def get_all_history(self, device_id=DEFAULT_DEVICE_ID):
+        rows = self._conn().execute(
+            "SELECT * FROM history WHERE device_id = ? ORDER BY date", (device_id,)
+        ).fetchall()
+        return {row["date"]: self._history_row_to_entry(row) for row in rows}
+
+    def sum_history(self, field, first_date=None, last_date=None, device_id=DEFAULT_DEVICE_ID):
+        if field not in ("sport_time", "step", "carbon_reduce"):
+            raise ValueError(f"不支持的统计字段: {field}")
+        if first_date is None and last_date is None:
+            row = self._conn().execute(
+                f"SELECT COALESCE(SUM({field}), 0) FROM history WHERE device_id = ?", (device_id,)
+            ).fetchone()
+        else:
+            # 日期为 YYYY-MM-DD 字符串，按 (device_id, date) 主键做区间扫描
+            row = self._conn().execute(
+                f"SELECT COALESCE(SUM({field}), 0) FROM history "
+                f"WHERE device_id = ? AND date BETWEEN ? AND ?",
+                (device_id, first_date or "0000-01-01", last_date or "9999-12-31"),
+            ).fetchone()
+        return row[0]
+
+    def list_history_devices(self):
+        rows = self._conn().execute("SELECT DISTINCT device_id FROM history ORDER BY device_id").fetchall()
+        return [row[0] for row in rows]
+
+    # ---------- 紧急记录 ----------
+    def add_emergencies(self, records):
+        conn = self._conn()
+        with self._write_lock, conn:
+            next_idx = conn.execute("SELECT COALESCE(MAX(idx) + 1, 0) FROM emergency_records").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO emergency_records (idx, device_id, time, resolved, data) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (next_idx + offset, _record_device_id(record), record.get("time"),
+                     1 if record.get("resolved") else 0, _dumps(record))
+                    for offset, record in enumerate(records)
+                ],
+            )
+
+    def list_emergencies(self, device_id=None):
+        if device_id is None:
+            rows = self._conn().execute("SELECT data, resolved FROM emergency_records ORDER BY idx").fetchall()
+        else:
+            rows = self._conn().execute(
+                "SELECT data, resolved FROM emergency_records WHERE device_id = ? ORDER BY idx", (device_id,)
+            ).fetchall()
+        result = []
+        for row in rows:
+            record = json.loads(row["data"])
+            record["resolved"] = bool(row["resolved"])
+            result.append(record)
+        return result
+
+    def resolve_emergency(self, index):
+        conn = self._conn()
+        with self._write_lock, conn:
+            cursor = conn.execute("UPDATE emergency_records SET resolved = 1 WHERE idx = ?", (index,))
+            return cursor.rowcount > 0
+
+    # ---------- 运动记录 ----------
+    def add_sport_records(self, records):
+        """
+        追加已标准化的记录，摘要和详情分表保存
+
+        record_id 已存在的记录（设备端重试上传）跳过，返回实际新增条数。
+        写事务立即加锁，多个工作进程同时写入时序号和去重检查不会交错。
+        """
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            next_idx = conn.execute("SELECT COALESCE(MAX(idx) + 1, 0) FROM sport_records").fetchone()[0]
+            summary_rows = []
+            detail_rows = []
+            seen = set()
+            for record in records:
+                record_id = _record_id(record)
+                if record_id:
+                    if record_id in seen or conn.execute(
+                        "SELECT 1 FROM sport_records WHERE record_id = ?", (record_id,)
+                    ).fetchone():
+                        continue
+                    seen.add(record_id)
+
+                idx = next_idx + len(summary_rows)
+                summary, detail = split_sport_record(record)
+                summary_rows.append((
+                    idx,
+                    _record_device_id(summary),
+                    summary.get("time") if isinstance(summary, dict) else None,
+                    _dumps(summary),
+                    record_id,
+                ))
+                if detail:
+                    detail_rows.append((idx, _dumps(detail)))
+            conn.executemany(
+                "INSERT INTO sport_records (idx, device_id, time, data, record_id) VALUES (?, ?, ?, ?, ?)",
+                summary_rows,
+            )
+            conn.executemany(
+                "INSERT INTO sport_record_details (idx, data) VALUES (?, ?)",
+                detail_rows,
+            )
+        return len(summary_rows)
+
+    def count_sport_records(self, device_id=None):
+        if device_id is None:
+            return self._conn().execute("SELECT COALESCE(MAX(idx) + 1, 0) FROM sport_records").fetchone()[0]
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM sport_records WHERE device_id = ?", (device_id,)
+        ).fetchone()[0]
+
+    def get_sport_record(self, index, include_detail=True):
+        conn = self._conn()
+        row = conn.execute("SELECT data FROM sport_records WHERE idx = ?", (index,)).fetchone()
+        if not row:
+            return None
+        summary = json.loads(row["data"])
+        if not include_detail:
+            return summary
+        detail_row = conn.execute("SELECT data FROM sport_record_details WHERE idx = ?", (index,)).fetchone()
+        return merge_sport_record(summary, json.loads(detail_row["data"]) if detail_row else None)
+
+    def page_sport_records(self, after_index=None, before_index=None, limit=None,
+                           descending=False, device_id=None):
+        clauses = []
+        params = []
+        if device_id is not None:
+            clauses.append("device_id = ?")
+            params.append(device_id)
+        if after_index is not None:
+            clauses.append("idx > ?")
+            params.append(after_index)
+        if before_index is not None:
+            clauses.append("idx < ?")
+            params.append(before_index)
+
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        order = "DESC" if descending else "ASC"
+        params.append(-1 if limit is None else limit)
+        rows = self._conn().execute(
+            f"SELECT idx, data FROM sport_records {where}ORDER BY idx {order} LIMIT ?",
+            params,
+        ).fetchall()
+        return [(row["idx"], json.loads(row["data"])) for row in rows]
+
+    # ---------- 设置 ----------
+    def get_settings(self):
+        rows = self._conn().execute("SELECT key, value FROM settings").fetchall()
+        return {row["key"]: json.loads(row["value"]) for row in rows}
+
+    def save_settings(self, settings):
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                [(key, _dumps(value)) for key, value in settings.items()],
+            )
+
+    def attach_writer(self, mark_dirty):
+        """SQLite 每次写入即提交（WAL），不经过后台写线程"""
+        pass
+
+    def flush(self, datasets):
+        pass
+
+    def save_all(self):
+        pass
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ==================== 工厂与迁移 ====================
+def create_storage(config):
+    """根据配置创建存储后端"""
+    backend = getattr(config, "STORAGE_BACKEND", "json")
+    if backend == "sqlite":
+        return SqliteStorage(config.SQLITE_PATH)
+    if backend != "json":
+        print(f"[数据] 未知存储后端 {backend}，使用json")
+    return JsonStorage(config.DATA_DIR, compact_threshold=config.SPORT_RECORDS_COMPACT_THRESHOLD)
+
+
+def migrate_json_to_sqlite(data_dir, db_path):
+    """
+    一次性将 data/*.json 迁移到 SQLite
+
+    返回: 各类数据迁移条数
+    目标库非空时拒绝迁移，避免重复导入。
+    """
+    source = JsonStorage(data_dir)
+    source.load()
+
+    target = SqliteStorage(db_path)
+    target.load()
+    if not target.is_empty():
+        raise RuntimeError(f"目标数据库非空，已跳过迁移: {db_path}")
+
+    history_days = 0
+    for device_id in source.list_history_devices():
+        for date, entry in source.get_all_history(device_id).items():
+            if isinstance(entry, dict):
+                target.put_history_day(date, entry, device_id)
+                history_days += 1
+
+    emergencies = [record for record in source.emergency_records if isinstance(record, dict)]
+    if emergencies:
+        target.add_emergencies(emergencies)
+
+    records = [
+        source.get_sport_record(idx)
+        for idx in range(source.count_sport_records())
+    ]
+    migrated_records = target.add_sport_records(records) if records else 0
+
+    if source.settings:
+        target.save_settings(source.settings)
+
+    target.close()
+    return {
+        "history": history_days,
+        "emergency": len(emergencies),
+        "sport_records": migrated_records,
+    }
@@ -0,0 +1,18 @@
+# -*- coding: UTF-8 -*-
+"""
+服务端测试：按 server/ 目录的平铺导入方式加载模块（cd server && python -m pytest tests）
+
+数据写入临时目录，使用 SQLite 存储后端。
+"""
+
+import os
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ["SMART_BELT_DATA_DIR"] = tempfile.mkdtemp(prefix="smart-belt-test-")
+os.environ["SMART_BELT_STORAGE"] = "sqlite"
+
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
@@ -0,0 +1,48 @@
+# -*- coding: UTF-8 -*-
+"""/api/history 与 /api/status 的按天查询"""
+
+import unittest
+from datetime import datetime, timedelta
+
+import server
+from storage import SqliteStorage
+
+
+class HistoryDaysTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        server.init_server()
+        cls.client = server.app.test_client()
+        today = datetime.now()
+        for i in range(3):
+            date = (today - timedelta(days=i)).strftime("%Y-%m-%d")
+            server.storage.put_history_day(date, {"step": 100, "carbon_reduce": 1.5}, "history-dev")
+        server.aggregates.load(server.storage)
+        cls.today = today.strftime("%Y-%m-%d")
+
+    def test_storage_backend_is_sqlite(self):
+        self.assertIsInstance(server.storage, SqliteStorage)
+
+    def test_history_fills_missing_days(self):
+        response = self.client.get("/api/history?days=5&device_id=history-dev")
+        self.assertEqual(response.status_code, 200)
+        history = response.get_json()
+        self.assertEqual(len(history), 5)
+        self.assertEqual(history[self.today]["step"], 100)
+        self.assertEqual(sum(entry["step"] for entry in history.values()), 300)
+
+    def test_history_large_days_is_clamped(self):
+        response = self.client.get("/api/history?days=300000&device_id=history-dev")
+        self.assertEqual(response.status_code, 200)
+        history = response.get_json()
+        self.assertEqual(len(history), server.MAX_STATUS_DAYS)
+        self.assertEqual(history[self.today]["step"], 100)
+
+    def test_status_large_days_is_clamped(self):
+        response = self.client.get("/api/status?days=700000&device_id=history-dev")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["carbon_reduce_all"], 4.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
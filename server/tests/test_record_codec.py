@@ -0,0 +1,77 @@
+# -*- coding: UTF-8 -*-
+"""列式二进制请求体解码的边界校验"""
+
+import json
+import struct
+import sys
+import unittest
+import zlib
+from array import array
+
+import server
+from record_codec import CONTENT_TYPE, MAGIC, MAX_TABLE_ROWS, CodecError, decode_payload
+
+
+def _payload(meta, blobs=b""):
+    body = json.dumps(meta).encode("utf-8")
+    return MAGIC + zlib.compress(struct.pack("<I", len(body)) + body + blobs)
+
+
+def _int64(values):
+    packed = array("q", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _series(count, scale_digits=2, deltas=(150, 5, -3)):
+    """一个 x 列（按 10^scale_digits 放大的差分）"""
+    blobs = _int64(deltas)
+    return {"records": [{"series": {"$table": {
+        "n": count,
+        "c": [{"k": "v", "t": "x", "s": scale_digits, "b": [0, len(blobs)]}],
+    }}}]}, blobs
+
+
+class DecodeBoundsTest(unittest.TestCase):
+    def test_valid_table(self):
+        meta, blobs = _series(3)
+        rows = decode_payload(_payload(meta, blobs))["records"][0]["series"]
+        self.assertEqual(rows, [{"v": 1.5}, {"v": 1.55}, {"v": 1.52}])
+
+    def test_oversized_row_count(self):
+        meta, blobs = _series(MAX_TABLE_ROWS + 1)
+        with self.assertRaises(CodecError):
+            decode_payload(_payload(meta, blobs))
+
+        meta["records"][0]["series"]["$table"]["c"] = []
+        meta["records"][0]["series"]["$table"]["n"] = 10 ** 9
+        with self.assertRaises(CodecError):
+            decode_payload(_payload(meta))
+
+    def test_row_count_must_match_columns(self):
+        meta, blobs = _series(4)
+        with self.assertRaises(CodecError):
+            decode_payload(_payload(meta, blobs))
+
+    def test_oversized_scale(self):
+        for digits in (10 ** 9, -1, 1.5, True, "2"):
+            meta, blobs = _series(3, scale_digits=digits)
+            with self.assertRaises(CodecError):
+                decode_payload(_payload(meta, blobs))
+
+    def test_endpoint_rejects_bad_metadata(self):
+        server.init_server()
+        client = server.app.test_client()
+        meta, blobs = _series(MAX_TABLE_ROWS + 1)
+        meta["device_id"] = "codec-dev"
+        response = client.post(
+            "/api/sync_records",
+            data=_payload(meta, blobs),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
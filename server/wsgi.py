@@ -0,0 +1,24 @@
+# -*- coding: UTF-8 -*-
+"""
+生产部署入口（WSGI）
+
+开发时直接运行 server.py（单进程、Flask 自带服务器）；生产环境用多进程 WSGI 服务器，
+每个工作进程导入本模块各自初始化。工作进程之间通过 SQLite 共享数据和设备状态，
+因此默认启用 SQLite 存储后端和共享状态；共享状态搭配其他存储后端时拒绝启动。
+
+用法（Linux / macOS）:
+    pip install -r requirements.txt
+    gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:5000 --chdir server wsgi:app
+
+SSE (/api/stream) 和命令长轮询会占用线程，工作线程数要大于同时在线的页面和设备数。
+"""
+
+import os
+
+os.environ.setdefault("SMART_BELT_STORAGE", "sqlite")
+os.environ.setdefault("SMART_BELT_STATE", "sqlite")
+
+import server  # noqa: E402
+
+server.init_server()
+app = server.app